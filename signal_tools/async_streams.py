@@ -0,0 +1,348 @@
+"""
+Asyncio counterparts of the stream parser and writer
+
+`AsyncSignalStreams` reads the stream format from an `asyncio.StreamReader`
+and `AsyncStreamWriter` writes it to an `asyncio.StreamWriter`, so that many
+sockets or subprocess pipes can be read and written by a single thread.
+"""
+import asyncio
+from contextlib import nullcontext
+import io
+from typing import Any, AsyncIterable, AsyncIterator, Dict, List, Optional, \
+    Tuple
+import numpy as np
+from .binary_format import FRAME_HEADER, decode_frame, encode_frame, \
+    rows_to_block
+from .instrumentation import PipelineStats
+from .line_decoder import decoder_for
+from .parsers import Block, SignalStreams, _comment_pattern
+from .stream_utils import format_block, metadata_header
+
+_read_size = 1 << 16
+
+
+class AsyncSignalStreams:
+    """
+    Parser of the stream format for an `asyncio.StreamReader`
+
+    Create it with `await AsyncSignalStreams.open(reader)`, which parses the
+    metadata section. Afterwards the rows can be iterated with `async for`
+    and whole blocks with `iter_blocks`, in the same layout as
+    `SignalStreams`. Both the text and the binary encoding are supported.
+
+    For the text encoding a block holds the complete lines that arrived so
+    far, up to the requested number of rows, so live sources are not delayed
+    until a full block was received.
+    """
+
+    def __init__(self, reader: asyncio.StreamReader, block_rows: int = 256,
+                 writer: Optional[asyncio.StreamWriter] = None,
+                 stats: Optional[PipelineStats] = None):
+        """
+        :param reader: The stream to read the signal data from.
+        :type reader: asyncio.StreamReader
+        :param block_rows: Maximum number of rows that are parsed at once when
+                           iterating row by row.
+        :type block_rows: int
+        :param writer: The writing end of a connection that `reader` belongs
+                       to, which is closed by `close`.
+        :type writer: Optional[asyncio.StreamWriter]
+        :param stats: Counts the parsed rows, the bytes read and the time
+                      spent waiting for data and parsing, if given.
+        :type stats: Optional[PipelineStats]
+        """
+        if block_rows < 1:
+            raise ValueError("block_rows must be at least 1")
+        self.reader = reader
+        self.writer = writer
+        self.stats = stats
+        self.block_rows = block_rows
+        self.metadata: Optional[Dict[str, Any]] = None
+        self.encoding: Optional[str] = None
+        self.num_streams = 0
+        # the received text, the lines before `_buffer_pos` were returned
+        self._buffer = bytearray()
+        self._buffer_pos = 0
+        self._eof = False
+        self._block: Block = []
+        self._block_len = 0
+        self._block_pos = 0
+        self._frame: Block = []
+        self._frame_pos = 0
+
+    @classmethod
+    async def open(cls, reader: asyncio.StreamReader,
+                   block_rows: int = 256,
+                   writer: Optional[asyncio.StreamWriter] = None,
+                   stats: Optional[PipelineStats] = None
+                   ) -> "AsyncSignalStreams":
+        """
+        Create the parser and read the metadata section of the stream
+
+        :raises ValueError: If the metadata section is invalid.
+        """
+        streams = cls(reader, block_rows, writer, stats)
+        await streams.read_header()
+        return streams
+
+    async def close(self) -> None:
+        """
+        Close the connection, if the writing end of it was given
+        """
+        if self.writer is not None:
+            self.writer.close()
+            await self.writer.wait_closed()
+
+    def _stage(self, name: str) -> Any:
+        if self.stats is None:
+            return nullcontext()
+        return self.stats.stage(name)
+
+    def _received(self, data: bytes) -> bytes:
+        if self.stats is not None:
+            self.stats.count(bytes_in=len(data))
+        return data
+
+    async def _readline_skip_comments(self) -> str:
+        line = (await self.reader.readline()).decode("utf-8")
+        while line and _comment_pattern.match(line):
+            line = (await self.reader.readline()).decode("utf-8")
+        return line
+
+    async def read_header(self) -> None:
+        """
+        Read and parse the metadata section and the line that starts the
+        data section
+        """
+        lines = [await self._readline_skip_comments()]
+        if lines[0].startswith("Metadata:"):
+            while lines[-1] and not lines[-1].startswith("Data:"):
+                lines.append(await self._readline_skip_comments())
+        self.metadata, self.encoding = SignalStreams._parse_header(
+            io.StringIO("".join(lines)))
+        for stream in self.metadata["streams"]:
+            if isinstance(stream["shape"], int):
+                stream["shape"] = [stream["shape"]]
+        self.num_streams = len(self.metadata["streams"])
+        self.decoder = decoder_for(self.metadata["streams"])
+
+    def __aiter__(self) -> "AsyncSignalStreams":
+        return self
+
+    async def __anext__(self) -> List[np.ndarray]:
+        """
+        The next row, with one tensor per stream like `SignalStreams`
+
+        :raises StopAsyncIteration: At the end of the stream.
+        """
+        if self._block_pos >= self._block_len:
+            self._block = await self._next_block(self.block_rows)
+            self._block_len = SignalStreams._block_rows(self._block)
+            self._block_pos = 0
+            if self._block_len == 0:
+                raise StopAsyncIteration
+        row = self._block_pos
+        self._block_pos += 1
+        tensors = []
+        for stream_metadata, column in zip(self.metadata["streams"],
+                                           self._block):
+            tensor = column[row]
+            if tensor is None or stream_metadata["shape"][0] == -1 \
+                    or SignalStreams._is_matrix(stream_metadata):
+                tensors.append(tensor)
+            else:
+                tensors.append(tensor.ravel(order="F"))
+        return tensors
+
+    async def iter_blocks(self, block_rows: int = 1024
+                          ) -> AsyncIterator[Block]:
+        """
+        Iterate over the data section in blocks of up to `block_rows` rows
+
+        :raises ValueError: If a data line doesn't match the expected format.
+        """
+        if block_rows < 1:
+            raise ValueError("block_rows must be at least 1")
+        if self._block_pos < self._block_len:
+            remainder = [column[self._block_pos:] for column in self._block]
+            self._block_pos = self._block_len
+            yield remainder
+        while True:
+            block = await self._next_block(block_rows)
+            if SignalStreams._block_rows(block) == 0:
+                return
+            yield block
+
+    async def _next_block(self, block_rows: int) -> Block:
+        if self.metadata is None:
+            raise ValueError("The metadata section was not read yet")
+        if self.encoding == "bin":
+            block = await self._next_frame_block(block_rows)
+        else:
+            block = await self._next_line_block(block_rows)
+        if self.stats is not None:
+            self.stats.count(rows_in=SignalStreams._block_rows(block))
+        return block
+
+    async def _next_line_block(self, block_rows: int) -> Block:
+        while True:
+            lines = await self._read_lines(block_rows)
+            with self._stage("parse"):
+                if lines is None:
+                    return self.decoder.decode([])
+                lines = [line for line in lines if not (
+                    "#" in line and _comment_pattern.match(line))]
+                # a block of comments only does not end the stream
+                if lines:
+                    return self.decoder.decode(lines)
+
+    async def _read_lines(self, max_lines: int) -> Optional[List[str]]:
+        """
+        Up to `max_lines` complete lines, waiting only if no complete line
+        is buffered. Returns None at the end of the stream.
+        """
+        start = self._buffer_pos
+        newline = self._buffer.find(b"\n", start)
+        while newline == -1 and not self._eof:
+            # only a partial line is left, drop the returned lines before
+            # the buffer grows
+            del self._buffer[:start]
+            start = self._buffer_pos = 0
+            searched = len(self._buffer)
+            with self._stage("read"):
+                chunk = self._received(await self.reader.read(_read_size))
+            if not chunk:
+                self._eof = True
+            self._buffer += chunk
+            newline = self._buffer.find(b"\n", searched)
+        if start == len(self._buffer):
+            return None
+        if newline == -1:
+            # the last line of the stream has no newline
+            end = len(self._buffer) - 1
+        else:
+            end = newline
+            for _ in range(max_lines - 1):
+                newline = self._buffer.find(b"\n", end + 1)
+                if newline == -1:
+                    break
+                end = newline
+        text = self._buffer[start:end + 1].decode("utf-8")
+        self._buffer_pos = end + 1
+        lines = text.split("\n")
+        last = lines.pop()
+        lines = [line + "\n" for line in lines]
+        if last:
+            lines.append(last)
+        return lines
+
+    async def _next_frame_block(self, block_rows: int) -> Block:
+        while self._frame_pos >= SignalStreams._block_rows(self._frame):
+            try:
+                with self._stage("read"):
+                    header = self._received(
+                        await self.reader.readexactly(FRAME_HEADER.size))
+            except asyncio.IncompleteReadError as e:
+                if e.partial:
+                    raise ValueError(
+                        "Binary stream ends inside of a frame header")
+                return [[] for _ in self.metadata["streams"]]
+            size, rows = FRAME_HEADER.unpack(header)
+            try:
+                with self._stage("read"):
+                    payload = self._received(
+                        await self.reader.readexactly(size))
+            except asyncio.IncompleteReadError:
+                raise ValueError("Binary stream ends inside of a frame")
+            with self._stage("parse"):
+                self._frame = decode_frame(self.metadata["streams"], rows,
+                                           payload)
+            self._frame_pos = 0
+        start = self._frame_pos
+        rows = SignalStreams._block_rows(self._frame)
+        self._frame_pos = min(start + block_rows, rows)
+        if start == 0 and self._frame_pos == rows:
+            return self._frame
+        return [column[start:self._frame_pos] for column in self._frame]
+
+
+class AsyncStreamWriter:
+    """
+    Writes the stream format to an `asyncio.StreamWriter`
+
+    The metadata section is written by `write_header`, then every call to
+    `write_block` writes the rows of a block and waits until the transport
+    accepts more data.
+    """
+
+    def __init__(self, writer: asyncio.StreamWriter,
+                 metadata: List[Dict[str, Any]], encoding: str = "utf-8"):
+        """
+        :param writer: The stream to write to.
+        :type writer: asyncio.StreamWriter
+        :param metadata: The metadata of the streams.
+        :type metadata: List[Dict[str, Any]]
+        :param encoding: Either 'utf-8' for the text format or 'bin' for
+                         binary frames.
+        :type encoding: str
+        """
+        if encoding not in ("utf-8", "bin"):
+            raise ValueError(f"Unknown encoding: {encoding}")
+        self.writer = writer
+        self.metadata = metadata
+        self.encoding = encoding
+        self._types = [m["type"] for m in metadata]
+
+    async def write_header(self) -> None:
+        self.writer.write(metadata_header(self.metadata, self.encoding)
+                          .encode("utf-8"))
+        await self.writer.drain()
+
+    async def write_block(self, block: Block) -> None:
+        if self.encoding == "bin":
+            self.writer.write(encode_frame(self.metadata, block))
+        else:
+            self.writer.write(format_block(block, self._types)
+                              .encode("utf-8"))
+        await self.writer.drain()
+
+    async def write_rows(self, rows: List[List[Any]]) -> None:
+        """
+        Write rows that hold one tensor per stream
+        """
+        if rows:
+            await self.write_block(rows_to_block(self.metadata, rows))
+
+    async def close(self) -> None:
+        self.writer.close()
+        await self.writer.wait_closed()
+
+
+async def collect_stream_into_writer(writer: asyncio.StreamWriter,
+                                     streams: List[Tuple[Dict[str, Any],
+                                                         AsyncIterable]],
+                                     encoding: str = "utf-8",
+                                     rows_per_block: int = 1024) -> None:
+    """
+    Write streams given as asynchronous row iterators to a writer
+
+    This is the asynchronous counterpart of `collect_stream_into_string` and
+    produces the same output. The rows are written in groups of
+    `rows_per_block` rows, the last group as soon as one of the streams
+    ends.
+    """
+    metadata = [s[0] for s in streams]
+    iterators = [s[1].__aiter__() for s in streams]
+    stream_writer = AsyncStreamWriter(writer, metadata, encoding)
+    await stream_writer.write_header()
+    rows: List[List[Any]] = []
+    while True:
+        try:
+            row = [await it.__anext__() for it in iterators]
+        except StopAsyncIteration:
+            break
+        rows.append(row)
+        if len(rows) >= rows_per_block:
+            await stream_writer.write_rows(rows)
+            rows = []
+    await stream_writer.write_rows(rows)
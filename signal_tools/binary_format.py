@@ -0,0 +1,260 @@
+"""
+Binary framing of the stream format
+
+The metadata section is the same YAML header as in the text format, but the
+data section is started by a 'Data: binary' line and consists of frames.
+Every frame starts with two little-endian uint32 values, the number of
+payload bytes and the number of rows in the frame, followed by the payload.
+The payload holds the rows of every stream one stream after the other:
+
+* fixed-shape streams store rows*prod(shape) little-endian values, the
+  elements of every row in column-major order, just like the text format
+* variable-length streams store one uint32 length per row followed by the
+  values of all rows
+* streams with a rate start with one uint8 flag per row, 1 if the row holds
+  an element of the stream, followed by the rows that hold one as above
+"""
+import struct
+from typing import Any, BinaryIO, Dict, Iterable, Iterator, List, Optional, \
+    Tuple, Union
+import numpy as np
+from .rates import SparseColumn
+from .stream_utils import _row_column, align_blocks, block_to_elements, \
+    elements_to_block, metadata_header
+
+Block = List[Union[np.ndarray, List[np.ndarray]]]
+
+BINARY_DATA_MARKER = "Data: binary"
+FRAME_HEADER = struct.Struct("<II")
+_length_dtype = np.dtype("<u4")
+_flag_dtype = np.dtype("u1")
+
+
+def wire_dtype(stream: Dict[str, Any]) -> np.dtype:
+    """
+    The little-endian dtype that the values of a stream are sent as
+    """
+    return np.dtype(stream["type"]).newbyteorder("<")
+
+
+def _is_variable(stream: Dict[str, Any]) -> bool:
+    return stream["shape"][0] == -1
+
+
+def encode_frame(streams: List[Dict[str, Any]], block: Block) -> bytes:
+    """
+    Encode a block into a single binary frame
+
+    :param streams: The metadata of the streams in the block.
+    :type streams: List[Dict[str, Any]]
+    :param block: One entry per stream holding the rows of the frame.
+    :type block: Block
+    :return: The frame including the frame header.
+    :rtype: bytes
+    """
+    num_rows = len(block[0]) if block else 0
+    parts = []
+    for stream, column in zip(streams, block):
+        dtype = wire_dtype(stream)
+        if stream.get("rate") is not None:
+            if isinstance(column, SparseColumn):
+                parts.append(column.present.astype(_flag_dtype).tobytes())
+                column = column.values
+            else:
+                parts.append(np.ones(len(column), _flag_dtype).tobytes())
+        if _is_variable(stream):
+            lengths = np.array([len(row) for row in column],
+                               dtype=_length_dtype)
+            parts.append(lengths.tobytes())
+            if len(column) > 0:
+                parts.append(np.concatenate(
+                    [np.asarray(row).ravel() for row in column]
+                ).astype(dtype).tobytes())
+        else:
+            parts.append(block_to_elements(
+                np.asarray(column)).astype(dtype).tobytes())
+    payload = b"".join(parts)
+    return FRAME_HEADER.pack(len(payload), num_rows) + payload
+
+
+def decode_frame(streams: List[Dict[str, Any]], num_rows: int,
+                 payload: Union[bytes, bytearray, memoryview]) -> Block:
+    """
+    Decode the payload of a frame into a block
+
+    The arrays of the block share memory with the payload if it is already
+    in the native byte order.
+
+    :param streams: The metadata of the streams in the frame.
+    :type streams: List[Dict[str, Any]]
+    :param num_rows: Number of rows in the frame.
+    :type num_rows: int
+    :param payload: The payload of the frame, without the frame header.
+    :type payload: bytes
+    :return: The decoded block.
+    :rtype: Block
+    :raises ValueError: If the payload size does not match the metadata.
+    """
+    block: Block = []
+    offset = 0
+    try:
+        for stream in streams:
+            dtype = wire_dtype(stream)
+            rows = num_rows
+            present = None
+            if stream.get("rate") is not None:
+                present = np.frombuffer(payload, dtype=_flag_dtype,
+                                        count=num_rows,
+                                        offset=offset).astype(bool)
+                offset += num_rows
+                rows = int(np.count_nonzero(present))
+            if _is_variable(stream):
+                lengths = np.frombuffer(payload, dtype=_length_dtype,
+                                        count=rows, offset=offset)
+                offset += lengths.nbytes
+                total = int(lengths.sum())
+                values = np.frombuffer(payload, dtype=dtype, count=total,
+                                       offset=offset).astype(
+                                           stream["type"], copy=False)
+                offset += total * dtype.itemsize
+                column = np.split(values, np.cumsum(lengths[:-1])) \
+                    if rows else []
+            else:
+                size = int(np.prod(stream["shape"]))
+                values = np.frombuffer(payload, dtype=dtype,
+                                       count=rows * size,
+                                       offset=offset).astype(
+                                           stream["type"], copy=False)
+                offset += rows * size * dtype.itemsize
+                column = elements_to_block(values.reshape(rows, size),
+                                           stream["shape"])
+            block.append(column if present is None
+                         else SparseColumn(column, present))
+    except ValueError as e:
+        raise ValueError(f"Binary frame doesn't match the metadata: {e}")
+    if offset != len(payload):
+        raise ValueError("Binary frame doesn't match the metadata: "
+                         f"{len(payload) - offset} trailing bytes")
+    return block
+
+
+def _read_exactly(binary_stream: BinaryIO, size: int) -> bytearray:
+    """
+    Read exactly `size` bytes, waiting for pipes that deliver less per read
+    """
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    received = 0
+    while received < size:
+        n = binary_stream.readinto(view[received:])
+        if not n:
+            break
+        received += n
+    return buffer[:received] if received < size else buffer
+
+
+def read_frame_bytes(binary_stream: BinaryIO) -> Optional[Tuple[int,
+                                                               bytearray]]:
+    """
+    Read the next frame from a binary stream without decoding it
+
+    :return: The number of rows and the payload of the frame or None at the
+             end of the stream
+    :rtype: Optional[Tuple[int, bytearray]]
+    :raises ValueError: If the stream ends in the middle of a frame.
+    """
+    header = _read_exactly(binary_stream, FRAME_HEADER.size)
+    if len(header) == 0:
+        return None
+    if len(header) < FRAME_HEADER.size:
+        raise ValueError("Binary stream ends inside of a frame header")
+    size, num_rows = FRAME_HEADER.unpack(header)
+    payload = _read_exactly(binary_stream, size)
+    if len(payload) < size:
+        raise ValueError("Binary stream ends inside of a frame")
+    return num_rows, payload
+
+
+def read_frame(binary_stream: BinaryIO,
+               streams: List[Dict[str, Any]]) -> Optional[Block]:
+    """
+    Read and decode the next frame from a binary stream
+
+    :return: The block held by the frame or None at the end of the stream
+    :rtype: Optional[Block]
+    """
+    frame = read_frame_bytes(binary_stream)
+    if frame is None:
+        return None
+    return decode_frame(streams, *frame)
+
+
+def collect_stream_into_frames(streams: List[Tuple[Dict[str, Any],
+                                                   Iterable]],
+                               rows_per_frame: int = 1024
+                               ) -> Iterator[bytes]:
+    """
+    Generate the binary representation of the streams
+
+    This is the binary counterpart of `collect_stream_into_string`, it takes
+    one row iterator per stream and groups `rows_per_frame` rows into a
+    frame.
+    """
+    metadata = [s[0] for s in streams]
+    data = [s[1] for s in streams]
+    yield metadata_header(metadata, encoding="bin").encode("utf-8")
+
+    rows = zip(*data)
+    while True:
+        frame_rows = []
+        for row in rows:
+            frame_rows.append(row)
+            if len(frame_rows) == rows_per_frame:
+                break
+        if not frame_rows:
+            return
+        yield encode_frame(metadata, rows_to_block(metadata, frame_rows))
+
+
+def collect_blocks_into_frames(streams: List[Tuple[Dict[str, Any],
+                                                   Iterable]]
+                               ) -> Iterator[bytes]:
+    """
+    Generate the binary representation of streams that are given as blocks
+
+    Every combined block of the streams is encoded into one frame.
+    """
+    metadata = [s[0] for s in streams]
+    yield metadata_header(metadata, encoding="bin").encode("utf-8")
+    for block in align_blocks([s[1] for s in streams]):
+        yield encode_frame(metadata, block)
+
+
+def rows_to_block(streams: List[Dict[str, Any]],
+                  rows: List[List[np.ndarray]]) -> Block:
+    """
+    Stack rows, each holding one tensor per stream, into a block
+    """
+    block: Block = []
+    for i, stream in enumerate(streams):
+        if stream.get("rate") is not None:
+            column = _row_column([row[i] for row in rows], stream["type"])
+            if not isinstance(column, SparseColumn):
+                column = SparseColumn.from_elements(column)
+            if not _is_variable(stream):
+                column = column.with_values(rows_to_block(
+                    [dict(stream, rate=None)],
+                    [[element] for element in column.values])[0])
+            block.append(column)
+            continue
+        column = [np.asarray(row[i], dtype=stream["type"]) for row in rows]
+        if _is_variable(stream):
+            block.append(column)
+        elif column:
+            elements = np.stack([tensor.ravel(order="F")
+                                 for tensor in column])
+            block.append(elements_to_block(elements, stream["shape"]))
+        else:
+            block.append(np.empty((0,) + tuple(stream["shape"]),
+                                  dtype=stream["type"]))
+    return block
@@ -1,15 +1,86 @@
 from pathlib import Path
+import asyncio
+import io
 import sys
 import csv
+import time
 from click.types import IntRange
-from typing import Tuple
+from typing import Any, Callable, Iterable, Iterator, Optional, Tuple, \
+    Union
 import yaml
 import click
 import numpy as np
+from contextlib import nullcontext
 from copy import deepcopy
-from functools import partial
-from .stream_utils import arrays_to_data_line, collect_stream_into_string
+from .stream_utils import VALUE_TYPES, collect_blocks_into_string, \
+    format_block, is_integer_type, metadata_header, stream_type, \
+    validate_metadata
+from .binary_format import collect_blocks_into_frames, encode_frame
 from .parsers import SignalStreams
+from .instrumentation import PipelineStats, TimedReader, TimedWriter
+from .filter import BlockFilter, GHFilter, Resampler, TrapezoidFilter
+from .graph import Expression
+from .generators import RANDOM_DISTRIBUTIONS, poisson_pulse_gen, \
+    random_chunks, sine_chunks
+from .io_utils import read_csv_blocks
+from .operators import Digitize, FloatInput, PresentElements, to_integers
+from .parallel import ParallelBlockTransform
+from .rates import METHODS, RateAligner
+from .network import POLICIES, parse_address, serve_blocks, subscribe
+from .plotting import MODES as PLOT_MODES, make_plot
+from .stats import DEFAULT_QUANTILES, block_statistics
+
+
+# the number of samples of the delays of the trapezoid filter
+_sample_count = click.IntRange(1, max_open=True)
+
+# the types that values can be digitized into
+_integer_types = [name for name, type_ in VALUE_TYPES.items()
+                  if is_integer_type(type_)]
+
+
+def _stats_options(command: Callable) -> Callable:
+    """
+    Add the options that enable the instrumentation to a command group
+    """
+    command = click.option(
+        "--stats-interval", type=click.FloatRange(0, min_open=True),
+        default=None,
+        help="Also report the statistics every STATS_INTERVAL seconds, "
+             "implies --stats")(command)
+    return click.option(
+        "--stats", "show_stats", is_flag=True, default=False,
+        help="Report the rows and bytes read and written and the time spent "
+             "in every stage as a line of JSON on stderr when the command "
+             "ends")(command)
+
+
+def _make_stats(ctx: click.Context, show_stats: bool,
+                stats_interval: Optional[float]) -> Optional[PipelineStats]:
+    """
+    Create the counters of the command if they were requested, the final
+    report is written when the command ends
+    """
+    if not show_stats and stats_interval is None:
+        return None
+    stats = PipelineStats(ctx.info_name, stats_interval)
+
+    def report():
+        if ctx.invoked_subcommand not in (None, "*"):
+            stats.command = f"{ctx.info_name} {ctx.invoked_subcommand}"
+        stats.report()
+
+    ctx.call_on_close(report)
+    return stats
+
+
+def _stage(stats: Optional[PipelineStats], name: str):
+    """
+    The timer of a stage, or a no-op without counters
+    """
+    if stats is None:
+        return nullcontext()
+    return stats.stage(name)
 
 
 @click.group("signal-io")
@@ -18,42 +89,211 @@ from .parsers import SignalStreams
                                                case_sensitive=False))
 @click.argument("encoding", type=click.Choice(["bin", "utf-8"],
                                               case_sensitive=False))
+@_stats_options
 @click.pass_context
-def file_io(ctx, file_path: click.Path, direction: str, encoding: str) -> None:
+def file_io(ctx, file_path: click.Path, direction: str, encoding: str,
+            show_stats: bool, stats_interval: Optional[float]) -> None:
     """
     Read from and write to files
 
-    FILE-PATH determins the file that is to be read from.
+    FILE-PATH determins the file that is to be read from, '-' stands for
+    stdin or stdout.
     DIRECTION determins if data should be read from or written to the file and
-    ENCODING specifies if the file should be read as binary or utf-8 encoded
-    file
+    ENCODING specifies if the signal stream that is written should use the
+    binary or the utf-8 encoded text format. Signal streams that are read
+    are detected to be binary or text automatically.
     """
     ctx.obj = {}
     io_file = Path(str(file_path))
-    if (direction == 'in' or direction == "append") and not io_file.exists():
+    standard_stream = str(file_path) == "-"
+    if (direction == 'in' or direction == "append") \
+            and not standard_stream and not io_file.exists():
         click.echo("File does not exist")
         sys.exit(1)
     ctx.obj = {}
-    file_mode = ""
-    match encoding:
-        case "bin":
-            file_mode += "b"
-        case _:
-            pass
+    encoding = encoding.lower()
     match direction:
         case "in":
-            file_mode += "r"
-            in_file = open(io_file, file_mode)
-            out_file = click.get_text_stream('stdout')
+            in_file = click.get_binary_stream('stdin') if standard_stream \
+                else open(io_file, "rb")
+            out_file = _get_stdout(encoding)
         case "out":
-            file_mode = "w+"
-            out_file = open(io_file, file_mode)
-            in_file = click.get_text_stream('stdin')
+            file_mode = "wb" if encoding == "bin" else "w+"
+            out_file = _get_stdout(encoding) if standard_stream \
+                else open(io_file, file_mode)
+            in_file = click.get_binary_stream('stdin')
         case _:
             click.echo("Invalid application state")
             sys.exit(2)
+    stats = _make_stats(ctx, show_stats, stats_interval)
+    if stats is not None:
+        in_file = TimedReader(in_file, stats)
+        out_file = TimedWriter(out_file, stats)
     ctx.obj = {'in': in_file,
-               'out': out_file}
+               'out': out_file,
+               'encoding': encoding,
+               'stats': stats}
+
+
+def _get_stdout(encoding: str):
+    """
+    Get stdout as a text or binary stream depending on the encoding
+    """
+    if encoding == "bin":
+        return click.get_binary_stream('stdout')
+    return click.get_text_stream('stdout')
+
+
+def _open_output(output: click.Path, encoding: str,
+                 stats: Optional[PipelineStats] = None):
+    """
+    Open the output file of a command or stdout if none is given, counting
+    the written bytes in `stats` if given
+    """
+    if output is None:
+        out = _get_stdout(encoding)
+    else:
+        output_path = Path(str(output))
+        out = open(output_path, 'wb' if encoding == "bin" else 'w+')
+    if stats is not None:
+        out = TimedWriter(out, stats)
+    return out
+
+
+def _count_rows(blocks: Iterable, stats: PipelineStats) -> Iterator:
+    """
+    Pass the blocks of a stream through, counting them as written rows
+    """
+    for block in blocks:
+        stats.count(rows_out=len(block))
+        yield block
+
+
+def _write_streams(out, streams: list, encoding: str,
+                   stats: Optional[PipelineStats] = None) -> None:
+    """
+    Serialize the streams, given as metadata and an iterator over the blocks
+    of the stream, into the output in the requested encoding. Every block is
+    written with a single call.
+    """
+    if stats is not None and streams:
+        # all streams have the same rows, so the first one is counted
+        streams = list(streams)
+        streams[0] = (streams[0][0], _count_rows(streams[0][1], stats))
+    if encoding == "bin":
+        output_it = collect_blocks_into_frames(streams)
+    else:
+        output_it = collect_blocks_into_string(streams)
+    if stats is not None:
+        output_it = stats.timed(output_it, "serialize")
+    for chunk in output_it:
+        out.write(chunk)
+
+
+@click.command()
+@click.pass_context
+def convert(ctx):
+    """
+    Convert a signal stream into the encoding given to signal-io.
+    """
+    data_stream = SignalStreams(ctx.obj['in'], stats=ctx.obj['stats'])
+    _write_streams(ctx.obj['out'],
+                   [(metadata, consumer.iter_blocks()) for metadata, consumer
+                    in data_stream.split_into_individual_streams()],
+                   ctx.obj['encoding'], ctx.obj['stats'])
+
+
+@click.command()
+@click.argument("address", type=str)
+@click.option("-n", "--subscribers",
+              type=click.IntRange(0, max_open=True), default=1,
+              help="Number of subscribers to wait for before the stream is "
+                   "read")
+@click.option("--buffer-blocks",
+              type=click.IntRange(1, max_open=True), default=16,
+              help="Number of blocks that are queued for every subscriber")
+@click.option("--policy", type=click.Choice(POLICIES), default="block",
+              help="Wait for subscribers with full queues or drop blocks "
+                   "for them")
+@click.option("-b", "--block-rows",
+              type=click.IntRange(1, max_open=True), default=1024,
+              help="Maximum number of rows that are sent at once")
+@click.pass_context
+def serve(ctx: click.Context, address: str, subscribers: int,
+          buffer_blocks: int, policy: str, block_rows: int) -> None:
+    """
+    Publish the signal stream read from FILE-PATH on a socket.
+
+    ADDRESS is either tcp://host:port or unix:///path/to/socket. Every
+    subscriber receives the metadata section and then the blocks published
+    after it connected, in the encoding given to signal-io.
+    """
+    try:
+        parse_address(address)
+    except ValueError as e:
+        click.echo(e, err=True)
+        sys.exit(1)
+    stats = ctx.obj['stats']
+    data_stream = SignalStreams(ctx.obj['in'], stats=stats)
+    server = asyncio.run(serve_blocks(
+        address, data_stream.metadata["streams"],
+        data_stream.iter_blocks(block_rows), ctx.obj['encoding'],
+        buffer_blocks, policy, subscribers, stats))
+    if server.dropped:
+        click.echo(f"Dropped {server.dropped} blocks for slow subscribers",
+                   err=True)
+
+
+@click.command()
+@click.argument("address", type=str)
+@click.option("-b", "--block-rows",
+              type=click.IntRange(1, max_open=True), default=1024,
+              help="Maximum number of rows that are written at once")
+@click.pass_context
+def connect(ctx: click.Context, address: str, block_rows: int) -> None:
+    """
+    Subscribe to a stream published with serve and write it to FILE-PATH.
+
+    ADDRESS is either tcp://host:port or unix:///path/to/socket.
+    """
+    try:
+        parse_address(address)
+    except ValueError as e:
+        click.echo(e, err=True)
+        sys.exit(1)
+
+    stats = ctx.obj['stats']
+
+    async def receive():
+        try:
+            data_stream = await subscribe(address, block_rows, stats)
+        except OSError as e:
+            click.echo(f"Could not connect to {address}: {e}", err=True)
+            sys.exit(1)
+        out = ctx.obj['out']
+        encoding = ctx.obj['encoding']
+        metadata = data_stream.metadata["streams"]
+        types = [m['type'] for m in metadata]
+        try:
+            if encoding == "bin":
+                out.write(metadata_header(metadata, encoding).encode("utf-8"))
+            else:
+                out.write(metadata_header(metadata))
+            async for block in data_stream.iter_blocks(block_rows):
+                with _stage(stats, "serialize"):
+                    if encoding == "bin":
+                        data = encode_frame(metadata, block)
+                    else:
+                        data = format_block(block, types)
+                out.write(data)
+                if stats is not None:
+                    stats.count(rows_out=SignalStreams._block_rows(block))
+                    stats.tick()
+        finally:
+            out.flush()
+            await data_stream.close()
+
+    asyncio.run(receive())
 
 
 @click.command()
@@ -61,23 +301,31 @@ def file_io(ctx, file_path: click.Path, direction: str, encoding: str) -> None:
 @click.option("-c", "--signal-column", type=int, multiple=True, required=True,
               help="index of the column that should be read in")
 @click.option("-t", "--column-type", multiple=True,
-              type=(int, click.Choice(['int', 'float'])),
+              type=(int, click.Choice(list(VALUE_TYPES))),
               help="Designate the data type of the column "
-                   "(either 'int' or 'float'), defaults to float",
+                   "(e.g. 'int', 'float' or 'int16'), defaults to float",
               default=[[-1, 'float']])
+@click.option("-b", "--block-rows",
+              type=click.IntRange(min=1, max_open=True),
+              default=65536,
+              help="Number of rows that are converted at once")
 @click.pass_context
 def read_csv(ctx, delimiter: str,
              signal_column: tuple[int],
-             column_type: tuple[tuple[int, str]]):
+             column_type: tuple[tuple[int, str]],
+             block_rows: int):
     """
     read in a file of CSV format.
     """
-    csvr = csv.reader(
-        ctx.obj['in'], delimiter=delimiter, skipinitialspace=True)
+    in_file = ctx.obj['in']
+    if not isinstance(in_file, io.TextIOBase):
+        in_file = io.TextIOWrapper(in_file, encoding="utf-8", newline="")
     out = ctx.obj['out']
-    col_names = next(csvr)
+    encoding = ctx.obj.get('encoding', 'utf-8')
+    col_names = next(csv.reader([in_file.readline()], delimiter=delimiter,
+                                skipinitialspace=True))
     col_idx = list(range(len(col_names)))
-    columns_with_types = list(map(lambda c: c[0], column_type))
+    columns_with_types = dict(column_type)
     if any(map(lambda i: i not in col_idx and i != -1, columns_with_types)):
         raise ValueError(f"Invalid column index in column format "
                          f"specification. {len(col_names)} available")
@@ -85,129 +333,616 @@ def read_csv(ctx, delimiter: str,
         raise ValueError(f"Invalid column index in column selection. "
                          f"{len(col_names)} available")
 
-    # generate the description dict for the requested data
+    # resolve the selected columns and their types once, the streams are
+    # written in the order of the columns in the file
+    selected_columns = sorted(set(signal_column))
+    default_type = columns_with_types.get(-1, 'float')
     column_descriptions = []
-    for i, name in enumerate(col_names):
-        if i in signal_column:
-            if i in columns_with_types:
-                ct = column_type[i][1]
-            else:
-                ct = 'float'
-            column_descriptions.append(
-                {'name': str(name),
-                 'type': deepcopy(ct),
-                 'shape': [1]
-                 })
+    for i in selected_columns:
+        column_descriptions.append(
+            {'name': str(col_names[i]),
+             'type': columns_with_types.get(i, default_type),
+             'shape': [1]
+             })
+    stream_metadata = deepcopy(column_descriptions)
+    for description in stream_metadata:
+        validate_metadata(description)
 
     # write the meta data for the requested columns to the data stream
-    out.write("Metadata:\n")
-    out.write("streams:\n")
-    out.write(yaml.dump(column_descriptions))
-    out.write("\nData:\n")
-
-    # now write the stream info to the
-    for line in csvr:
-        # filter out the columns that we wanted
-        req_data = list(
-            map(lambda elem: np.array([elem[1]],
-                                      dtype=column_descriptions[elem[0]]['type']),
-                filter(lambda elem: elem[0] in signal_column,
-                       enumerate(line))))
-        out.write(arrays_to_data_line(req_data)+'\n')
+    if encoding == "bin":
+        out.write(metadata_header(stream_metadata, encoding).encode("utf-8"))
+    else:
+        out.write("Metadata:\n")
+        out.write("streams:\n")
+        out.write(yaml.dump(column_descriptions))
+        out.write("\nData:\n")
+
+    # now convert whole blocks of rows and write them out at once
+    blocks = read_csv_blocks(in_file, delimiter, selected_columns,
+                             [d['type'] for d in stream_metadata],
+                             block_rows)
+    stats = ctx.obj.get('stats')
+    if stats is not None:
+        blocks = stats.timed(blocks, "parse")
+    for block in blocks:
+        with _stage(stats, "serialize"):
+            if encoding == "bin":
+                data = encode_frame(stream_metadata, block)
+            else:
+                data = format_block(block, separator=" ")
+        out.write(data)
+        if stats is not None:
+            rows = SignalStreams._block_rows(block)
+            stats.count(rows_in=rows, rows_out=rows)
 
 
 @click.group("signal-transform")
 @click.option("-v", "--verbose", count=True)
 @click.option("-s", "--stream",
               type=click.IntRange(min=0, max_open=True),
-              required=True,
-              help="Select the stream that the command should be applied to")
+              multiple=True,
+              help="Select a stream that the command should be applied to, "
+                   "may be given multiple times")
+@click.option("-a", "--all-streams", is_flag=True, default=False,
+              help="Apply the command to all streams")
+@click.option("-j", "--jobs",
+              type=click.IntRange(min=1, max_open=True),
+              default=1,
+              help="Number of worker processes that the selected streams "
+                   "are distributed over")
+@click.option("-b", "--block-rows",
+              type=click.IntRange(min=1, max_open=True),
+              default=4096,
+              help="Number of rows that are read and processed at once")
+@_stats_options
 @click.pass_context
-def apply_transformation(ctx: click.Context, verbose: int, stream: int):
+def apply_transformation(ctx: click.Context, verbose: int,
+                         stream: Tuple[int], all_streams: bool, jobs: int,
+                         block_rows: int, show_stats: bool,
+                         stats_interval: Optional[float]):
     """
-    Apply a Transformation onto one of the data streams.
+    Apply a Transformation onto one or more of the data streams.
 
     This command prepares the data and lets the subcommands execute
     """
-    stream_in = click.get_text_stream('stdin')
-    data_stream = SignalStreams(stream_in)
-    data_streams = data_stream.split_into_individual_streams()
+    stats = _make_stats(ctx, show_stats, stats_interval)
+    stream_in = click.get_binary_stream('stdin')
+    data_stream = SignalStreams(stream_in, block_rows=block_rows, stats=stats)
+    stream_metadata = data_stream.metadata['streams']
     if verbose > 0:
-        for i, (metadata, _) in enumerate(data_streams):
-            click.echo(f"Stream {i}: {metadata['name']}")
-    if stream > len(data_streams):
-        click.echo(f"No stream with index {stream}. "
-                   f"{len(data_streams)} streams available")
-        sys.exit()
+        for i, metadata in enumerate(stream_metadata):
+            click.echo(f"Stream {i}: {metadata['name']}", err=True)
+    if all_streams:
+        selected = list(range(len(stream_metadata)))
+    else:
+        selected = sorted(set(stream))
+    if not selected:
+        click.echo("Select a stream with --stream or --all-streams",
+                   err=True)
+        sys.exit(1)
+    for idx in selected:
+        if idx >= len(stream_metadata):
+            click.echo(f"No stream with index {idx}. "
+                       f"{len(stream_metadata)} streams available", err=True)
+            sys.exit(1)
     ctx.obj = {}
-    ctx.obj['streams'] = data_streams
-    ctx.obj['selected_stream_idx'] = stream
+    ctx.obj['signal_streams'] = data_stream
+    ctx.obj['metadata'] = stream_metadata
+    ctx.obj['selected_streams'] = selected
+    ctx.obj['block_rows'] = block_rows
+    ctx.obj['jobs'] = jobs
+    ctx.obj['encoding'] = data_stream.encoding
+    ctx.obj['verbose'] = verbose
+    ctx.obj['stats'] = stats
+
+
+def _write_blocks(out, metadata: list, blocks, encoding: str,
+                  stats: Optional[PipelineStats] = None) -> None:
+    """
+    Serialize blocks holding all streams into the output in the requested
+    encoding, with a single write per block
+    """
+    if encoding == "bin":
+        out.write(metadata_header(metadata, encoding).encode("utf-8"))
+
+        def serialize(block):
+            return encode_frame(metadata, block)
+    else:
+        out.write(metadata_header(metadata))
+        types = [m['type'] for m in metadata]
+
+        def serialize(block):
+            return format_block(block, types)
+    if stats is None:
+        for block in blocks:
+            out.write(serialize(block))
+        return
+    for block in blocks:
+        with stats.stage("serialize"):
+            data = serialize(block)
+        out.write(data)
+        stats.count(rows_out=SignalStreams._block_rows(block))
+        stats.tick()
+
+
+def _apply_block_operator(ctx: click.Context, name: str,
+                          make_operator: Callable[[dict], Tuple[
+                              dict, Callable[[Any], Any]]],
+                          output: click.Path) -> None:
+    """
+    Apply an operator to whole blocks of every selected stream and write all
+    streams to the output.
+
+    :param name: Name of the command for the throughput report
+    :param make_operator: Called with a copy of the metadata of every
+                          selected stream, returns the metadata of the
+                          stream after the operator and the operator. The
+                          operator takes a block of the stream and returns
+                          the transformed block, it has to carry its own
+                          state from one block to the next and has to be
+                          picklable to run in a worker process.
+    :param output: The file to write to, stdout if None
+    """
+    metadata = [deepcopy(m) for m in ctx.obj['metadata']]
+    operators = {}
+    for idx in ctx.obj['selected_streams']:
+        metadata[idx], operators[idx] = make_operator(deepcopy(metadata[idx]))
+        if metadata[idx].get('rate') is not None:
+            # operators only see the samples that are present
+            operators[idx] = PresentElements(operators[idx])
+    transform = ParallelBlockTransform(operators, ctx.obj['jobs'])
+    blocks = ctx.obj['signal_streams'].iter_blocks(ctx.obj['block_rows'])
+    stats = ctx.obj['stats']
+    transformed = transform(blocks)
+    if stats is not None:
+        transformed = stats.timed(transformed, "operator")
+
+    out = _open_output(output, ctx.obj['encoding'], stats)
+    start = time.perf_counter()
+    _write_blocks(out, metadata, transformed, ctx.obj['encoding'], stats)
+    elapsed = time.perf_counter() - start
+    if output is not None:
+        out.close()
+    if ctx.obj['verbose'] > 0:
+        rows = transform.rows
+        click.echo(f"{name}: {rows} rows of {len(operators)} streams in "
+                   f"{elapsed:.3f} s ({rows / max(elapsed, 1e-9):.0f} "
+                   f"rows/s) with {transform.jobs} jobs, "
+                   f"{transform.operator_time:.3f} s in the operator "
+                   f"({rows / max(transform.operator_time, 1e-9):.0f} "
+                   "rows/s)", err=True)
+
+
+def _reject_variable_length(command: str) -> None:
+    """
+    Exit if one of the selected streams has a variable length
+    """
+    ctx = click.get_current_context()
+    for idx in ctx.obj['selected_streams']:
+        if ctx.obj['metadata'][idx]['shape'][0] == -1:
+            click.echo(f"The {command} can not be applied to streams of "
+                       "variable length", err=True)
+            sys.exit(1)
 
 
 @click.command()
 @click.argument("lsb-magnitude", type=float)
+@click.option("-t", "--type", "type_", type=click.Choice(_integer_types),
+              default="int",
+              help="Integer type of the digitized values, values outside of "
+                   "its range saturate")
 @click.option("-o", "--output", type=click.Path(dir_okay=False), default=None,
               help="Specify a file to write the output of the command to."
               "If not specified, 'stdout' will be used")
 @click.pass_context
-def digitize(ctx: click.Context, lsb_magnitude: float,
+def digitize(ctx: click.Context, lsb_magnitude: float, type_: str,
              output: click.Path) -> None:
-    # Select the right output type
-    if output is not None:
-        output_path = Path(str(output))
-        out = open(output_path, 'w+')
-    else:
-        out = click.get_text_stream('stdout')
+    dtype = VALUE_TYPES[type_]
 
-    # get the input from the context
-    stream_idx = ctx.obj['selected_stream_idx']
-    data_iterators = [st[1] for st in ctx.obj['streams']]
-    metadata_copy = [deepcopy(ds[0]) for ds in ctx.obj['streams']]
-    metadata_copy[stream_idx]['type'] = int
+    def make_operator(stream_metadata: dict):
+        stream_metadata['type'] = stream_type(dtype)
+        return stream_metadata, Digitize(lsb_magnitude, dtype)
 
-    def digitize_array(array: np.ndarray, lsb_mag: float) -> np.ndarray:
-        array = array / lsb_mag
-        return array.astype(int)
+    _apply_block_operator(ctx, "digitize", make_operator, output)
 
-    transformed_stream = map(
-        partial(digitize_array, lsb_mag=lsb_magnitude),
-        data_iterators[stream_idx])
-    data_iterators[stream_idx] = transformed_stream
 
-    output_it = collect_stream_into_string(
-        list(zip(metadata_copy, data_iterators)))
-    for string in output_it:
-        out.write(string)
-    out.close()
-
-
-@click.command()
-@click.argument("k", type=int)
-@click.argument("l", type=int)
-@click.argument("m", type=int)
+@click.command("trapezoid")
+@click.argument("k", type=_sample_count)
+@click.argument("l", type=_sample_count)
+@click.argument("m", type=float)
 @click.option("-o", "--output", type=click.Path(dir_okay=False), default=None,
               help="Specify a file to write the output of the command to. "
               "If not specified, 'stdout' will be used")
 @click.pass_context
 def apply_trapezoidal_filter(ctx: click.Context, k: int,
-                             l: int, m: int,
+                             l: int, m: float,
                              output: click.Path):
-    ...
+    """
+    Apply a trapezoid filter to the selected streams.
+
+    K is the rise time and L the delay of the second subtractor in samples,
+    M is the decay compensation. Every element of a tensor stream is
+    filtered as an independent channel.
+    """
+    _reject_variable_length("trapezoid filter")
+
+    def make_operator(stream_metadata: dict):
+        stream_metadata['type'] = float
+        return stream_metadata, FloatInput(TrapezoidFilter(k, l, m))
+
+    _apply_block_operator(ctx, "trapezoid", make_operator, output)
+
+
+@click.command("g-h")
+@click.argument("g", type=float)
+@click.argument("h", type=float)
+@click.option("-t", "--timestep", type=float, default=1.,
+              help="Time between two measurements")
+@click.option("--initial-state", type=float, default=0.,
+              help="Initial estimate of the state of every element")
+@click.option("--initial-momentum", type=float, default=0.,
+              help="Initial estimate of the rate of change of every element")
+@click.option("-o", "--output", type=click.Path(dir_okay=False), default=None,
+              help="Specify a file to write the output of the command to. "
+              "If not specified, 'stdout' will be used")
+@click.pass_context
+def apply_g_h_filter(ctx: click.Context, g: float, h: float, timestep: float,
+                     initial_state: float, initial_momentum: float,
+                     output: click.Path):
+    """
+    Track the selected streams with a g-h filter.
+
+    G weights the measurement in the state estimate and H weights the
+    measured change in the momentum estimate. Every element of a tensor
+    stream is tracked as an independent channel.
+    """
+    _reject_variable_length("g-h filter")
+
+    def make_operator(stream_metadata: dict):
+        stream_metadata['type'] = float
+        return stream_metadata, GHFilter(g, h, timestep, initial_state,
+                                         initial_momentum)
+
+    _apply_block_operator(ctx, "g-h", make_operator, output)
+
+
+def _load_coefficients(path: str) -> np.ndarray:
+    """
+    Read filter coefficients from a .npy file or a text file of whitespace
+    separated numbers
+    """
+    if path.endswith(".npy"):
+        return np.load(path)
+    return np.loadtxt(path, ndmin=2)
+
+
+@click.command("lfilter")
+@click.option("-t", "--tap", type=float, multiple=True,
+              help="A coefficient of a FIR filter, may be given multiple "
+                   "times")
+@click.option("--taps-file", type=click.Path(exists=True, dir_okay=False),
+              default=None,
+              help="A .npy or text file holding the coefficients of a FIR "
+                   "filter")
+@click.option("--sos-file", type=click.Path(exists=True, dir_okay=False),
+              default=None,
+              help="A .npy or text file holding the second order sections "
+                   "of an IIR filter, one row b0 b1 b2 a0 a1 a2 per section")
+@click.option("--fft-threshold", type=click.IntRange(1, max_open=True),
+              default=512,
+              help="FIR filters with more taps are computed by FFT "
+                   "convolution")
+@click.option("-o", "--output", type=click.Path(dir_okay=False), default=None,
+              help="Specify a file to write the output of the command to. "
+              "If not specified, 'stdout' will be used")
+@click.pass_context
+def apply_linear_filter(ctx: click.Context, tap: Tuple[float],
+                        taps_file: Optional[str], sos_file: Optional[str],
+                        fft_threshold: int, output: click.Path):
+    """
+    Apply a FIR or IIR filter to the selected streams.
+
+    The filter is given by its FIR taps, either with --tap or --taps-file,
+    or by the second order sections of an IIR filter with --sos-file, e.g.
+    as written by numpy.save(path, scipy.signal.butter(4, 0.1, output='sos')).
+    Every element of a tensor stream is filtered as an independent channel.
+    """
+    _reject_variable_length("lfilter")
+    if sum((bool(tap), taps_file is not None, sos_file is not None)) != 1:
+        click.echo("Give the filter either with --tap, --taps-file or "
+                   "--sos-file", err=True)
+        sys.exit(1)
+    try:
+        if sos_file is not None:
+            taps, sos = None, _load_coefficients(sos_file)
+        else:
+            taps = np.array(tap) if tap else \
+                _load_coefficients(taps_file).ravel()
+            sos = None
+        # raise invalid coefficients before any data is read
+        BlockFilter(taps, sos, fft_threshold)
+    except ValueError as e:
+        click.echo(e, err=True)
+        sys.exit(1)
+
+    def make_operator(stream_metadata: dict):
+        stream_metadata['type'] = float
+        return stream_metadata, BlockFilter(taps, sos, fft_threshold)
+
+    _apply_block_operator(ctx, "lfilter", make_operator, output)
+
+
+def _chain_step(expression: Expression, step: str) -> Expression:
+    """
+    Add the operator of a step of the form NAME=ARG[:ARG...] of the chain
+    command to the expression
+
+    :raises click.BadParameter: If a delay of a trapezoid step is not a
+                                positive integer, like for the trapezoid
+                                command.
+    """
+    name, _, text = step.partition("=")
+    if name == "digitize" and text.count(":") == 1:
+        lsb, _, type_ = text.partition(":")
+        if type_ not in _integer_types:
+            raise ValueError(f"Invalid integer type of the step {step}")
+        try:
+            return expression.digitize(float(lsb), VALUE_TYPES[type_])
+        except ValueError:
+            raise ValueError(f"Invalid arguments of the step {step}")
+    if name == "trapezoid" and text.count(":") == 2:
+        *delays, m = text.split(":")
+        try:
+            k, l = (_sample_count.convert(delay, None, None)
+                    for delay in delays)
+        except click.BadParameter as e:
+            raise click.BadParameter(f"{step}: {e.message}",
+                                     param_hint="'STEPS...'")
+        try:
+            m = float(m)
+        except ValueError:
+            raise ValueError(f"Invalid arguments of the step {step}")
+        return expression.filter(TrapezoidFilter(k, l, m))
+    try:
+        args = [float(arg) if arg else None for arg in text.split(":")]
+    except ValueError:
+        raise ValueError(f"Invalid arguments of the step {step}")
+    if name == "clip" and len(args) == 2:
+        return expression.clip(*args)
+    if None in args:
+        raise ValueError(f"Missing argument of the step {step}")
+    if name == "scale" and len(args) == 1:
+        return expression.scale(args[0])
+    if name == "offset" and len(args) == 1:
+        return expression.offset(args[0])
+    if name == "digitize" and len(args) == 1:
+        return expression.digitize(args[0])
+    if name == "g-h" and len(args) in (2, 3):
+        return expression.filter(GHFilter(*args))
+    raise ValueError(f"Unknown step or wrong number of arguments: {step}")
+
+
+@click.command("chain")
+@click.argument("steps", nargs=-1, required=True)
+@click.option("-o", "--output", type=click.Path(dir_okay=False), default=None,
+              help="Specify a file to write the output of the command to. "
+              "If not specified, 'stdout' will be used")
+@click.pass_context
+def chain(ctx: click.Context, steps: Tuple[str], output: click.Path) -> None:
+    """
+    Apply several operators to the selected streams in a single pass.
+
+    Every step is one of scale=FACTOR, offset=VALUE, clip=LOW:HIGH (either
+    bound may be left empty), digitize=LSB[:TYPE], trapezoid=K:L:M and
+    g-h=G:H[:TIMESTEP]. The steps are fused, so every block is copied once
+    and the elementwise steps are applied in place.
+    """
+    def make_operator(stream_metadata: dict):
+        try:
+            expression = Expression(stream_metadata)
+            for step in steps:
+                expression = _chain_step(expression, step)
+        except ValueError as e:
+            click.echo(f"Stream {stream_metadata['name']}: {e}", err=True)
+            sys.exit(1)
+        return expression.metadata, expression.compile()
+
+    _apply_block_operator(ctx, "chain", make_operator, output)
+
+
+@click.command("align")
+@click.argument("rate", type=click.FloatRange(0, min_open=True))
+@click.option("-m", "--method", type=click.Choice(METHODS),
+              default="linear",
+              help="How the samples at the common rate are computed from "
+                   "the samples of every stream")
+@click.option("-o", "--output", type=click.Path(dir_okay=False), default=None,
+              help="Specify a file to write the output of the command to. "
+              "If not specified, 'stdout' will be used")
+@click.pass_context
+def align(ctx: click.Context, rate: float, method: str,
+          output: click.Path) -> None:
+    """
+    Resample the selected streams to the common RATE.
+
+    Every selected stream needs a rate in its metadata. The output holds
+    only the selected streams, with one sample of every stream per row.
+    """
+    selected = ctx.obj['selected_streams']
+    try:
+        aligner = RateAligner([ctx.obj['metadata'][i] for i in selected],
+                              rate, method)
+    except ValueError as e:
+        click.echo(e, err=True)
+        sys.exit(1)
+    blocks = ([block[i] for i in selected] for block in
+              ctx.obj['signal_streams'].iter_blocks(ctx.obj['block_rows']))
+    stats = ctx.obj['stats']
+    aligned = aligner(blocks)
+    if stats is not None:
+        aligned = stats.timed(aligned, "operator")
+    out = _open_output(output, ctx.obj['encoding'], stats)
+    _write_blocks(out, aligner.metadata, aligned, ctx.obj['encoding'], stats)
+    if output is not None:
+        out.close()
+
+
+@click.command("resample")
+@click.argument("up", type=click.IntRange(1, max_open=True))
+@click.argument("down", type=click.IntRange(1, max_open=True))
+@click.option("-n", "--half-length", type=click.IntRange(1, max_open=True),
+              default=None,
+              help="Number of taps of the low-pass filter on either side of "
+                   "its center, 10 times the larger of the reduced factors "
+                   "by default")
+@click.option("-o", "--output", type=click.Path(dir_okay=False), default=None,
+              help="Specify a file to write the output of the command to. "
+              "If not specified, 'stdout' will be used")
+@click.pass_context
+def resample(ctx: click.Context, up: int, down: int,
+             half_length: Optional[int], output: click.Path) -> None:
+    """
+    Resample the selected streams by the factor UP / DOWN.
+
+    The streams are upsampled by UP, low-pass filtered by a polyphase FIR
+    filter and downsampled by DOWN, e.g. 1 10 decimates by 10 and 3 2
+    resamples 1000 samples to 1500. The output holds only the selected
+    streams.
+    """
+    selected = ctx.obj['selected_streams']
+    metadata = []
+    for i in selected:
+        stream = ctx.obj['metadata'][i]
+        if stream['shape'][0] == -1 or stream.get('rate') is not None:
+            click.echo(f"Stream {stream['name']}: only streams of fixed "
+                       f"shape without a rate can be resampled", err=True)
+            sys.exit(1)
+        # float32 streams stay float32, all others become float streams
+        type_ = stream['type'] if stream['type'] == np.float32 else float
+        metadata.append(dict(stream, type=type_))
+    resamplers = [Resampler(up, down, half_length) for _ in selected]
+
+    def resampled(blocks):
+        empty = True
+        for block in blocks:
+            empty = False
+            yield [resampler(block[i]).astype(m['type'], copy=False)
+                   for resampler, i, m in zip(resamplers, selected,
+                                              metadata)]
+        if not empty:
+            yield [resampler.flush().astype(m['type'], copy=False)
+                   for resampler, m in zip(resamplers, metadata)]
+
+    blocks = resampled(
+        ctx.obj['signal_streams'].iter_blocks(ctx.obj['block_rows']))
+    stats = ctx.obj['stats']
+    if stats is not None:
+        blocks = stats.timed(blocks, "operator")
+    out = _open_output(output, ctx.obj['encoding'], stats)
+    _write_blocks(out, metadata, blocks, ctx.obj['encoding'], stats)
+    if output is not None:
+        out.close()
+
+
+@click.command("stats")
+@click.option("-q", "--quantile", type=click.FloatRange(0, 1),
+              multiple=True,
+              help="A quantile to estimate, may be given multiple times, "
+                   f"{', '.join(map(str, DEFAULT_QUANTILES))} if not given")
+@click.option("--accuracy", type=click.FloatRange(0, 1, min_open=True,
+                                                  max_open=True),
+              default=0.01,
+              help="Relative accuracy of the estimated quantiles")
+@click.option("--histogram", type=(IntRange(1), float, float), default=None,
+              metavar="BINS LOW HIGH",
+              help="Count the values in BINS bins from LOW to HIGH")
+@click.option("-o", "--output", type=click.Path(dir_okay=False), default=None,
+              help="Specify a file to write the statistics to. "
+              "If not specified, 'stdout' will be used")
+@click.pass_context
+def stats(ctx: click.Context, quantile: Tuple[float], accuracy: float,
+          histogram: Optional[Tuple[int, float, float]],
+          output: click.Path) -> None:
+    """
+    Compute statistics of every element of the selected streams.
+
+    The count, mean, standard deviation, minimum, maximum, quantiles and
+    optionally a histogram are computed in a single pass and written as
+    YAML, with one entry per stream.
+    """
+    if histogram is not None and not histogram[1] < histogram[2]:
+        click.echo("The lower end of the histogram range must be below the "
+                   "upper end", err=True)
+        sys.exit(1)
+    blocks = ctx.obj['signal_streams'].iter_blocks(ctx.obj['block_rows'])
+    with _stage(ctx.obj['stats'], "operator"):
+        statistics = block_statistics(ctx.obj['metadata'],
+                                      ctx.obj['selected_streams'], blocks,
+                                      relative_accuracy=accuracy,
+                                      histogram=histogram)
+    report = [accumulator.summary(quantile or DEFAULT_QUANTILES)
+              for accumulator in statistics]
+    text = yaml.safe_dump(report, sort_keys=False)
+    if output is None:
+        click.echo(text, nl=False)
+    else:
+        Path(str(output)).write_text(text)
 
 
 @click.command()
 @click.argument('y', type=click.IntRange(0, max_open=True))
 @click.option('-m', '--mode',
-              type=click.Choice(['xy', 'waterfall', 'matrix', 'scatter']),
+              type=click.Choice(PLOT_MODES), default="xy",
               help="set the type of plot that will be produced")
 @click.option('-x', '--xaxis', type=IntRange(0, max_open=True),
-              help="Specify the X axis for which to plot which to plot")
+              help="Index of a stream with a single element that holds the "
+                   "x coordinates of the xy and scatter plots, the sample "
+                   "number is used if not given")
+@click.option('-o', '--output', type=click.Path(dir_okay=False),
+              required=True,
+              help="The image file, its format follows from the extension")
+@click.option('--size', type=(IntRange(2), IntRange(2)), default=(800, 600),
+              help="Width and height of the image in pixels")
+@click.option('--refresh', type=IntRange(1), default=None,
+              help="Redraw the image after every REFRESH blocks, instead of "
+                   "only at the end of the stream")
+@click.option("-b", "--block-rows",
+              type=click.IntRange(1, max_open=True), default=4096,
+              help="Number of rows that are read and processed at once")
 @click.pass_context
-def plot(ctx: click.Context, y: int, mode: str, xaxis: int) -> None:
-    ...
+def plot(ctx: click.Context, y: int, mode: str, xaxis: int,
+         output: click.Path, size: Tuple[int, int], refresh: int,
+         block_rows: int) -> None:
+    """
+    Plot stream Y of the signal stream read from FILE-PATH.
+
+    Only a summary of the data with about one value per pixel is kept, so
+    streams of any length can be plotted: 'xy' draws the envelope of the
+    minimum and maximum of every pixel column, 'scatter' the density of
+    the points over the x stream, 'waterfall' the elements over time and
+    'matrix' the last element of the stream.
+    """
+    stats = ctx.obj['stats']
+    data_stream = SignalStreams(ctx.obj['in'], stats=stats)
+    try:
+        stream_plot = make_plot(mode, data_stream.metadata['streams'], y,
+                                xaxis, size)
+    except ValueError as e:
+        click.echo(e, err=True)
+        sys.exit(1)
+    for i, block in enumerate(data_stream.iter_blocks(block_rows), 1):
+        with _stage(stats, "operator"):
+            stream_plot.update(block)
+        if refresh is not None and i % refresh == 0:
+            with _stage(stats, "write"):
+                stream_plot.save(output)
+        if stats is not None:
+            stats.tick()
+    with _stage(stats, "write"):
+        stream_plot.save(output)
 
 
-@click.group("signal-generate")
+@click.group("signal-generate", chain=True)
 @click.option("-o", "--output",
               type=click.Path(dir_okay=False),
               default=None,
@@ -221,73 +956,230 @@ def plot(ctx: click.Context, y: int, mode: str, xaxis: int) -> None:
 @click.option("-s", "--samples",
               type=click.IntRange(1, max_open=True),
               default=100)
+@click.option("-e", "--encoding",
+              type=click.Choice(["utf-8", "bin"], case_sensitive=False),
+              default="utf-8",
+              help="Encoding of the output")
+@click.option("--seed", type=int, default=None,
+              help="Seed that the seeds of the generators without their own "
+                   "seed are derived from")
+@_stats_options
 @click.pass_context
 def signal_generate(ctx: click.Context,
                     output: click.Path,
                     input: bool,
-                    samples: int):
+                    samples: int,
+                    encoding: str,
+                    seed: Optional[int],
+                    show_stats: bool,
+                    stats_interval: Optional[float]):
+    """
+    Generate streams, or append them to the streams read from stdin.
+
+    Every generator command appends one stream, the commands can be chained
+    to generate several streams at once, e.g.
+    signal-generate -s 1000000 random a sine b.
+    """
+    stats = _make_stats(ctx, show_stats, stats_interval)
     # open the output or stdout
-    if output is not None:
-        out_path = Path(str(output))
-        out = open(out_path, 'w+')
-    else:
-        out = click.get_text_stream('stdout')
+    out = _open_output(output, encoding, stats)
     ctx.obj = {}
     ctx.obj['out'] = out
     ctx.obj['samples'] = samples
+    ctx.obj['encoding'] = encoding
+    ctx.obj['seed'] = np.random.SeedSequence(seed)
+    ctx.obj['stats'] = stats
     
     # get the input stream and attach the stream processor to it
     if input:
-        stream_in = click.get_text_stream('stdin')
-        data_stream = SignalStreams(stream_in)
+        stream_in = click.get_binary_stream('stdin')
+        data_stream = SignalStreams(stream_in, stats=stats)
         data_streams = data_stream.split_into_individual_streams()
-        ctx.obj['in'] = data_streams
+        ctx.obj['in'] = [(metadata, consumer.iter_blocks())
+                         for metadata, consumer in data_streams]
         ctx.obj['samples'] = None
     else:
-        ctx.obj["in"] = None
+        ctx.obj["in"] = []
 
 
-@click.command()
+@signal_generate.result_callback()
+@click.pass_context
+def write_generated_streams(ctx: click.Context, results, **kwargs):
+    """
+    Write the input streams together with the streams appended by the
+    generator commands to the output
+    """
+    stats = ctx.obj['stats']
+    streams = ctx.obj['in']
+    if stats is not None:
+        # the generators are timed as the operator of the command
+        streams = [(metadata, stats.timed(blocks, "operator"))
+                   for metadata, blocks in streams]
+    _write_streams(ctx.obj['out'], streams, ctx.obj['encoding'], stats)
+
+
+def _generator_seed(ctx: click.Context,
+                    seed: Optional[int]) -> Union[int, np.random.SeedSequence]:
+    """
+    The seed of a generator command, derived from the seed of the group if
+    the command has none, so that every stream gets its own random numbers
+    """
+    if seed is not None:
+        return seed
+    return ctx.obj['seed'].spawn(1)[0]
+
+
+def _typed_chunks(chunks: Iterable[np.ndarray],
+                  type_: Any) -> Iterator[np.ndarray]:
+    """
+    Convert generated chunks to the type of their stream, values that don't
+    fit into an integer type saturate
+    """
+    for chunk in chunks:
+        if is_integer_type(type_):
+            yield to_integers(chunk, type_)
+        else:
+            yield chunk.astype(type_, copy=False)
+
+
+@click.command("pulses")
 @click.argument("name", type=str)
+@click.option("-r", "--rate", type=click.FloatRange(0, min_open=True),
+              default=0.01,
+              help="Average number of pulses per sample")
+@click.option("-d", "--decay-const", type=click.FloatRange(0, min_open=True),
+              default=50.,
+              help="Decay constant of the pulses in samples")
+@click.option("--height-dist",
+              type=click.Choice(["normal", "uniform", "exponential",
+                                 "lognormal", "gamma"]),
+              default="normal",
+              help="Distribution of the pulse heights")
+@click.option("-p", "--height-param", type=float, multiple=True,
+              default=(1., 0.1),
+              help="Parameter of the pulse height distribution, "
+                   "may be given multiple times")
 @click.option("-c", "--chunk-size",
               type=click.IntRange(1, max_open=True),
-              default=10,
-              help="Number of data points that are generated befor"
-                   " being written to the output")
+              default=4096,
+              help="Number of samples that are generated at once")
+@click.option("--seed", type=int, default=None,
+              help="Seed of the random number generator")
+@click.pass_context
+def gen_pulses(ctx: click.Context, name: str, rate: float,
+               decay_const: float, height_dist: str,
+               height_param: Tuple[float], chunk_size: int,
+               seed: Optional[int]):
+    """
+    Generate a stream of exponentially decaying pulses with pile-up.
+
+    The pulses arrive as a Poisson process with RATE pulses per sample.
+    """
+    chunks = poisson_pulse_gen(rate, decay_const, height_dist, height_param,
+                               chunk_size, ctx.obj["samples"],
+                               _generator_seed(ctx, seed))
+    ctx.obj["in"].append(
+        ({"type": float, "name": name, "shape": [1]},
+         (chunk.reshape(-1, 1) for chunk in chunks)))
+
+
+@click.command("random")
+@click.argument("name", type=str)
+@click.option("-d", "--distribution",
+              type=click.Choice(list(RANDOM_DISTRIBUTIONS)),
+              default="uniform",
+              help="Distribution of the values, poisson gives Poisson noise")
+@click.option("-p", "--param", type=float, multiple=True,
+              help="Parameter of the distribution, may be given multiple "
+                   "times. Defaults to LOW=0 HIGH=1 for uniform, MEAN=0 "
+                   "STD=1 for normal and LAMBDA=1 for poisson")
 @click.option("-s", "--shape",
-              type=click.IntRange(0, max_open=True),
-              multiple=True)
-@click.option("-r", "--range",
-              type=(float, float),
-              default=(0, 1),
-              help="Define the range of the random numbers")
+              type=click.IntRange(1, max_open=True),
+              multiple=True,
+              help="Dimension of the tensor of every sample, may be given "
+                   "multiple times, a single value by default")
+@click.option("-t", "--type", "type_", type=click.Choice(list(VALUE_TYPES)),
+              default=None,
+              help="Type of the stream, int for poisson and float for the "
+                   "other distributions by default")
+@click.option("-c", "--chunk-size",
+              type=click.IntRange(1, max_open=True),
+              default=4096,
+              help="Number of samples that are generated at once")
+@click.option("--seed", type=int, default=None,
+              help="Seed of the random number generator")
 @click.pass_context
 def gen_random_numbers(ctx: click.Context,
                        name: str,
-                       chunk_size: int,
+                       distribution: str,
+                       param: Tuple[float],
                        shape: Tuple[int],
-                       range_: Tuple[float, float]):
+                       type_: Optional[str],
+                       chunk_size: int,
+                       seed: Optional[int]):
     """
-    Generate <sample> sets of random numbers in <shape>
-    and write them into a stream.
-
-    generate <chunk-size> samples at a time
+    Generate a stream of random tensors.
     """
-    input = ctx.obj["in"]
-    if input is None:
-        input = []
-        samples = ctx.obj["samples"]
-    else:
-        samples = None
+    params = param or RANDOM_DISTRIBUTIONS[distribution]
+    shape = shape or (1,)
+    if type_ is None:
+        type_ = "int" if distribution == "poisson" else "float"
+    dtype = VALUE_TYPES[type_]
+    chunks = random_chunks(distribution, params, shape, chunk_size,
+                           ctx.obj["samples"], _generator_seed(ctx, seed))
+    ctx.obj["in"].append(
+        ({"type": dtype, "name": name, "shape": list(shape)},
+         _typed_chunks(chunks, dtype)))
 
-    # this is the generator function we will use
-    # to actually generate the numbers and
-    # yield them to be serialized
-    from .generators import rngen
-    input.append(({"type": float, "name": name, "shape": list(shape)},
-                  rngen(shape, range_, chunk_size,
-                        samples)))
+
+@click.command("sine")
+@click.argument("name", type=str)
+@click.option("-a", "--amplitude", type=float, default=1.,
+              help="Amplitude of the sine")
+@click.option("-P", "--period", type=click.FloatRange(0, min_open=True),
+              default=100.,
+              help="Period of the sine in samples")
+@click.option("--phase", type=float, default=0.,
+              help="Phase of the sine at the first sample in radians")
+@click.option("-n", "--noise", type=click.FloatRange(0), default=0.,
+              help="Standard deviation of the gaussian noise that is added")
+@click.option("-t", "--type", "type_", type=click.Choice(list(VALUE_TYPES)),
+              default="float",
+              help="Type of the stream")
+@click.option("-c", "--chunk-size",
+              type=click.IntRange(1, max_open=True),
+              default=4096,
+              help="Number of samples that are generated at once")
+@click.option("--seed", type=int, default=None,
+              help="Seed of the random number generator")
+@click.pass_context
+def gen_sine(ctx: click.Context, name: str, amplitude: float, period: float,
+             phase: float, noise: float, type_: str, chunk_size: int,
+             seed: Optional[int]):
+    """
+    Generate a sine with a period of PERIOD samples plus gaussian noise.
+    """
+    dtype = VALUE_TYPES[type_]
+    chunks = sine_chunks(amplitude, period, phase, noise, chunk_size,
+                         ctx.obj["samples"], _generator_seed(ctx, seed))
+    ctx.obj["in"].append(
+        ({"type": dtype, "name": name, "shape": [1]},
+         _typed_chunks((chunk.reshape(-1, 1) for chunk in chunks), dtype)))
 
 
 file_io.add_command(read_csv)
+file_io.add_command(convert)
+file_io.add_command(serve)
+file_io.add_command(connect)
+file_io.add_command(plot)
 apply_transformation.add_command(digitize)
+apply_transformation.add_command(apply_trapezoidal_filter)
+apply_transformation.add_command(apply_g_h_filter)
+apply_transformation.add_command(apply_linear_filter)
+apply_transformation.add_command(align)
+apply_transformation.add_command(resample)
+apply_transformation.add_command(chain)
+apply_transformation.add_command(stats)
+signal_generate.add_command(gen_pulses)
+signal_generate.add_command(gen_random_numbers)
+signal_generate.add_command(gen_sine)
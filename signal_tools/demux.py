@@ -0,0 +1,227 @@
+"""
+Fan-out of a stream of blocks to one consumer per signal stream
+"""
+from collections import deque
+import threading
+from typing import Any, Iterator, List, Optional
+
+
+class StreamDemultiplexer:
+    """
+    Hands the columns of a block iterator out to one consumer per stream.
+
+    Parsed blocks are kept in a bounded buffer that is shared by all
+    consumers. A block is dropped as soon as every consumer has moved past
+    it, so every block is stored only once regardless of the number of
+    streams. If one consumer gets more than `max_buffered_blocks` blocks
+    ahead of the slowest one, it either raises a `BufferError`
+    (policy 'raise') or waits until the other consumers catch up
+    (policy 'block', for consumers running in different threads).
+    """
+
+    def __init__(self, blocks: Iterator[List[Any]], num_streams: int,
+                 flatten_rows: Optional[List[bool]] = None,
+                 max_buffered_blocks: int = 64,
+                 policy: str = "raise",
+                 timeout: Optional[float] = None):
+        """
+        :param blocks: The blocks with one column per stream.
+        :type blocks: Iterator[List[Any]]
+        :param num_streams: The number of streams in every block.
+        :type num_streams: int
+        :param flatten_rows: For every stream, if the rows handed out by the
+                             row iterator of the consumer should be flattened
+                             in column-major order.
+        :type flatten_rows: Optional[List[bool]]
+        :param max_buffered_blocks: Maximum number of blocks in the buffer.
+        :type max_buffered_blocks: int
+        :param policy: Either 'raise' or 'block', what to do when a consumer
+                       needs a block while the buffer is full.
+        :type policy: str
+        :param timeout: Time in seconds a consumer waits for the buffer with
+                        the 'block' policy before raising a `BufferError`.
+                        Waits forever if None.
+        :type timeout: Optional[float]
+        """
+        if max_buffered_blocks < 1:
+            raise ValueError("max_buffered_blocks must be at least 1")
+        if policy not in ("raise", "block"):
+            raise ValueError(f"Unknown backpressure policy: {policy}")
+        self._blocks = blocks
+        self.num_streams = num_streams
+        self.max_buffered_blocks = max_buffered_blocks
+        self.policy = policy
+        self.timeout = timeout
+        # every slot holds a block and the number of consumers that still
+        # need it, the first slot has the absolute index self._base
+        self._slots: deque = deque()
+        self._base = 0
+        self._exhausted = False
+        self._active_consumers = num_streams
+        self._buffered_rows = 0
+        self._condition = threading.Condition()
+        self.high_water_mark = 0
+        self.high_water_rows = 0
+        if flatten_rows is None:
+            flatten_rows = [False] * num_streams
+        self.consumers = [StreamConsumer(self, i, flatten)
+                          for i, flatten in enumerate(flatten_rows)]
+
+    @property
+    def buffered_blocks(self) -> int:
+        return len(self._slots)
+
+    def _column(self, slot: int, stream: int) -> Optional[Any]:
+        """
+        Get the column of `stream` in the block with the absolute index
+        `slot`, reading new blocks as needed. Returns None at the end of the
+        input.
+        """
+        with self._condition:
+            while slot - self._base >= len(self._slots):
+                if self._exhausted:
+                    return None
+                if len(self._slots) >= self.max_buffered_blocks:
+                    if self.policy == "raise":
+                        raise BufferError(
+                            f"The consumer of stream {stream} is "
+                            f"{self.max_buffered_blocks} blocks ahead of the "
+                            "slowest consumer")
+                    if not self._condition.wait(self.timeout):
+                        raise BufferError(
+                            f"Timeout while the consumer of stream {stream} "
+                            "waited for the other consumers")
+                    continue
+                try:
+                    block = next(self._blocks)
+                except StopIteration:
+                    self._exhausted = True
+                    self._condition.notify_all()
+                    return None
+                rows = len(block[0]) if block else 0
+                self._slots.append([block, self._active_consumers, rows])
+                self._buffered_rows += rows
+                self.high_water_mark = max(self.high_water_mark,
+                                           len(self._slots))
+                self.high_water_rows = max(self.high_water_rows,
+                                           self._buffered_rows)
+            return self._slots[slot - self._base][0][stream]
+
+    def _release(self, first_slot: int, last_slot: int) -> None:
+        """
+        Mark the slots `first_slot` up to (excluding) `last_slot` as used by
+        one consumer and drop the blocks that are no longer needed
+        """
+        with self._condition:
+            for slot in range(max(first_slot, self._base),
+                              min(last_slot, self._base + len(self._slots))):
+                self._slots[slot - self._base][1] -= 1
+            released = False
+            while self._slots and self._slots[0][1] <= 0:
+                _, _, rows = self._slots.popleft()
+                self._buffered_rows -= rows
+                self._base += 1
+                released = True
+            if released:
+                self._condition.notify_all()
+
+    def _close_consumer(self, slot: int) -> None:
+        with self._condition:
+            self._active_consumers -= 1
+        self._release(slot, self._base + len(self._slots))
+
+
+class StreamConsumer:
+    """
+    Iterator over the rows of a single stream of a `StreamDemultiplexer`
+
+    Besides iterating over rows, the whole remainder of the current block
+    can be taken with `next_block`.
+    """
+
+    def __init__(self, demux: StreamDemultiplexer, stream: int,
+                 flatten_rows: bool = False):
+        self._demux = demux
+        self.stream = stream
+        self.flatten_rows = flatten_rows
+        self._slot = 0
+        self._row = 0
+        self._column: Optional[Any] = None
+        self._closed = False
+
+    def __iter__(self) -> "StreamConsumer":
+        return self
+
+    def _advance(self) -> bool:
+        """
+        Make sure that there is a current column with rows left, returns
+        False at the end of the stream
+        """
+        while self._column is None:
+            if self._closed:
+                return False
+            column = self._demux._column(self._slot, self.stream)
+            if column is None:
+                self.close()
+                return False
+            self._row = 0
+            if len(column) > 0:
+                self._column = column
+            else:
+                self._finish_column()
+        return True
+
+    def _finish_column(self) -> None:
+        """
+        Release the block of the current column as soon as its last row was
+        handed out, so that it does not stay in the buffer
+        """
+        self._column = None
+        self._demux._release(self._slot, self._slot + 1)
+        self._slot += 1
+
+    def __next__(self) -> Any:
+        if not self._advance():
+            raise StopIteration
+        column = self._column
+        tensor = column[self._row]
+        self._row += 1
+        if self._row >= len(column):
+            self._finish_column()
+        # absent elements of streams with a rate are None
+        if self.flatten_rows and tensor is not None:
+            return tensor.ravel(order="F")
+        return tensor
+
+    def next_block(self) -> Any:
+        """
+        Return the remaining rows of the current block of this stream
+
+        :raises StopIteration: At the end of the stream.
+        """
+        if not self._advance():
+            raise StopIteration
+        column = self._column
+        if self._row > 0:
+            column = column[self._row:]
+        self._finish_column()
+        return column
+
+    def iter_blocks(self) -> Iterator[Any]:
+        """
+        Iterate over the blocks of this stream
+        """
+        while True:
+            try:
+                yield self.next_block()
+            except StopIteration:
+                return
+
+    def close(self) -> None:
+        """
+        Stop consuming the stream, so that its blocks do not have to be
+        buffered any more
+        """
+        if not self._closed:
+            self._closed = True
+            self._demux._close_consumer(self._slot)
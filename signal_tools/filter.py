@@ -1,7 +1,9 @@
 from itertools import accumulate, repeat, starmap, tee
 from operator import add, mul
-from typing import Iterator, Iterable
+from typing import Iterator, Iterable, Optional, Union
 from numbers import Number
+import numpy as np
+from scipy import signal
 
 
 def _delayed_subtractor(delay: int, input: Iterable[Number]) -> Iterator[Number]:
@@ -42,6 +44,107 @@ def trapezoid_filter(rise_time: int,
     )
 
 
+class TrapezoidFilter:
+    """
+    Block based implementation of the trapezoid filter
+
+    Produces exactly the same output as `trapezoid_filter`, but processes
+    numpy arrays of many samples at once. The delay lines and the
+    accumulators are carried from one block to the next, so the output does
+    not depend on how the input is split into blocks.
+
+    The first axis of a block is the time, any further axes are channels that
+    are filtered independently of each other, so a block of shape
+    (n_samples, n_channels) filters n_channels signals in parallel.
+    """
+
+    def __init__(self, rise_time: int, trapezoid_len: int,
+                 decay_compensation: float):
+        """
+        :param rise_time: Delay of the first delayed subtractor, which sets
+            the rise time of the trapezoid.
+        :type rise_time: int, required
+        :param trapezoid_len: Delay of the second delayed subtractor.
+        :type trapezoid_len: int, required
+        :param decay_compensation: Factor compensating for the exponential
+            decay of the input pulses.
+        :type decay_compensation: float, required
+        """
+        if rise_time < 1 or trapezoid_len < 1:
+            raise ValueError("rise_time and trapezoid_len must be at least 1")
+        self.rise_time = rise_time
+        self.trapezoid_len = trapezoid_len
+        self.decay_compensation = decay_compensation
+        self.reset()
+
+    def reset(self) -> None:
+        """
+        Reset the filter into the state before the first sample
+        """
+        self._channel_shape: Optional[tuple] = None
+        self._rise_history: Optional[np.ndarray] = None
+        self._trapezoid_history: Optional[np.ndarray] = None
+        self._difference_sum: Optional[np.ndarray] = None
+        self._output_sum: Optional[np.ndarray] = None
+
+    def _init_state(self, block: np.ndarray) -> None:
+        channels = int(np.prod(block.shape[1:]))
+        self._channel_shape = block.shape[1:]
+        self._rise_history = np.zeros((self.rise_time, channels),
+                                      dtype=block.dtype)
+        self._trapezoid_history = np.zeros((self.trapezoid_len, channels),
+                                           dtype=block.dtype)
+        self._difference_sum = np.zeros((1, channels), dtype=block.dtype)
+        self._output_sum = None
+
+    @staticmethod
+    def _delayed_subtract(block: np.ndarray, history: np.ndarray):
+        """
+        Subtract the samples delayed by len(history) from the block,
+        returns the difference and the history for the next block
+        """
+        extended = np.concatenate((history, block))
+        delay = len(history)
+        return (extended[delay:] - extended[:len(block)],
+                extended[len(extended) - delay:])
+
+    def __call__(self, block: np.ndarray) -> np.ndarray:
+        """
+        Filter the next block of samples
+
+        :param block: The samples, with the time along the first axis.
+        :type block: np.ndarray
+        :return: The filtered samples in the same shape as the input.
+        :rtype: np.ndarray
+        """
+        block = np.asarray(block)
+        if self._channel_shape is None:
+            self._init_state(block)
+        elif block.shape[1:] != self._channel_shape:
+            raise ValueError(
+                f"Block with channels of shape {block.shape[1:]} given to a "
+                f"filter of channels with shape {self._channel_shape}")
+        samples = block.reshape(len(block), -1)
+        rise, self._rise_history = self._delayed_subtract(
+            samples, self._rise_history)
+        difference, self._trapezoid_history = self._delayed_subtract(
+            rise, self._trapezoid_history)
+        # prepending the carried sums keeps the summation order, and with
+        # it the rounding, identical to the sample by sample accumulation
+        difference_sum = np.cumsum(
+            np.concatenate((self._difference_sum, difference)), axis=0)[1:]
+        increments = difference * self.decay_compensation + difference_sum
+        if self._output_sum is None:
+            output = np.cumsum(increments, axis=0)
+        else:
+            output = np.cumsum(
+                np.concatenate((self._output_sum, increments)), axis=0)[1:]
+        if len(output) > 0:
+            self._difference_sum = difference_sum[-1:]
+            self._output_sum = output[-1:]
+        return output.reshape(block.shape)
+
+
 def g_h_filter(data: Iterable[float],
                initial_momentum: float,
                initial_state: float,
@@ -95,3 +198,350 @@ def g_h_filter(data: Iterable[float],
         momentum += h * residual
         state = prediction + g * residual
         yield state
+
+
+class GHFilter:
+    """
+    Block based g-h filter for many channels
+
+    Computes the same estimates as `g_h_filter`, but for blocks of
+    measurements of shape (n_samples, n_channels), or (n_samples,) for a
+    single channel. The recurrence is a second order linear filter, so it is
+    evaluated by `scipy.signal.lfilter` in compiled code. The state and the
+    momentum of every channel are carried from one block to the next and
+    are available as the `state` and `momentum` attributes.
+    """
+
+    def __init__(self, g: float, h: float, timestep: float = 1.,
+                 initial_state: Union[float, np.ndarray] = 0.,
+                 initial_momentum: Union[float, np.ndarray] = 0.):
+        """
+        :param g: Weight of the measurement in the state estimate, see
+            `g_h_filter`.
+        :type g: float, required
+        :param h: Weight of the measured change in the momentum estimate,
+            see `g_h_filter`.
+        :type h: float, required
+        :param timestep: The time difference between two measurments.
+        :type timestep: float
+        :param initial_state: The initial system state, either one value for
+            all channels or one per channel.
+        :type initial_state: Union[float, np.ndarray]
+        :param initial_momentum: The initial 'velocity' of the system, either
+            one value for all channels or one per channel.
+        :type initial_momentum: Union[float, np.ndarray]
+        """
+        self.g = g
+        self.h = h
+        self.timestep = timestep
+        self.state = np.asarray(initial_state, dtype=float)
+        self.momentum = np.asarray(initial_momentum, dtype=float)
+        # state space form x[n] = A x[n-1] + B z[n] with x = (state, momentum)
+        a11, a12 = 1 - g, (1 - g) * timestep
+        a21, a22 = -h, 1 - h * timestep
+        self._a = (a11, a12, a21, a22)
+        self._denominator = np.array([1., -(a11 + a22),
+                                      a11 * a22 - a12 * a21])
+        self._state_numerator = np.array([g, a12 * h - g * a22])
+        self._momentum_numerator = np.array([h, a21 * g - a11 * h])
+
+    def __call__(self, block: np.ndarray) -> np.ndarray:
+        """
+        Filter the next block of measurements
+
+        :param block: The measurements with the time along the first axis.
+        :type block: np.ndarray
+        :return: The estimated states in the same shape as the input.
+        :rtype: np.ndarray
+        """
+        block = np.asarray(block, dtype=float)
+        channel_shape = block.shape[1:]
+        state = np.broadcast_to(self.state, channel_shape).astype(float)
+        momentum = np.broadcast_to(self.momentum, channel_shape).astype(float)
+        if len(block) == 0:
+            return block.copy()
+        a11, a12, a21, a22 = self._a
+        determinant = self._denominator[2]
+        # initial conditions of the transposed direct form II that continue
+        # the recurrence from the carried state and momentum
+        state_zi = np.stack((a11 * state + a12 * momentum,
+                             -determinant * state))
+        momentum_zi = np.stack((a21 * state + a22 * momentum,
+                                -determinant * momentum))
+        states, _ = signal.lfilter(self._state_numerator, self._denominator,
+                                   block, axis=0, zi=state_zi)
+        momenta, _ = signal.lfilter(self._momentum_numerator,
+                                    self._denominator, block, axis=0,
+                                    zi=momentum_zi)
+        self.state = states[-1]
+        self.momentum = momenta[-1]
+        return states
+
+
+class BlockFilter:
+    """
+    Block based linear filter with FIR taps or IIR second order sections
+
+    The filter state of every channel is carried from one block to the next,
+    so the output is the same as filtering the whole signal at once with
+    `scipy.signal.lfilter` or `scipy.signal.sosfilt`, starting from a state
+    of zeros.
+
+    FIR filters with more than `fft_threshold` taps are computed by FFT
+    convolution: every block is convolved with the taps by overlap-add and
+    the tail of the convolution that reaches into the following samples is
+    added to the next block. The carried tail is the same as the state of
+    `scipy.signal.lfilter`, so short blocks are filtered directly with the
+    same state.
+
+    The first axis of a block is the time, any further axes are channels that
+    are filtered independently of each other.
+    """
+
+    def __init__(self, taps: Optional[np.ndarray] = None,
+                 sos: Optional[np.ndarray] = None,
+                 fft_threshold: int = 512):
+        """
+        :param taps: The coefficients of a FIR filter.
+        :type taps: Optional[np.ndarray]
+        :param sos: The second order sections of an IIR filter, one row of
+            b0, b1, b2, a0, a1, a2 per section as returned by
+            `scipy.signal.butter(..., output='sos')`.
+        :type sos: Optional[np.ndarray]
+        :param fft_threshold: FIR filters with more taps are computed by FFT
+            convolution of blocks that are at least as long as the filter.
+        :type fft_threshold: int
+        """
+        if (taps is None) == (sos is None):
+            raise ValueError("Either FIR taps or second order sections are "
+                             "needed")
+        if taps is not None:
+            taps = np.asarray(taps, dtype=float)
+            if taps.ndim != 1 or len(taps) == 0:
+                raise ValueError("The taps must be a non-empty 1D array")
+        if sos is not None:
+            sos = np.atleast_2d(np.asarray(sos, dtype=float))
+            if sos.ndim != 2 or sos.shape[1] != 6 or len(sos) == 0:
+                raise ValueError("The second order sections must have the "
+                                 "shape (n_sections, 6)")
+            if np.any(sos[:, 3] == 0):
+                raise ValueError("The coefficient a0 of every section must "
+                                 "not be 0")
+        self.taps = taps
+        self.sos = sos
+        self.fft_threshold = fft_threshold
+        self.reset()
+
+    def reset(self) -> None:
+        """
+        Reset the filter into the state before the first sample
+        """
+        self._channel_shape: Optional[tuple] = None
+        self._state: Optional[np.ndarray] = None
+
+    def _init_state(self, block: np.ndarray) -> None:
+        self._channel_shape = block.shape[1:]
+        if self.taps is not None:
+            shape = (len(self.taps) - 1,) + block.shape[1:]
+        else:
+            assert self.sos is not None
+            shape = (len(self.sos), 2) + block.shape[1:]
+        self._state = np.zeros(shape)
+
+    def _fft_filter(self, block: np.ndarray) -> np.ndarray:
+        """
+        Convolve a block with the taps by overlap-add and add the tail of
+        the previous blocks
+        """
+        assert self.taps is not None and self._state is not None
+        taps = self.taps.reshape((-1,) + (1,) * (block.ndim - 1))
+        convolved = signal.oaconvolve(block, taps, axes=0)
+        convolved[:len(self._state)] += self._state
+        self._state = convolved[len(block):]
+        return convolved[:len(block)]
+
+    def __call__(self, block: np.ndarray) -> np.ndarray:
+        """
+        Filter the next block of samples
+
+        :param block: The samples, with the time along the first axis.
+        :type block: np.ndarray
+        :return: The filtered samples in the same shape as the input.
+        :rtype: np.ndarray
+        """
+        block = np.asarray(block, dtype=float)
+        if self._channel_shape is None:
+            self._init_state(block)
+        elif block.shape[1:] != self._channel_shape:
+            raise ValueError(
+                f"Block with channels of shape {block.shape[1:]} given to a "
+                f"filter of channels with shape {self._channel_shape}")
+        if len(block) == 0:
+            return block.copy()
+        if self.sos is not None:
+            output, self._state = signal.sosfilt(self.sos, block, axis=0,
+                                                 zi=self._state)
+        elif len(self.taps) == 1:
+            output = block * self.taps[0]
+        elif len(self.taps) > self.fft_threshold \
+                and len(block) >= len(self.taps):
+            output = self._fft_filter(block)
+        else:
+            output, self._state = signal.lfilter(self.taps, [1.], block,
+                                                 axis=0, zi=self._state)
+        return output
+
+
+class Resampler:
+    """
+    Block based polyphase resampler by the rational factor up / down
+
+    Produces the same samples as `scipy.signal.resample_poly`: the input is
+    upsampled by `up`, low-pass filtered with a linear phase FIR filter and
+    downsampled by `down`. Only the outputs that are kept are computed, with
+    one of the `up` polyphase components of the filter each. The inputs that
+    the next outputs still need are carried from one block to the next, so
+    the output does not depend on how the input is split into blocks.
+
+    An output needs the inputs up to half a filter length after it, so the
+    outputs lag behind the inputs and `flush` returns the outputs of the
+    last samples once the input ended. Altogether a signal of n samples is
+    resampled to ceil(n * up / down) samples.
+
+    The first axis of a block is the time, any further axes are channels that
+    are resampled independently of each other.
+    """
+
+    def __init__(self, up: int, down: int, half_length: Optional[int] = None,
+                 window: Union[str, tuple] = ("kaiser", 5.0)):
+        """
+        :param up: The upsampling factor.
+        :type up: int, required
+        :param down: The downsampling factor.
+        :type down: int, required
+        :param half_length: Number of taps of the FIR filter on either side
+            of its center, 10 * max(up, down) after reducing the factors by
+            default, like `scipy.signal.resample_poly`.
+        :type half_length: Optional[int]
+        :param window: The window the filter is designed with, see
+            `scipy.signal.firwin`.
+        :type window: Union[str, tuple]
+        """
+        if up < 1 or down < 1:
+            raise ValueError("The resampling factors must be at least 1")
+        if half_length is not None and half_length < 1:
+            raise ValueError("The half length of the filter must be at "
+                             "least 1")
+        divisor = np.gcd(up, down)
+        self.up = up // divisor
+        self.down = down // divisor
+        max_rate = max(self.up, self.down)
+        if max_rate == 1:
+            # the samples are passed through unchanged
+            self.half_length = 0
+            taps = np.ones(1)
+        else:
+            self.half_length = 10 * max_rate if half_length is None \
+                else half_length
+            taps = signal.firwin(2 * self.half_length + 1, 1. / max_rate,
+                                 window=window) * self.up
+        # polyphase components, row p holds the taps p, p + up, ... in
+        # reverse order, so that they line up with a window of the inputs
+        self._width = -(-len(taps) // self.up)
+        padded = np.zeros(self._width * self.up)
+        padded[:len(taps)] = taps
+        self.taps = taps
+        self._phases = padded.reshape(self._width, self.up).T[:, ::-1].copy()
+        self.reset()
+
+    def reset(self) -> None:
+        """
+        Reset the resampler into the state before the first sample
+        """
+        self._channel_shape: Optional[tuple] = None
+        self._buffer: Optional[np.ndarray] = None
+        # global index of the first input in the buffer, the inputs before
+        # the first sample are zeros
+        self._base = -(self._width - 1)
+        self._inputs = 0
+        self._next = 0
+
+    def _init_state(self, block: np.ndarray) -> None:
+        self._channel_shape = block.shape[1:]
+        self._buffer = np.zeros((self._width - 1,) + block.shape[1:])
+
+    def _outputs(self, stop: int) -> np.ndarray:
+        """
+        Compute the outputs up to `stop` from the buffered inputs and drop
+        the inputs that aren't needed anymore
+        """
+        assert self._buffer is not None
+        count = max(stop - self._next, 0)
+        output = np.empty((count,) + self._buffer.shape[1:])
+        if count > 0:
+            windows = np.lib.stride_tricks.sliding_window_view(
+                self._buffer, self._width, axis=0)
+            for offset in range(min(self.up, count)):
+                position = (self._next + offset) * self.down \
+                    + self.half_length
+                start = position // self.up - (self._width - 1) - self._base
+                rows = len(range(offset, count, self.up))
+                # the outputs `up` apart use the same phase and inputs
+                # `down` apart
+                selected = windows[start:start + (rows - 1) * self.down + 1:
+                                   self.down]
+                output[offset::self.up] = selected @ \
+                    self._phases[position % self.up]
+        self._next += count
+        first = (self._next * self.down + self.half_length) // self.up \
+            - (self._width - 1)
+        if first > self._base:
+            self._buffer = self._buffer[first - self._base:]
+            self._base = first
+        return output
+
+    def __call__(self, block: np.ndarray) -> np.ndarray:
+        """
+        Resample the next block of samples
+
+        :param block: The samples, with the time along the first axis.
+        :type block: np.ndarray
+        :return: The resampled samples that the inputs so far determine, the
+            number of rows depends on the carried state.
+        :rtype: np.ndarray
+        """
+        block = np.asarray(block, dtype=float)
+        if self._channel_shape is None:
+            self._init_state(block)
+        elif block.shape[1:] != self._channel_shape:
+            raise ValueError(
+                f"Block with channels of shape {block.shape[1:]} given to a "
+                f"resampler of channels with shape {self._channel_shape}")
+        self._buffer = np.concatenate((self._buffer, block))
+        self._inputs += len(block)
+        # an output is complete once the last input it needs arrived
+        stop = -(-(self._inputs * self.up - self.half_length) // self.down)
+        return self._outputs(stop)
+
+    def flush(self) -> np.ndarray:
+        """
+        The outputs of the last samples, computed with zeros after the end of
+        the input. The resampler starts over afterwards.
+
+        :return: The remaining resampled samples.
+        :rtype: np.ndarray
+        """
+        if self._channel_shape is None:
+            return np.zeros(0)
+        assert self._buffer is not None
+        stop = -(-self._inputs * self.up // self.down)
+        if stop > self._next:
+            last = ((stop - 1) * self.down + self.half_length) // self.up
+            missing = last + 1 - (self._base + len(self._buffer))
+            if missing > 0:
+                self._buffer = np.concatenate((
+                    self._buffer,
+                    np.zeros((missing,) + self._buffer.shape[1:])))
+        output = self._outputs(stop)
+        self.reset()
+        return output
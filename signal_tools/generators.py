@@ -1,7 +1,22 @@
 from itertools import chain, repeat
-from typing import Callable, Generator, Tuple, Union, Iterator
+from typing import Callable, Generator, Iterable, Tuple, Union, Iterator
 import numpy as np
 from numpy._typing import NDArray
+from scipy import signal
+
+
+def _chunk_sizes(chunk_size: int,
+                 samples: Union[int, None]) -> Iterable[int]:
+    """
+    Sizes of the chunks needed to generate <samples> samples, an endless
+    sequence if <samples> is None
+    """
+    if samples is None:
+        return repeat(chunk_size)
+    full_chunks = samples // chunk_size
+    last_chunk = samples - full_chunks * chunk_size
+    return chain(repeat(chunk_size, full_chunks),
+                 [last_chunk] if last_chunk > 0 else [])
 
 
 def rngen(shape: Tuple[int],
@@ -13,21 +28,95 @@ def rngen(shape: Tuple[int],
 
     Generator generates random tensors in batches of <chunk_size>
     and yields them one after the other until <samples> have been generated
-    then terminates.
+    then terminates. `random_chunks` yields the batches themselves.
     """
-    delta = max(range_) - min(range_)
-    offset = min(range_)
-    if samples is not None:
-        full_chunks = samples // chunk_size
-        last_chunk_shape = [samples - (full_chunks * chunk_size)] + list(shape)
-        chunk_shapes = chain(repeat([chunk_size] + list(shape), full_chunks),
-                             [last_chunk_shape])
-    else:
-        chunk_shapes = repeat([chunk_size] + list(shape))
-    for chunk_shape in chunk_shapes:
-        rnums = np.random.rand(*chunk_shape) * delta + offset
-        for rt in rnums:
-            yield rt
+    for chunk in random_chunks("uniform", (min(range_), max(range_)), shape,
+                               chunk_size, samples):
+        yield from chunk
+
+
+# the distributions of `random_chunks` and their default parameters
+RANDOM_DISTRIBUTIONS = {"uniform": (0., 1.),
+                        "normal": (0., 1.),
+                        "poisson": (1.,)}
+
+
+def random_chunks(distribution: str,
+                  params: Tuple[float, ...],
+                  shape: Tuple[int, ...],
+                  chunk_size: int,
+                  samples: Union[int, None] = None,
+                  seed: Union[int, np.random.SeedSequence, None] = None
+                  ) -> Generator[NDArray, None, None]:
+    """
+    Generator of chunks of random tensors
+
+    Every chunk is drawn with a single call of the method <distribution> of
+    a `numpy.random.Generator`, e.g. uniform(low, high), normal(loc, scale)
+    or poisson(lam) for Poisson noise. Poisson noise is integer valued.
+
+    :param distribution: Name of the method of `numpy.random.Generator`
+        that the values are drawn from, see `RANDOM_DISTRIBUTIONS`.
+    :param params: Parameters of the distribution.
+    :param shape: Shape of the tensor of every sample.
+    :param chunk_size: Number of samples per generated chunk.
+    :param samples: Total number of samples, endless if None.
+    :param seed: Seed of the random number generator.
+    :return: Chunks of shape (chunk_size, *shape), the last one may be
+        shorter.
+    """
+    if distribution not in RANDOM_DISTRIBUTIONS:
+        raise ValueError(f"Unknown distribution {distribution}, choose one "
+                         f"of {', '.join(RANDOM_DISTRIBUTIONS)}")
+    rng = np.random.default_rng(seed)
+    draw = getattr(rng, distribution)
+    shape = tuple(shape)
+    for size in _chunk_sizes(chunk_size, samples):
+        yield draw(*params, size=(size,) + shape)
+
+
+def sine_chunks(amplitude: float,
+                period: float,
+                phase: float,
+                noise: float,
+                chunk_size: int,
+                samples: Union[int, None] = None,
+                seed: Union[int, np.random.SeedSequence, None] = None
+                ) -> Generator[NDArray[float], None, None]:
+    """
+    Generator of chunks of a sine with additive white gaussian noise
+
+    The k-th sample is amplitude * sin(2 pi k / period + phase) plus a
+    normally distributed value with the standard deviation <noise>.
+
+    :param amplitude: Amplitude of the sine.
+    :param period: Period of the sine in samples.
+    :param phase: Phase of the sine at the first sample in radians.
+    :param noise: Standard deviation of the noise, no noise if 0.
+    :param chunk_size: Number of samples per generated chunk.
+    :param samples: Total number of samples, endless if None.
+    :param seed: Seed of the random number generator.
+    :return: Chunks of shape (chunk_size,), the last one may be shorter.
+    """
+    if period <= 0:
+        raise ValueError("The period must be positive")
+    if noise < 0:
+        raise ValueError("The noise can not be negative")
+    rng = np.random.default_rng(seed)
+    step = 2 * np.pi / period
+    start = 0
+    for size in _chunk_sizes(chunk_size, samples):
+        # the phase is reduced to a period, so it stays exact for endless
+        # streams
+        chunk = np.arange(size) * step
+        chunk += phase + (start % period) * step
+        np.sin(chunk, out=chunk)
+        chunk *= amplitude
+        if noise > 0:
+            chunk += rng.normal(0., noise, size)
+        start += size
+        yield chunk
+
 
 distributions = {"uniform": np.random.rand,
                  "normal": np.random.normal,
@@ -59,12 +148,66 @@ def pulse_gen(rate: float,
                     pulse(pulse_height_dist(*dist_params), decay_const))
         sig_val: float = 0
         finished_pulses = []
-        for pulse in active_pulses:
+        for active_pulse in active_pulses:
             try:
-                sig_val += next(pulse)
+                sig_val += next(active_pulse)
             except StopIteration:
-                finished_pulses.append(pulse)
+                finished_pulses.append(active_pulse)
         # remove the pulses that have been exhausted
         for fp in finished_pulses:
             active_pulses.remove(fp)
         yield sig_val
+
+
+def poisson_pulse_gen(rate: float,
+                      decay_const: float,
+                      pulse_height_dist: str,
+                      dist_params: Tuple[float, ...],
+                      chunk_size: int,
+                      samples: Union[int, None] = None,
+                      seed: Union[int, None] = None
+                      ) -> Generator[NDArray[float], None, None]:
+    """
+    Generator of chunks of a signal made of exponentially decaying pulses
+
+    The pulses arrive as a Poisson process with <rate> pulses per sample on
+    average, and overlapping pulses add up (pile-up). The arrival times of a
+    whole chunk are drawn at once and the pulses are superimposed by a
+    recursive exponential filter, so the cost does not depend on the rate or
+    the decay constant. The pulse shape is h * exp(-(t - t0) / decay_const)
+    for a pulse of height h arriving at the time t0.
+
+    :param rate: Average number of pulses per sample.
+    :param decay_const: Decay constant of the pulses in samples.
+    :param pulse_height_dist: Name of the method of `numpy.random.Generator`
+        that the pulse heights are drawn from, e.g. 'normal' or 'exponential'.
+    :param dist_params: Parameters of the pulse height distribution.
+    :param chunk_size: Number of samples per generated chunk.
+    :param samples: Total number of samples, endless if None.
+    :param seed: Seed of the random number generator.
+    :return: Chunks of shape (chunk_size,), the last one may be shorter.
+    """
+    if rate < 0:
+        raise ValueError("The pulse rate can not be negative")
+    if decay_const <= 0:
+        raise ValueError("The decay constant must be positive")
+    rng = np.random.default_rng(seed)
+    draw_heights = getattr(rng, pulse_height_dist)
+    decay = np.exp(-1 / decay_const)
+    # state of the exponential filter carried from one chunk to the next
+    filter_state = np.zeros(1)
+    for size in _chunk_sizes(chunk_size, samples):
+        num_pulses = rng.poisson(rate * size)
+        arrivals = rng.uniform(0, size, num_pulses)
+        heights = draw_heights(*dist_params, size=num_pulses)
+        # a pulse arriving between two samples is first seen by the next one
+        first_samples = np.ceil(arrivals).astype(int)
+        heights = heights * np.exp(-(first_samples - arrivals) / decay_const)
+        in_chunk = first_samples < size
+        impulses = np.zeros(size)
+        np.add.at(impulses, first_samples[in_chunk], heights[in_chunk])
+        chunk, filter_state = signal.lfilter([1.], [1., -decay], impulses,
+                                             zi=filter_state)
+        # pulses arriving after the last sample start the next chunk
+        filter_state = filter_state + np.sum(heights[~in_chunk])
+        yield chunk
@@ -0,0 +1,506 @@
+"""
+Lazy operator graphs over the blocks of a stream
+
+An `Expression` starts at the metadata of a stream and describes the
+operators that are applied to it, one method call per operator::
+
+    expression = Expression(metadata).scale(2.).offset(-1.).clip(-1., 1.)
+
+Building an expression doesn't touch any data. Every operator computes the
+metadata of its output from the metadata of its input when it is added, so
+an operator that can't be applied to the stream, like a filter on a stream
+of variable length or a function that returns the wrong number of rows,
+raises a ValueError before any data flows.
+
+`Expression.compile` fuses all operators into a single block operator. It
+copies every block once and applies the elementwise operators in place on
+that copy, so a chain of operators costs no Python code per element. Large
+blocks are passed through consecutive elementwise operators in chunks of
+rows that stay in the cache, instead of once through the memory for every
+operator. Expressions share their operators with the expressions they were
+built from, so a common prefix can be extended in several ways, every
+compiled operator has its own filter state.
+"""
+from abc import ABC, abstractmethod
+from copy import deepcopy
+from itertools import islice
+from numbers import Integral, Real
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, \
+    Tuple
+import numpy as np
+from .binary_format import rows_to_block
+from .rates import SparseColumn
+from .operators import to_integers
+from .stream_utils import VALUE_TYPES, block_to_elements, stream_type
+
+# elementwise stages run on chunks of about this many elements, so that the
+# chunk stays in the cache while all of the stages are applied to it
+_chunk_elements = 1 << 16
+
+
+def _is_integer(value: Any) -> bool:
+    return isinstance(value, Integral) and not isinstance(value, bool)
+
+
+def _promote(type_: Any, values: Iterable[Real]) -> Any:
+    """
+    The type of a stream of `type_` after an elementwise operation with the
+    scalars `values`, integer streams keep their type if the values fit
+    into it and float streams keep their width
+    """
+    dtype = np.dtype(type_)
+    for value in values:
+        if _is_integer(value):
+            dtype = np.result_type(dtype, np.min_scalar_type(value))
+        else:
+            dtype = np.result_type(dtype, float(value))
+    return stream_type(dtype)
+
+
+class _Stage(ABC):
+    """
+    One operator of an expression
+
+    `output_metadata` is called once with the metadata of the input when the
+    stage is added to an expression and returns the metadata of the output.
+    Calling the stage transforms an array holding the rows of a block, or
+    the concatenated rows of a variable-length stream. `owned` tells if the
+    array may be modified in place, the stage returns the transformed array
+    and whether the caller owns it. Elementwise stages transform every
+    element independently of all others.
+    """
+    dtype: np.dtype
+    elementwise = False
+
+    @abstractmethod
+    def output_metadata(self, metadata: Dict[str, Any]) -> Dict[str, Any]:
+        ...
+
+    @abstractmethod
+    def __call__(self, array: np.ndarray,
+                 owned: bool) -> Tuple[np.ndarray, bool]:
+        ...
+
+    def _ufunc(self, ufunc: np.ufunc, array: np.ndarray,
+               *args: Any) -> np.ndarray:
+        return ufunc(array.astype(self.dtype, copy=False),
+                     *args).astype(self.dtype, copy=False)
+
+
+class _Scale(_Stage):
+    elementwise = True
+
+    def __init__(self, factor: Real):
+        self.factor = factor
+
+    def output_metadata(self, metadata: Dict[str, Any]) -> Dict[str, Any]:
+        metadata["type"] = _promote(metadata["type"], [self.factor])
+        self.dtype = np.dtype(metadata["type"])
+        return metadata
+
+    def __call__(self, array: np.ndarray,
+                 owned: bool) -> Tuple[np.ndarray, bool]:
+        if owned and array.dtype == self.dtype:
+            return np.multiply(array, self.factor, out=array), True
+        return self._ufunc(np.multiply, array, self.factor), True
+
+
+class _Offset(_Stage):
+    elementwise = True
+
+    def __init__(self, value: Real):
+        self.value = value
+
+    def output_metadata(self, metadata: Dict[str, Any]) -> Dict[str, Any]:
+        metadata["type"] = _promote(metadata["type"], [self.value])
+        self.dtype = np.dtype(metadata["type"])
+        return metadata
+
+    def __call__(self, array: np.ndarray,
+                 owned: bool) -> Tuple[np.ndarray, bool]:
+        if owned and array.dtype == self.dtype:
+            return np.add(array, self.value, out=array), True
+        return self._ufunc(np.add, array, self.value), True
+
+
+class _Clip(_Stage):
+    elementwise = True
+
+    def __init__(self, low: Optional[Real], high: Optional[Real]):
+        if low is None and high is None:
+            raise ValueError("clip needs a lower or an upper bound")
+        if low is not None and high is not None and low > high:
+            raise ValueError(f"The lower bound {low} of clip is larger than "
+                             f"the upper bound {high}")
+        self.low = low
+        self.high = high
+
+    def output_metadata(self, metadata: Dict[str, Any]) -> Dict[str, Any]:
+        bounds = [b for b in (self.low, self.high) if b is not None]
+        metadata["type"] = _promote(metadata["type"], bounds)
+        self.dtype = np.dtype(metadata["type"])
+        return metadata
+
+    def __call__(self, array: np.ndarray,
+                 owned: bool) -> Tuple[np.ndarray, bool]:
+        if not owned or array.dtype != self.dtype:
+            array = array.astype(self.dtype)
+        return np.clip(array, self.low, self.high, out=array), True
+
+
+class _Digitize(_Stage):
+    """
+    The same operation as `operators.Digitize`
+    """
+    elementwise = True
+
+    def __init__(self, lsb_magnitude: Real, dtype: Any = int):
+        if lsb_magnitude == 0:
+            raise ValueError("The lsb magnitude of digitize can not be 0")
+        if np.dtype(dtype).kind not in "iu":
+            raise ValueError(f"Values can only be digitized into integer "
+                             f"types, not {np.dtype(dtype)}")
+        self.lsb_magnitude = lsb_magnitude
+        self.dtype = np.dtype(dtype)
+
+    def output_metadata(self, metadata: Dict[str, Any]) -> Dict[str, Any]:
+        metadata["type"] = stream_type(self.dtype)
+        return metadata
+
+    def __call__(self, array: np.ndarray,
+                 owned: bool) -> Tuple[np.ndarray, bool]:
+        if owned and array.dtype.kind == "f":
+            quotient = np.divide(array, self.lsb_magnitude, out=array)
+        else:
+            quotient = np.divide(array, self.lsb_magnitude)
+        return to_integers(quotient, self.dtype), True
+
+
+class _Filter(_Stage):
+    def __init__(self, operator: Callable[[np.ndarray], np.ndarray],
+                 type_: type):
+        if type_ not in (int, float):
+            raise ValueError("The type of a filter must be int or float")
+        self.operator = operator
+        self.type = type_
+
+    def output_metadata(self, metadata: Dict[str, Any]) -> Dict[str, Any]:
+        if metadata["shape"][0] == -1:
+            raise ValueError("Filters can not be applied to streams of "
+                             "variable length")
+        metadata["type"] = self.type
+        self.dtype = np.dtype(self.type)
+        return metadata
+
+    def __call__(self, array: np.ndarray,
+                 owned: bool) -> Tuple[np.ndarray, bool]:
+        result = self.operator(array.astype(self.dtype, copy=False))
+        result = np.asarray(result).astype(self.dtype, copy=False)
+        if result.shape != array.shape:
+            raise ValueError(f"The filter returned a block of shape "
+                             f"{result.shape} for a block of shape "
+                             f"{array.shape}")
+        return result, owned or not np.may_share_memory(result, array)
+
+
+class _Function(_Stage):
+    def __init__(self, function: Callable[[np.ndarray], Any]):
+        self.function = function
+        self.shape: Tuple[int, ...] = ()
+        self.variable = False
+
+    def output_metadata(self, metadata: Dict[str, Any]) -> Dict[str, Any]:
+        self.variable = metadata["shape"][0] == -1
+        if self.variable:
+            probe = np.zeros(0, dtype=metadata["type"])
+        else:
+            probe = np.zeros((0,) + tuple(metadata["shape"]),
+                             dtype=metadata["type"])
+        try:
+            result = np.asarray(self.function(probe))
+        except Exception as e:
+            raise ValueError(f"The function can not be applied to a block "
+                             f"of the stream: {e}") from e
+        if result.ndim == 0 or len(result) != 0:
+            raise ValueError("The function has to return one row for every "
+                             "row of the block")
+        metadata["type"] = stream_type(result.dtype)
+        self.dtype = np.dtype(metadata["type"])
+        if self.variable:
+            if result.ndim != 1:
+                raise ValueError("Functions on streams of variable length "
+                                 "have to return one value per element")
+        else:
+            # blocks of streams with a single element may lose their axis
+            self.shape = result.shape[1:] or (1,)
+            metadata["shape"] = list(self.shape)
+        return metadata
+
+    def __call__(self, array: np.ndarray,
+                 owned: bool) -> Tuple[np.ndarray, bool]:
+        result = np.asarray(self.function(array))
+        result = result.astype(self.dtype, copy=False)
+        if self.variable:
+            expected = array.shape
+        else:
+            expected = (len(array),) + self.shape
+            if result.shape == expected[:1] and self.shape == (1,):
+                result = result.reshape(expected)
+        if result.shape != expected:
+            raise ValueError(f"The function returned a block of shape "
+                             f"{result.shape} instead of {expected}")
+        return result, owned or not np.may_share_memory(result, array)
+
+
+class FusedOperator:
+    """
+    Block operator that applies the stages of an expression one after the
+    other, see `Expression.compile`
+
+    Like the operators in `operators`, it takes the column of a stream in a
+    block and returns the transformed column. The columns of variable-length
+    streams are transformed as one array of all their elements and the
+    columns of variable-rate streams only on their present elements.
+    """
+
+    def __init__(self, stages: List[_Stage], metadata: Dict[str, Any]):
+        """
+        :param stages: The stages that are applied, owned by the operator.
+        :type stages: List[_Stage]
+        :param metadata: The metadata of the output stream.
+        :type metadata: Dict[str, Any]
+        """
+        self.stages = stages
+        self.metadata = metadata
+        # consecutive elementwise stages form one segment
+        self._segments: List[Tuple[bool, List[_Stage]]] = []
+        for stage in stages:
+            if self._segments and stage.elementwise \
+                    and self._segments[-1][0]:
+                self._segments[-1][1].append(stage)
+            else:
+                self._segments.append((stage.elementwise, [stage]))
+
+    @staticmethod
+    def _run(stages: List[_Stage], array: np.ndarray,
+             owned: bool) -> Tuple[np.ndarray, bool]:
+        for stage in stages:
+            array, owned = stage(array, owned)
+        return array, owned
+
+    def _run_chunked(self, stages: List[_Stage],
+                     array: np.ndarray) -> np.ndarray:
+        """
+        Apply elementwise stages to blocks of rows that fit into the cache,
+        instead of passing the whole array through the memory once per
+        stage
+        """
+        result = np.empty(array.shape, dtype=stages[-1].dtype)
+        rows = max(1, _chunk_elements * len(array) // array.size)
+        for start in range(0, len(array), rows):
+            chunk, _ = self._run(stages, array[start:start + rows], False)
+            result[start:start + rows] = chunk
+        return result
+
+    def _apply(self, array: np.ndarray) -> np.ndarray:
+        owned = False
+        for elementwise, stages in self._segments:
+            if elementwise and array.size > 2 * _chunk_elements:
+                array, owned = self._run_chunked(stages, array), True
+            else:
+                array, owned = self._run(stages, array, owned)
+        return array
+
+    def __call__(self, column: Any) -> Any:
+        if isinstance(column, SparseColumn):
+            return column.with_values(self(column.values))
+        if isinstance(column, list):
+            if not column:
+                return []
+            lengths = np.cumsum([len(row) for row in column])
+            values = self._apply(np.concatenate(column))
+            return np.split(values, lengths[:-1])
+        return self._apply(np.asarray(column))
+
+
+class Expression:
+    """
+    Lazily composed operators on the blocks of a stream
+
+    Every method that adds an operator returns a new expression and leaves
+    the expression it was called on unchanged. The `metadata` of an
+    expression is the metadata of the stream after all of its operators.
+    """
+
+    def __init__(self, metadata: Dict[str, Any]):
+        """
+        :param metadata: The metadata of the input stream, with the type as
+                         one of `stream_utils.VALUE_TYPES` and the shape as
+                         a list.
+        :type metadata: Dict[str, Any]
+        :raises ValueError: If streams can't have the type of the stream.
+        """
+        if metadata["type"] not in VALUE_TYPES.values():
+            raise ValueError(f"The type of the stream must be one of "
+                             f"{', '.join(VALUE_TYPES)}")
+        self.source = deepcopy(metadata)
+        if isinstance(self.source["shape"], int):
+            self.source["shape"] = [self.source["shape"]]
+        self.metadata = deepcopy(self.source)
+        self.stages: Tuple[_Stage, ...] = ()
+
+    def _then(self, stage: _Stage) -> "Expression":
+        expression = Expression.__new__(Expression)
+        expression.source = self.source
+        expression.metadata = stage.output_metadata(deepcopy(self.metadata))
+        expression.stages = self.stages + (stage,)
+        return expression
+
+    def scale(self, factor: Real) -> "Expression":
+        """
+        Multiply every element with `factor`, int streams stay int if
+        `factor` is an int
+        """
+        return self._then(_Scale(factor))
+
+    def offset(self, value: Real) -> "Expression":
+        """
+        Add `value` to every element, int streams stay int if `value` is an
+        int
+        """
+        return self._then(_Offset(value))
+
+    def clip(self, low: Optional[Real] = None,
+             high: Optional[Real] = None) -> "Expression":
+        """
+        Limit every element to the range from `low` to `high`, either bound
+        may be None
+        """
+        return self._then(_Clip(low, high))
+
+    def digitize(self, lsb_magnitude: Real,
+                 dtype: Any = int) -> "Expression":
+        """
+        Digitize like `operators.Digitize`, the stream becomes a stream of
+        the integer type `dtype`
+        """
+        return self._then(_Digitize(lsb_magnitude, dtype))
+
+    def filter(self, operator: Callable[[np.ndarray], np.ndarray],
+               type_: type = float) -> "Expression":
+        """
+        Apply a stateful block filter like `filter.TrapezoidFilter` or
+        `filter.GHFilter`
+
+        The filter gets the rows of every block as an array of `type_` with
+        the time along the first axis and has to return an array of the same
+        shape. Every compiled operator filters with its own copy of
+        `operator`.
+
+        :raises ValueError: For streams of variable length.
+        """
+        return self._then(_Filter(operator, type_))
+
+    def apply(self, function: Callable[[np.ndarray], Any]) -> "Expression":
+        """
+        Apply a NumPy function to the rows of every block
+
+        The function gets the rows of a block as an array of shape
+        (rows, *shape) and returns an array with the same number of rows,
+        its shape and type determine the metadata of the output. For
+        streams of variable length the function gets the elements of all
+        rows in one 1D array and has to return one value per element. The
+        function is called on a block without rows when it is added, so
+        errors show up before any data flows.
+
+        :raises ValueError: If the function fails on the stream or returns
+                            an unsupported array.
+        """
+        return self._then(_Function(function))
+
+    def compile(self) -> FusedOperator:
+        """
+        Fuse the operators into a single block operator
+
+        The operator carries the state of the filters from one block to the
+        next and can be pickled, so it can be used with
+        `parallel.ParallelBlockTransform`.
+        """
+        return FusedOperator(deepcopy(list(self.stages)),
+                             deepcopy(self.metadata))
+
+    def __call__(self, blocks: Iterable[Any]) -> Iterator[Any]:
+        """
+        Lazily transform the columns of the stream with a newly compiled
+        operator
+        """
+        operator = self.compile()
+        for column in blocks:
+            yield operator(column)
+
+    def _check_source(self, metadata: Dict[str, Any]) -> None:
+        shape = metadata["shape"]
+        if isinstance(shape, int):
+            shape = [shape]
+        if np.dtype(metadata["type"]) != np.dtype(self.source["type"]) \
+                or list(shape) != self.source["shape"] \
+                or metadata.get("rate") != self.source.get("rate"):
+            raise ValueError("The stream doesn't match the metadata the "
+                             "expression was built for")
+
+    def on_blocks(self, stream: Tuple[Dict[str, Any], Iterable[Any]]
+                  ) -> Tuple[Dict[str, Any], Iterator[Any]]:
+        """
+        Apply the expression to a stream given as its metadata and its
+        columns
+
+        :raises ValueError: If the metadata doesn't match the metadata the
+                            expression was built for.
+        """
+        self._check_source(stream[0])
+        return deepcopy(self.metadata), self(stream[1])
+
+    def on_stream(self, stream: Tuple[Dict[str, Any], Iterable[Any]],
+                  block_rows: int = 1024
+                  ) -> Tuple[Dict[str, Any], Iterator[Any]]:
+        """
+        Apply the expression to a stream given as its metadata and its rows,
+        like `stream_utils.apply_operator_on_stream`
+
+        The rows are gathered into blocks of `block_rows` rows, which are
+        transformed at once, and the transformed rows are yielded one by
+        one.
+
+        :raises ValueError: If the metadata doesn't match the metadata the
+                            expression was built for.
+        """
+        if block_rows < 1:
+            raise ValueError("block_rows must be at least 1")
+        self._check_source(stream[0])
+        return deepcopy(self.metadata), self._rows(stream[1], block_rows)
+
+    def _rows(self, rows: Iterable[Any], block_rows: int) -> Iterator[Any]:
+        operator = self.compile()
+        rows = iter(rows)
+        while True:
+            chunk = [[row] for row in islice(rows, block_rows)]
+            if not chunk:
+                return
+            column = operator(rows_to_block([self.source], chunk)[0])
+            yield from _column_rows(column)
+
+
+def _column_rows(column: Any) -> Iterable[Any]:
+    """
+    The rows of a column in the layout of the row iterators, with the
+    tensors flattened in column-major order
+    """
+    if isinstance(column, SparseColumn):
+        rows = [None] * len(column)
+        for i, element in zip(np.flatnonzero(column.present).tolist(),
+                              _column_rows(column.values)):
+            rows[i] = element
+        return rows
+    if isinstance(column, list):
+        return column
+    return list(block_to_elements(column))
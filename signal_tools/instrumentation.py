@@ -0,0 +1,235 @@
+"""
+Throughput and latency counters of the stages of a pipeline
+
+A `PipelineStats` object counts the rows and bytes that a command reads and
+writes and the time spent in every stage of the command:
+
+* 'read': blocked on reading the input
+* 'parse': parsing the input into blocks
+* 'operator': applying the operator of the command to the blocks
+* 'serialize': formatting the blocks for the output
+* 'write': blocked on writing the output
+
+The stages are timed exclusively, time spent in a stage that is entered
+while another one is active, like reading while parsing, only counts for
+the inner stage. So the stage with the most time is the bottleneck of the
+command, and comparing the 'read' and 'write' times of the commands of a
+pipeline shows which command the others wait for.
+
+A `PipelineStats` object may be shared by the threads of a command, like
+the worker thread that reads the blocks that a server publishes. The
+counters are updated with `count` and the stage times under a lock, and
+every thread times its own stages, so a stage only excludes the time of
+the stages nested in it on the same thread.
+
+The summaries are written to stderr as one JSON object per line, so they
+can be told apart from the output of the command and processed by other
+tools.
+"""
+from contextlib import contextmanager
+import io
+import json
+import os
+import sys
+import threading
+import time
+from typing import Any, Dict, Iterable, Iterator, List, Optional, TextIO
+
+STAGES = ("read", "parse", "operator", "serialize", "write")
+
+
+class PipelineStats:
+    """
+    Counters and stage timers of a command
+    """
+
+    def __init__(self, command: str, interval: Optional[float] = None,
+                 stream: Optional[TextIO] = None):
+        """
+        :param command: The name of the command in the reports.
+        :type command: str
+        :param interval: Seconds between periodic reports, only a final
+                         report is written if None.
+        :type interval: Optional[float]
+        :param stream: The stream the reports are written to, stderr if
+                       None.
+        :type stream: Optional[TextIO]
+        """
+        if interval is not None and interval <= 0:
+            raise ValueError("The report interval must be positive")
+        self.command = command
+        self.interval = interval
+        self.stream = stream
+        self.rows_in = 0
+        self.rows_out = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.seconds = {stage: 0. for stage in STAGES}
+        self.start = time.perf_counter()
+        self._last_report = self.start
+        # the active stages of every thread, with the time spent in the
+        # stages entered while they were active
+        self._local = threading.local()
+        # guards the counters and the stage times, which the threads of a
+        # command update concurrently
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """
+        Count the time until the block ends for the stage `name`
+        """
+        stack: List[List[float]] = self._local.__dict__.setdefault(
+            "stack", [])
+        start = time.perf_counter()
+        stack.append([start, 0.])
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            nested = stack.pop()[1]
+            with self._lock:
+                self.seconds[name] += elapsed - nested
+            if stack:
+                stack[-1][1] += elapsed
+
+    def count(self, rows_in: int = 0, rows_out: int = 0, bytes_in: int = 0,
+              bytes_out: int = 0) -> None:
+        """
+        Add to the counters, safe to call from several threads
+        """
+        with self._lock:
+            self.rows_in += rows_in
+            self.rows_out += rows_out
+            self.bytes_in += bytes_in
+            self.bytes_out += bytes_out
+
+    def timed(self, iterable: Iterable[Any], name: str) -> Iterator[Any]:
+        """
+        Iterate over `iterable`, counting the time spent in producing every
+        item for the stage `name`
+        """
+        iterator = iter(iterable)
+        while True:
+            with self.stage(name):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+            self.tick()
+
+    def tick(self) -> None:
+        """
+        Write a periodic report if the interval has passed since the last
+        one
+        """
+        if self.interval is None:
+            return
+        now = time.perf_counter()
+        if now - self._last_report >= self.interval:
+            self._last_report = now
+            self.report(final=False)
+
+    def summary(self, final: bool = True) -> Dict[str, Any]:
+        """
+        The counters as a dictionary of plain values
+        """
+        elapsed = time.perf_counter() - self.start
+        with self._lock:
+            counters = {"rows_in": self.rows_in, "rows_out": self.rows_out,
+                        "bytes_in": self.bytes_in,
+                        "bytes_out": self.bytes_out}
+            seconds = dict(self.seconds)
+        rows = max(counters["rows_in"], counters["rows_out"])
+        busy = {stage: seconds for stage, seconds in seconds.items()
+                if seconds > 0}
+        return {
+            "command": self.command,
+            "pid": os.getpid(),
+            "final": final,
+            "elapsed": round(elapsed, 6),
+            **counters,
+            "rows_per_second": round(rows / elapsed, 1) if elapsed else 0.,
+            "seconds": {stage: round(stage_seconds, 6)
+                        for stage, stage_seconds in seconds.items()},
+            "bottleneck": max(busy, key=busy.get) if busy else None,
+        }
+
+    def report(self, final: bool = True) -> None:
+        """
+        Write the summary as a line of JSON
+        """
+        stream = self.stream if self.stream is not None else sys.stderr
+        stream.write(json.dumps(self.summary(final)) + "\n")
+        stream.flush()
+
+
+class TimedReader(io.BufferedIOBase):
+    """
+    Binary input stream that counts the bytes read from `raw` and the time
+    blocked on reading it
+    """
+
+    def __init__(self, raw: Any, stats: PipelineStats):
+        super().__init__()
+        self.raw = raw
+        self.stats = stats
+
+    def readable(self) -> bool:
+        return True
+
+    @property
+    def closed(self) -> bool:
+        return self.raw.closed
+
+    def _count(self, data: Any) -> Any:
+        self.stats.count(bytes_in=len(data))
+        return data
+
+    def read(self, size: Optional[int] = -1) -> bytes:
+        with self.stats.stage("read"):
+            return self._count(self.raw.read(size))
+
+    def read1(self, size: int = -1) -> bytes:
+        with self.stats.stage("read"):
+            read1 = getattr(self.raw, "read1", self.raw.read)
+            return self._count(read1(size))
+
+    def readline(self, size: Optional[int] = -1) -> bytes:
+        with self.stats.stage("read"):
+            return self._count(self.raw.readline(size))
+
+    def readinto(self, buffer: Any) -> int:
+        with self.stats.stage("read"):
+            received = self.raw.readinto(buffer)
+        self.stats.count(bytes_in=received or 0)
+        return received
+
+
+class TimedWriter:
+    """
+    Output stream that counts the bytes, or characters for text streams,
+    written to `raw` and the time blocked on writing them
+    """
+
+    def __init__(self, raw: Any, stats: PipelineStats):
+        self.raw = raw
+        self.stats = stats
+
+    def write(self, data: Any) -> int:
+        with self.stats.stage("write"):
+            written = self.raw.write(data)
+        self.stats.count(bytes_out=len(data))
+        return written
+
+    def flush(self) -> None:
+        with self.stats.stage("write"):
+            self.raw.flush()
+
+    def close(self) -> None:
+        with self.stats.stage("write"):
+            self.raw.close()
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.raw, name)
@@ -1,3 +1,8 @@
+from io import StringIO
+from itertools import islice
+from typing import Iterator, List, Sequence, TextIO
+import numpy as np
+
 
 def readchunks(stream: StringIO, delimiter: str, fio_size: int = 256):
     buf = ""
@@ -6,3 +11,42 @@ def readchunks(stream: StringIO, delimiter: str, fio_size: int = 256):
         parts = buf.split(delimiter)
 
 
+def read_csv_blocks(text_stream: TextIO,
+                    delimiter: str,
+                    columns: Sequence[int],
+                    types: Sequence[type],
+                    block_rows: int = 65536) -> Iterator[List[np.ndarray]]:
+    """
+    Read the rows of a CSV file in blocks of typed column arrays
+
+    Every call to the parser converts up to <block_rows> lines at once
+    directly into the requested types, so only one block of lines is held in
+    memory regardless of the size of the file. Blank lines are skipped.
+
+    :param text_stream: The CSV data after the header line.
+    :type text_stream: TextIO
+    :param delimiter: The delimiter between the columns.
+    :type delimiter: str
+    :param columns: Indices of the columns to read, in the order in which
+        the arrays are returned.
+    :type columns: Sequence[int]
+    :param types: The type of every column in <columns>.
+    :type types: Sequence[type]
+    :param block_rows: Maximum number of rows per block.
+    :type block_rows: int
+    :return: Blocks with one array of shape (rows, 1) per column.
+    :rtype: Iterator[List[np.ndarray]]
+    """
+    fields = [f"c{i}" for i in range(len(columns))]
+    row_dtype = np.dtype(list(zip(fields, types)))
+    while True:
+        lines = list(islice(text_stream, block_rows))
+        if not lines:
+            return
+        if not any(line.strip() for line in lines):
+            continue
+        rows = np.loadtxt(lines, delimiter=delimiter, usecols=columns,
+                          dtype=row_dtype, ndmin=1, quotechar='"',
+                          comments=None)
+        yield [np.ascontiguousarray(rows[field]).reshape(-1, 1)
+               for field in fields]
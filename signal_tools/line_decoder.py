@@ -0,0 +1,345 @@
+"""
+Schema specialized decoding of the data lines of the text format
+
+A `DataLineDecoder` is built once for every combination of stream types and
+shapes and cached, so all readers of streams with the same metadata share
+it. It validates and converts whole blocks of lines: the characters of the
+block are checked with a few vectorized passes, every line is split into the
+tokens of its streams once, and the tokens of every stream are converted by
+a single numpy call.
+
+Blocks that do not pass the strict checks of this fast path, e.g. because of
+unusual separators, are decoded line by line with the data regex, which
+defines the accepted format and reports the first offending line.
+"""
+from functools import lru_cache
+import re
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+import numpy as np
+from .rates import ABSENT, SparseColumn
+from .stream_utils import VALUE_TYPES, elements_to_block, is_integer_type
+
+Block = List[Any]
+
+_digits = np.zeros(256, dtype=bool)
+_digits[ord("0"):ord("9") + 1] = True
+# characters a value may start with
+_value_start = _digits.copy()
+_value_start[[ord("+"), ord("-")]] = True
+# all characters that may appear in a data line
+_allowed = _value_start.copy()
+_allowed[[ord(c) for c in "eE., \t\r\n|"]] = True
+# streams with a rate may also hold the empty element sentinel
+_sparse_value_start = _value_start.copy()
+_sparse_value_start[ord(ABSENT)] = True
+_sparse_allowed = _allowed.copy()
+_sparse_allowed[ord(ABSENT)] = True
+
+
+class _Fallback(Exception):
+    """
+    The block has to be decoded line by line
+    """
+
+
+def data_regex(streams: List[Dict[str, Any]]) -> re.Pattern:
+    """
+    Generates the regular expression that a data line has to match for the
+    given stream metadata, see `SignalStreams._generate_data_regex`.
+    """
+    multi_val_next_pattern = r"((\s*,?\s*)%s){%d}"
+    int_pattern = r"[\+\-]?\d+"
+    float_pattern = r"[\+\-]?\d+(\.\d+)?([eE][\+\-]?\d+)?"
+    regex_parts = []
+    for stream in streams:
+        if isinstance(stream["shape"], int):
+            stream["shape"] = [stream["shape"]]
+        shape = tuple(stream["shape"])
+        num_elements = np.prod(shape) if shape[0] != -1 else 0
+        dtype = stream["type"]
+
+        if dtype not in VALUE_TYPES.values():
+            raise ValueError(f"Unsupported data type: {dtype}")
+        if is_integer_type(dtype):
+            value_pattern = int_pattern
+        else:
+            value_pattern = float_pattern
+        if shape[0] == -1:
+            part = rf"({value_pattern}(\s*,?\s*{value_pattern})*)?"
+        elif num_elements > 0:
+            part = value_pattern + \
+                (multi_val_next_pattern % (value_pattern, num_elements - 1))
+        else:
+            part = value_pattern
+        if stream.get("rate") is not None:
+            part = rf"({re.escape(ABSENT)}|{part})"
+        regex_parts.append(part)
+    return re.compile(r"\s*\|\s*".join(regex_parts))
+
+
+def _to_values(tokens: List[str], dtype: Any) -> np.ndarray:
+    """
+    Convert the tokens of a stream, the tokens of the text format are finite
+    numbers, so infinite floats only come from values outside of the range
+    of the type
+    """
+    with np.errstate(over="ignore"):
+        values = np.array(tokens, dtype=dtype)
+    if not is_integer_type(dtype) and not np.isfinite(values).all():
+        raise OverflowError("Value out of the range of the stream type")
+    return values
+
+
+def _format_error(line: str) -> ValueError:
+    return ValueError(f"Data line doesn't match the expected format: {line}")
+
+
+class DataLineDecoder:
+    """
+    Validates and converts blocks of data lines of one stream schema
+
+    Use `decoder_for` to get the cached decoder of a list of streams.
+    """
+
+    def __init__(self, schema: Tuple[Tuple[Hashable, Tuple[int, ...], bool],
+                                     ...]):
+        """
+        :param schema: The type and shape of every stream and if the stream
+                       has a rate, which allows empty elements.
+        :type schema: Tuple[Tuple[Hashable, Tuple[int, ...], bool], ...]
+        """
+        self.streams = [{"type": dtype, "shape": list(shape),
+                         "rate": 1 if sparse else None}
+                        for dtype, shape, sparse in schema]
+        # whole lines are matched, only a trailing separator may follow
+        self.pattern = re.compile(data_regex(self.streams).pattern
+                                  + r"\s*,?\s*")
+        self.types = [s["type"] for s in self.streams]
+        self.shapes = [s["shape"] for s in self.streams]
+        self.sizes = [int(np.prod(shape)) if shape[0] != -1 else -1
+                      for shape in self.shapes]
+        self.sparse = [sparse for _, _, sparse in schema]
+        self.has_sparse = any(self.sparse)
+        self.has_variable = -1 in self.sizes
+        self.width = sum(self.sizes) \
+            if not self.has_variable and not self.has_sparse else None
+        self._allowed = _sparse_allowed if self.has_sparse else _allowed
+        self._line_start = _sparse_value_start if self.has_sparse \
+            else _value_start
+
+    def decode(self, lines: List[str]) -> Block:
+        """
+        Decode data lines into a block
+
+        :param lines: The data lines, comments already removed.
+        :type lines: List[str]
+        :return: The parsed block.
+        :rtype: Block
+        :raises ValueError: If a data line doesn't match the expected format.
+        """
+        try:
+            return self._decode_fast(lines)
+        except _Fallback:
+            return self._decode_checked(lines)
+
+    def _check_characters(self, text: str) -> None:
+        """
+        Vectorized checks of the characters of a block that leave only
+        errors that the tokenization and the conversion detect
+        """
+        if not text.isascii():
+            raise _Fallback
+        chars = np.frombuffer(text.encode("ascii"), dtype=np.uint8)
+        if not self._allowed[chars].all():
+            raise _Fallback
+        # pad so that the neighbours of every character exist
+        newline = np.full(2, ord("\n"), dtype=np.uint8)
+        padded = np.concatenate((newline[:1], chars, newline))
+        # every line starts with a value or an empty element
+        line_starts = np.flatnonzero(padded[:-3] == ord("\n")) + 1
+        if not self._line_start[padded[line_starts]].all():
+            raise _Fallback
+        # decimal points are surrounded by digits
+        dots = np.flatnonzero(padded == ord(".")) if "." in text \
+            else np.zeros(0, dtype=np.intp)
+        if not (_digits[padded[dots - 1]].all()
+                and _digits[padded[dots + 1]].all()):
+            raise _Fallback
+        # a comma follows a digit and is followed by the next value,
+        # optionally after a single space
+        if "," in text:
+            commas = np.flatnonzero(padded == ord(","))
+            after = padded[commas + 1]
+            after = np.where(after == ord(" "), padded[commas + 2], after)
+            if not (_digits[padded[commas - 1]].all()
+                    and _value_start[after].all()):
+                raise _Fallback
+
+    def _tokenize(self, lines: List[str]) -> Tuple[List[List[str]],
+                                                   List[List[int]]]:
+        """
+        Split every line into the tokens of its streams, fixed-shape streams
+        need exactly their number of elements in every line. The lengths
+        hold the number of elements of every row of variable-length streams
+        and -1 for the absent elements of streams with a rate.
+        """
+        num_streams = len(self.sizes)
+        tokens: List[List[str]] = [[] for _ in range(num_streams)]
+        lengths: List[List[int]] = [[] for _ in range(num_streams)]
+        if num_streams == 1 and self.width is not None:
+            size = self.sizes[0]
+            stream_tokens = tokens[0]
+            for line in lines:
+                line_tokens = line.replace(",", " ").split()
+                if len(line_tokens) != size:
+                    raise _Fallback
+                stream_tokens += line_tokens
+            return tokens, lengths
+        if self.has_sparse:
+            return self._tokenize_sparse(lines, tokens, lengths)
+        streams = list(zip(self.sizes, tokens, lengths))
+        for line in lines:
+            parts = line.replace(",", " ").split("|")
+            if len(parts) != num_streams:
+                raise _Fallback
+            for part, (size, stream_tokens, stream_lengths) in zip(parts,
+                                                                   streams):
+                part_tokens = part.split()
+                if size == -1:
+                    stream_lengths.append(len(part_tokens))
+                elif len(part_tokens) != size:
+                    raise _Fallback
+                stream_tokens += part_tokens
+        return tokens, lengths
+
+    def _tokenize_sparse(self, lines: List[str], tokens: List[List[str]],
+                         lengths: List[List[int]]
+                         ) -> Tuple[List[List[str]], List[List[int]]]:
+        """
+        `_tokenize` for schemas with streams that may hold empty elements
+        """
+        streams = list(zip(self.sizes, self.sparse, tokens, lengths))
+        for line in lines:
+            parts = line.replace(",", " ").split("|")
+            if len(parts) != len(streams):
+                raise _Fallback
+            for part, (size, sparse, stream_tokens, stream_lengths) in zip(
+                    parts, streams):
+                part_tokens = part.split()
+                if sparse:
+                    if part_tokens == [ABSENT]:
+                        stream_lengths.append(-1)
+                        continue
+                    if size != -1 and len(part_tokens) != size:
+                        raise _Fallback
+                    stream_lengths.append(len(part_tokens))
+                elif size == -1:
+                    stream_lengths.append(len(part_tokens))
+                elif len(part_tokens) != size:
+                    raise _Fallback
+                stream_tokens += part_tokens
+        return tokens, lengths
+
+    def _decode_fast(self, lines: List[str]) -> Block:
+        if lines:
+            self._check_characters("".join(lines))
+        tokens, lengths = self._tokenize(lines)
+        return self._convert(len(lines), tokens, lengths)
+
+    def _convert(self, num_rows: int, tokens: List[List[str]],
+                 lengths: List[List[int]]) -> Block:
+        """
+        Convert the tokens of every stream into its column of the block
+        """
+        block = []
+        for dtype, shape, size, sparse, stream_tokens, stream_lengths in zip(
+                self.types, self.shapes, self.sizes, self.sparse, tokens,
+                lengths):
+            try:
+                values = _to_values(stream_tokens, dtype)
+            except (ValueError, OverflowError):
+                raise _Fallback
+            rows = num_rows
+            if sparse:
+                present = np.array(stream_lengths, dtype=int) >= 0
+                stream_lengths = [n for n in stream_lengths if n >= 0]
+                rows = len(stream_lengths)
+            if size == -1:
+                column = np.split(values, np.cumsum(stream_lengths[:-1])) \
+                    if rows else []
+            else:
+                column = elements_to_block(values.reshape(rows, size), shape)
+            block.append(SparseColumn(column, present) if sparse else column)
+        return block
+
+    def _line_tokens(self, line: str) -> Optional[List[List[str]]]:
+        """
+        The tokens of every stream of a line that matches the data regex,
+        None if the line holds the wrong number of elements
+        """
+        parts = line.replace(",", " ").split("|")
+        if len(parts) != len(self.sizes):
+            return None
+        stream_tokens = []
+        for part, size, sparse in zip(parts, self.sizes, self.sparse):
+            part_tokens = part.split()
+            if sparse and part_tokens == [ABSENT]:
+                stream_tokens.append(None)
+                continue
+            if size != -1 and len(part_tokens) != size:
+                return None
+            stream_tokens.append(part_tokens)
+        return stream_tokens
+
+    def _decode_checked(self, lines: List[str]) -> Block:
+        """
+        Validate and convert every line on its own, so that the first
+        offending line is reported
+        """
+        tokens: List[List[str]] = [[] for _ in self.sizes]
+        lengths: List[List[int]] = [[] for _ in self.sizes]
+        for line in lines:
+            stream_tokens = None
+            if self.pattern.fullmatch(line):
+                stream_tokens = self._line_tokens(line)
+            if stream_tokens is None:
+                raise _format_error(line)
+            try:
+                for dtype, part_tokens in zip(self.types, stream_tokens):
+                    if part_tokens is not None:
+                        _to_values(part_tokens, dtype)
+            except (ValueError, OverflowError):
+                raise _format_error(line)
+            for i, part_tokens in enumerate(stream_tokens):
+                if part_tokens is None:
+                    lengths[i].append(-1)
+                else:
+                    tokens[i] += part_tokens
+                    lengths[i].append(len(part_tokens))
+        return self._convert(len(lines), tokens, lengths)
+
+
+@lru_cache(maxsize=64)
+def _cached_decoder(schema: Tuple[Tuple[Hashable, Tuple[int, ...], bool],
+                                  ...]) -> DataLineDecoder:
+    return DataLineDecoder(schema)
+
+
+def decoder_for(streams: List[Dict[str, Any]]) -> DataLineDecoder:
+    """
+    The decoder of the data lines of the given streams, decoders are cached
+    by the types and shapes of the streams and if they have a rate
+
+    :param streams: The metadata of the streams.
+    :type streams: List[Dict[str, Any]]
+    :return: The decoder.
+    :rtype: DataLineDecoder
+    """
+    schema = []
+    for stream in streams:
+        shape = stream["shape"]
+        if isinstance(shape, int):
+            shape = [shape]
+        schema.append((stream["type"], tuple(shape),
+                       stream.get("rate") is not None))
+    return _cached_decoder(tuple(schema))
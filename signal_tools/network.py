@@ -0,0 +1,296 @@
+"""
+Publishing streams to subscribers over TCP and Unix sockets
+
+A `StreamServer` sends the blocks of a stream to every connected subscriber.
+Each subscriber first receives the metadata section and then the blocks
+that were published after it connected, in the text or the binary encoding.
+Every block is serialized once and shared by all subscribers.
+
+Subscribers that read slower than the blocks are published have a queue of
+up to `buffer_blocks` blocks. Once it is full, the 'block' policy makes the
+publisher wait for the subscriber, while the 'drop' policy drops the blocks
+that don't fit into the queue of that subscriber. Blocks are only dropped as
+a whole, so the subscriber always receives a valid stream.
+"""
+import asyncio
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from urllib.parse import urlsplit
+from .async_streams import AsyncSignalStreams
+from .binary_format import encode_frame
+from .instrumentation import PipelineStats
+from .parsers import Block, SignalStreams
+from .stream_utils import format_block, metadata_header
+
+POLICIES = ("block", "drop")
+
+
+def parse_address(address: str) -> Tuple[str, Any]:
+    """
+    Parse a socket address of the form 'tcp://host:port' or
+    'unix:///path/to/socket'
+
+    :param address: The address.
+    :type address: str
+    :return: The kind of the socket, 'tcp' or 'unix', and the host and port
+             or the path of the socket.
+    :rtype: Tuple[str, Any]
+    :raises ValueError: If the address is invalid.
+    """
+    parts = urlsplit(address)
+    if parts.scheme == "tcp":
+        try:
+            port = parts.port
+        except ValueError:
+            port = None
+        if not parts.hostname or port is None:
+            raise ValueError(f"TCP addresses need a host and a port: "
+                             f"{address}")
+        return "tcp", (parts.hostname, port)
+    if parts.scheme == "unix":
+        path = parts.netloc + parts.path
+        if not path:
+            raise ValueError(f"Unix socket addresses need a path: {address}")
+        return "unix", path
+    raise ValueError(f"Unsupported address, expected tcp://host:port or "
+                     f"unix:///path: {address}")
+
+
+class _Subscriber:
+    def __init__(self, writer: asyncio.StreamWriter, buffer_blocks: int):
+        self.writer = writer
+        self.queue: asyncio.Queue = asyncio.Queue(buffer_blocks)
+        self.sent = 0
+        self.dropped = 0
+        self.connected = True
+
+
+class StreamServer:
+    """
+    Publishes the blocks of a stream to the subscribers connected to a TCP
+    or Unix socket
+    """
+
+    def __init__(self, metadata: List[Dict[str, Any]],
+                 encoding: str = "bin", buffer_blocks: int = 16,
+                 policy: str = "block"):
+        """
+        :param metadata: The metadata of the published streams.
+        :type metadata: List[Dict[str, Any]]
+        :param encoding: 'bin' for binary frames or 'utf-8' for the text
+                         format.
+        :type encoding: str
+        :param buffer_blocks: Number of blocks that are queued for every
+                              subscriber.
+        :type buffer_blocks: int
+        :param policy: What happens if the queue of a subscriber is full,
+                       'block' waits for the subscriber, 'drop' drops the
+                       block for that subscriber.
+        :type policy: str
+        """
+        if encoding not in ("utf-8", "bin"):
+            raise ValueError(f"Unknown encoding: {encoding}")
+        if buffer_blocks < 1:
+            raise ValueError("buffer_blocks must be at least 1")
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown policy: {policy}, expected one of "
+                             f"{', '.join(POLICIES)}")
+        self.metadata = metadata
+        self.encoding = encoding
+        self.buffer_blocks = buffer_blocks
+        self.policy = policy
+        self.published = 0
+        self.subscribers: List[_Subscriber] = []
+        self._header = metadata_header(metadata, encoding).encode("utf-8")
+        self._types = [m["type"] for m in metadata]
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._tasks: List[asyncio.Task] = []
+        self._subscribed: Optional[asyncio.Condition] = None
+        self._closing = False
+
+    async def start(self, address: str) -> None:
+        """
+        Start to accept subscribers on the socket given by `address`, see
+        `parse_address`
+        """
+        kind, location = parse_address(address)
+        self._subscribed = asyncio.Condition()
+        if kind == "tcp":
+            self._server = await asyncio.start_server(
+                self._handle, location[0], location[1])
+        else:
+            self._server = await asyncio.start_unix_server(self._handle,
+                                                           location)
+
+    @property
+    def address(self) -> str:
+        """
+        The address the server listens on, with the actual port for TCP
+        sockets that were bound to port 0
+        """
+        if self._server is None:
+            raise ValueError("The server was not started yet")
+        name = self._server.sockets[0].getsockname()
+        if isinstance(name, tuple):
+            return f"tcp://{name[0]}:{name[1]}"
+        return f"unix://{name}"
+
+    async def _handle(self, reader: asyncio.StreamReader,
+                      writer: asyncio.StreamWriter) -> None:
+        if self._closing:
+            writer.close()
+            return
+        subscriber = _Subscriber(writer, self.buffer_blocks)
+        self._tasks.append(asyncio.current_task())
+        # registered before the first await, so that `close` can't miss it
+        self.subscribers.append(subscriber)
+        async with self._subscribed:
+            self._subscribed.notify_all()
+        try:
+            writer.write(self._header)
+            await writer.drain()
+            while True:
+                data = await subscriber.queue.get()
+                if data is None:
+                    break
+                writer.write(data)
+                await writer.drain()
+                subscriber.sent += 1
+        except (ConnectionError, OSError):
+            subscriber.connected = False
+            # keep emptying the queue, so that the publisher never waits
+            # for a subscriber that is gone
+            while await subscriber.queue.get() is not None:
+                subscriber.dropped += 1
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except (ConnectionError, OSError):
+                pass
+
+    async def wait_for_subscribers(self, count: int) -> None:
+        """
+        Wait until at least `count` subscribers connected
+        """
+        async with self._subscribed:
+            await self._subscribed.wait_for(
+                lambda: len(self.subscribers) >= count)
+
+    def _serialize(self, block: Block) -> bytes:
+        if self.encoding == "bin":
+            return encode_frame(self.metadata, block)
+        return format_block(block, self._types).encode("utf-8")
+
+    async def publish(self, block: Block) -> None:
+        """
+        Send a block to all subscribers
+
+        With the 'block' policy this waits until every subscriber has room
+        for the block in its queue.
+        """
+        data = self._serialize(block)
+        for subscriber in list(self.subscribers):
+            if self.policy == "drop" or not subscriber.connected:
+                try:
+                    subscriber.queue.put_nowait(data)
+                except asyncio.QueueFull:
+                    subscriber.dropped += 1
+            else:
+                await subscriber.queue.put(data)
+        self.published += 1
+
+    async def close(self) -> None:
+        """
+        Stop accepting subscribers, send the queued blocks and close all
+        connections
+        """
+        self._closing = True
+        if self._server is not None:
+            self._server.close()
+        for subscriber in self.subscribers:
+            await subscriber.queue.put(None)
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self._server is not None:
+            await self._server.wait_closed()
+
+    @property
+    def dropped(self) -> int:
+        """
+        Number of blocks that were dropped for all subscribers together
+        """
+        return sum(subscriber.dropped for subscriber in self.subscribers)
+
+
+async def serve_blocks(address: str, metadata: List[Dict[str, Any]],
+                       blocks: Iterable[Block], encoding: str = "bin",
+                       buffer_blocks: int = 16, policy: str = "block",
+                       subscribers: int = 1,
+                       stats: Optional[PipelineStats] = None
+                       ) -> StreamServer:
+    """
+    Publish the blocks of a stream on a socket until the blocks are
+    exhausted
+
+    The blocks are only read once `subscribers` subscribers connected. The
+    block iterator is advanced in a worker thread, so that reading from
+    files or pipes doesn't stop the server from serving its subscribers.
+    With `stats` the published rows are counted and publishing, including
+    waiting for slow subscribers, is timed as the 'write' stage. The stats
+    are shared with the worker thread, which times reading and parsing the
+    blocks.
+
+    :return: The closed server, with the statistics of the subscribers.
+    :rtype: StreamServer
+    """
+    server = StreamServer(metadata, encoding, buffer_blocks, policy)
+    await server.start(address)
+    loop = asyncio.get_running_loop()
+    try:
+        await server.wait_for_subscribers(subscribers)
+        iterator = iter(blocks)
+        end = object()
+        while True:
+            block = await loop.run_in_executor(None, next, iterator, end)
+            if block is end:
+                break
+            if stats is None:
+                await server.publish(block)
+                continue
+            with stats.stage("write"):
+                await server.publish(block)
+            stats.count(rows_out=SignalStreams._block_rows(block))
+            stats.tick()
+    finally:
+        await server.close()
+    return server
+
+
+async def subscribe(address: str, block_rows: int = 256,
+                    stats: Optional[PipelineStats] = None
+                    ) -> AsyncSignalStreams:
+    """
+    Connect to a `StreamServer` and read the metadata section of its stream
+
+    :param address: The address of the server, see `parse_address`.
+    :type address: str
+    :param block_rows: Number of rows that are parsed at once when the rows
+                       are iterated.
+    :type block_rows: int
+    :param stats: Counters of the received stream, see `AsyncSignalStreams`.
+    :type stats: Optional[PipelineStats]
+    :return: The parser of the received stream.
+    :rtype: AsyncSignalStreams
+    """
+    kind, location = parse_address(address)
+    if kind == "tcp":
+        reader, writer = await asyncio.open_connection(location[0],
+                                                       location[1])
+    else:
+        reader, writer = await asyncio.open_unix_connection(location)
+    try:
+        return await AsyncSignalStreams.open(reader, block_rows, writer,
+                                             stats)
+    except Exception:
+        writer.close()
+        raise
@@ -0,0 +1,84 @@
+"""
+Block operators used by the command line tools
+
+The operators are plain classes instead of closures, so that they can be
+sent to worker processes together with their state.
+"""
+from typing import Any, Callable
+import numpy as np
+from .rates import SparseColumn
+
+
+def to_integers(array: np.ndarray, dtype: Any = int) -> np.ndarray:
+    """
+    Truncate the values of `array` towards zero into integers of `dtype`,
+    values outside of the range of types narrower than 64 bit saturate at
+    its limits. A float `array` may be clipped in place.
+    """
+    dtype = np.dtype(dtype)
+    if dtype.itemsize < 8 and array.dtype.kind == "f":
+        if np.finfo(array.dtype).nmant < 8 * dtype.itemsize:
+            # the limits have to be exact in the type that is clipped
+            array = array.astype(float)
+        limits = np.iinfo(dtype)
+        array = np.clip(array, limits.min, limits.max, out=array)
+    return array.astype(dtype)
+
+
+class Digitize:
+    """
+    Digitize blocks like an ADC with a least significant bit of
+    `lsb_magnitude`, the values are truncated towards zero
+    """
+
+    def __init__(self, lsb_magnitude: float, dtype: Any = int):
+        """
+        :param lsb_magnitude: The value of the least significant bit.
+        :type lsb_magnitude: float
+        :param dtype: The integer type of the digitized values, values
+                      outside of its range saturate like an ADC.
+        :type dtype: Any
+        """
+        if np.dtype(dtype).kind not in "iu":
+            raise ValueError(f"Values can only be digitized into integer "
+                             f"types, not {np.dtype(dtype)}")
+        self.lsb_magnitude = lsb_magnitude
+        self.dtype = dtype
+
+    def _digitize(self, array: np.ndarray) -> np.ndarray:
+        array = np.asarray(array) / self.lsb_magnitude
+        return to_integers(array, self.dtype)
+
+    def __call__(self, block: Any) -> Any:
+        # variable-length streams come as a list of rows
+        if isinstance(block, list):
+            return [self._digitize(row) for row in block]
+        return self._digitize(block)
+
+
+class FloatInput:
+    """
+    Convert blocks to float before they are passed to `operator`
+    """
+
+    def __init__(self, operator: Callable[[np.ndarray], np.ndarray]):
+        self.operator = operator
+
+    def __call__(self, block: np.ndarray) -> np.ndarray:
+        return self.operator(np.asarray(block).astype(float, copy=False))
+
+
+class PresentElements:
+    """
+    Apply `operator` to the present elements of variable-rate columns only,
+    so that stateful operators see the samples of the stream one after the
+    other and absent elements cost nothing
+    """
+
+    def __init__(self, operator: Callable[[Any], Any]):
+        self.operator = operator
+
+    def __call__(self, block: Any) -> Any:
+        if isinstance(block, SparseColumn):
+            return block.with_values(self.operator(block.values))
+        return self.operator(block)
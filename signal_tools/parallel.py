@@ -0,0 +1,363 @@
+"""
+Execution of block operators and of the parser in worker processes
+"""
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import io
+import multiprocessing
+import os
+from pathlib import Path
+import queue
+import time
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, \
+    Tuple, Union
+from .binary_format import FRAME_HEADER, decode_frame
+from .parsers import SignalStreams, _LineDecoder, _comment_pattern
+from .stream_utils import concatenate_blocks
+
+Block = List[Any]
+
+# seconds between checks that a worker is still alive while waiting for it
+_poll_interval = 0.5
+
+
+def _transform_worker(operators: Dict[int, Callable[[Any], Any]],
+                      tasks: multiprocessing.Queue,
+                      results: multiprocessing.Queue) -> None:
+    """
+    Apply the operators to the columns of every task until a None task
+    arrives. The operators live in this process, so their state is carried
+    from one block to the next without being sent back.
+    """
+    for columns in iter(tasks.get, None):
+        start = time.perf_counter()
+        try:
+            transformed = {i: operators[i](column)
+                           for i, column in columns.items()}
+        except Exception as e:
+            results.put((None, e))
+            return
+        results.put((transformed, time.perf_counter() - start))
+
+
+class ParallelBlockTransform:
+    """
+    Applies stateful block operators to several streams of a block iterator
+
+    Every selected stream is owned by one worker process, which keeps the
+    operator of the stream and with it the state of the operator. The
+    columns of every block are sent to the workers owning them, and the
+    transformed blocks are reassembled and yielded in their original order.
+    Up to `max_pending_blocks` blocks are in flight at the same time, so
+    reading and writing the blocks overlaps with the work of the operators.
+
+    With a single job the operators are applied in the calling process.
+    """
+
+    def __init__(self, operators: Dict[int, Callable[[Any], Any]],
+                 jobs: int = 1, max_pending_blocks: int = 4):
+        """
+        :param operators: The operator of every transformed stream, by the
+                          index of the stream in the blocks. Each operator
+                          takes a column of a block and returns the
+                          transformed column with the same number of rows.
+        :type operators: Dict[int, Callable[[Any], Any]]
+        :param jobs: Number of worker processes, at most one per stream is
+                     used.
+        :type jobs: int
+        :param max_pending_blocks: Maximum number of blocks that are sent to
+                                   the workers before the oldest one is
+                                   collected.
+        :type max_pending_blocks: int
+        """
+        if jobs < 1:
+            raise ValueError("At least one job is needed")
+        if max_pending_blocks < 1:
+            raise ValueError("max_pending_blocks must be at least 1")
+        self.operators = operators
+        self.jobs = min(jobs, max(len(operators), 1))
+        self.max_pending_blocks = max_pending_blocks
+        self.rows = 0
+        self.operator_time = 0.
+
+    def __call__(self, blocks: Iterable[Block]) -> Iterator[Block]:
+        """
+        Transform the blocks
+
+        :param blocks: Blocks with one column per stream.
+        :type blocks: Iterable[Block]
+        :return: The blocks with the columns of the selected streams
+                 replaced by the output of their operator.
+        :rtype: Iterator[Block]
+        """
+        if self.jobs == 1:
+            return self._transform_inline(blocks)
+        return self._transform_parallel(blocks)
+
+    def _transform_inline(self, blocks: Iterable[Block]) -> Iterator[Block]:
+        for block in blocks:
+            block = list(block)
+            start = time.perf_counter()
+            for i, operator in self.operators.items():
+                block[i] = operator(block[i])
+            self.operator_time += time.perf_counter() - start
+            self.rows += len(block[0]) if block else 0
+            yield block
+
+    def _transform_parallel(self, blocks: Iterable[Block]
+                            ) -> Iterator[Block]:
+        # distribute the streams round robin over the workers
+        assignment: List[List[int]] = [[] for _ in range(self.jobs)]
+        for n, i in enumerate(sorted(self.operators)):
+            assignment[n % self.jobs].append(i)
+        context = multiprocessing.get_context()
+        workers = []
+        for streams in assignment:
+            tasks = context.Queue()
+            results = context.Queue()
+            process = context.Process(
+                target=_transform_worker,
+                args=({i: self.operators[i] for i in streams}, tasks,
+                      results),
+                daemon=True)
+            process.start()
+            workers.append((streams, process, tasks, results))
+
+        pending: deque = deque()
+        try:
+            for block in blocks:
+                for streams, _, tasks, _ in workers:
+                    tasks.put({i: block[i] for i in streams})
+                # the selected columns are replaced by the results anyway
+                pending.append([None if i in self.operators else column
+                                for i, column in enumerate(block)])
+                if len(pending) >= self.max_pending_blocks:
+                    yield self._collect(workers, pending.popleft())
+            while pending:
+                yield self._collect(workers, pending.popleft())
+            for _, process, tasks, _ in workers:
+                tasks.put(None)
+            for _, process, _, _ in workers:
+                process.join()
+        finally:
+            for _, process, tasks, results in workers:
+                if process.is_alive():
+                    process.terminate()
+                    process.join()
+                tasks.close()
+                results.close()
+
+    def _collect(self, workers: list, block: Block) -> Block:
+        """
+        Replace the columns of the oldest pending block by the results of
+        the workers
+        """
+        elapsed = 0.
+        for _, process, _, results in workers:
+            transformed, worker_time = self._result(process, results)
+            if transformed is None:
+                raise worker_time
+            for i, column in transformed.items():
+                block[i] = column
+            elapsed = max(elapsed, worker_time)
+        self.operator_time += elapsed
+        self.rows += len(block[0]) if block else 0
+        return block
+
+    @staticmethod
+    def _result(process: multiprocessing.Process,
+                results: multiprocessing.Queue) -> Any:
+        while True:
+            alive = process.is_alive()
+            try:
+                return results.get(timeout=_poll_interval)
+            except queue.Empty:
+                # only give up if the worker was already gone before the
+                # last attempt, so that no result in transit is missed
+                if not alive:
+                    raise RuntimeError(
+                        f"Worker process exited with code {process.exitcode}")
+
+
+def _parse_text_range(path: str, start: int, stop: int,
+                      streams: List[Dict[str, Any]]) -> Block:
+    """
+    Parse the data lines in the byte range `start` to `stop` of a text file
+    """
+    with open(path, "rb") as f:
+        f.seek(start)
+        data = f.read(stop - start)
+    lines = [line for line in io.TextIOWrapper(io.BytesIO(data),
+                                               encoding="utf-8")
+             if not ("#" in line and _comment_pattern.match(line))]
+    return SignalStreams._decode_lines(streams, lines)
+
+
+def _parse_frame_range(path: str, start: int, stop: int,
+                       streams: List[Dict[str, Any]]) -> Block:
+    """
+    Decode the binary frames in the byte range `start` to `stop` of a file
+    """
+    with open(path, "rb") as f:
+        f.seek(start)
+        data = memoryview(f.read(stop - start))
+    blocks = []
+    offset = 0
+    while offset < len(data):
+        size, rows = FRAME_HEADER.unpack_from(data, offset)
+        payload_start = offset + FRAME_HEADER.size
+        blocks.append(decode_frame(streams, rows,
+                                   data[payload_start:payload_start + size]))
+        offset = payload_start + size
+    if not blocks:
+        return SignalStreams._decode_lines(streams, [])
+    return concatenate_blocks(blocks)
+
+
+def _process_range(parse: Callable[..., Block], parse_args: tuple,
+                   function: Optional[Callable[..., Any]],
+                   args: tuple) -> Any:
+    """
+    Parse a byte range and apply `function` to the block in the worker
+    """
+    block = parse(*parse_args)
+    return block if function is None else function(block, *args)
+
+
+class ParallelFileReader:
+    """
+    Parses a stream file on disk with several worker processes
+
+    The metadata section is parsed once, then the data section is split
+    into byte ranges at line boundaries, or at frame boundaries for the
+    binary encoding. Every range is parsed into a block by one of the
+    workers and the blocks are yielded in the order of the file.
+    """
+
+    def __init__(self, path: Union[str, Path], jobs: Optional[int] = None,
+                 chunk_bytes: int = 1 << 24):
+        """
+        :param path: The stream file to read.
+        :type path: Union[str, Path]
+        :param jobs: Number of worker processes, the number of CPUs if None.
+        :type jobs: Optional[int]
+        :param chunk_bytes: Maximum size of the byte range that is parsed by
+                            a worker at once. Smaller ranges are used for
+                            small files so that every worker gets several.
+        :type chunk_bytes: int
+        """
+        if jobs is None:
+            jobs = os.cpu_count() or 1
+        if jobs < 1:
+            raise ValueError("At least one job is needed")
+        if chunk_bytes < 1:
+            raise ValueError("chunk_bytes must be at least 1")
+        self.path = Path(path)
+        self.jobs = jobs
+        with open(self.path, "rb") as f:
+            self.metadata, self.encoding = SignalStreams._parse_header(
+                _LineDecoder(f))
+            self.data_offset = f.tell()
+        self.streams = self.metadata["streams"]
+        data_size = os.path.getsize(self.path) - self.data_offset
+        self.chunk_bytes = min(chunk_bytes,
+                               max(data_size // (4 * jobs), 1 << 16))
+
+    def _text_ranges(self) -> Iterator[Tuple[int, int]]:
+        """
+        Byte ranges of about `chunk_bytes` that end after a newline
+        """
+        size = os.path.getsize(self.path)
+        with open(self.path, "rb") as f:
+            start = self.data_offset
+            while start < size:
+                f.seek(min(start + self.chunk_bytes, size) - 1)
+                f.readline()
+                stop = f.tell()
+                yield start, stop
+                start = stop
+
+    def _frame_ranges(self) -> Iterator[Tuple[int, int]]:
+        """
+        Byte ranges of whole frames of about `chunk_bytes`
+        """
+        size = os.path.getsize(self.path)
+        with open(self.path, "rb") as f:
+            start = offset = self.data_offset
+            while offset < size:
+                f.seek(offset)
+                header = f.read(FRAME_HEADER.size)
+                if len(header) < FRAME_HEADER.size:
+                    raise ValueError(
+                        "Binary stream ends inside of a frame header")
+                payload_size, _ = FRAME_HEADER.unpack(header)
+                offset += FRAME_HEADER.size + payload_size
+                if offset > size:
+                    raise ValueError("Binary stream ends inside of a frame")
+                if offset - start >= self.chunk_bytes or offset == size:
+                    yield start, offset
+                    start = offset
+
+    def _tasks(self) -> Iterator[Tuple[Callable[..., Block], tuple]]:
+        path = str(self.path)
+        if self.encoding == "bin":
+            for start, stop in self._frame_ranges():
+                yield _parse_frame_range, (path, start, stop, self.streams)
+        else:
+            for start, stop in self._text_ranges():
+                yield _parse_text_range, (path, start, stop, self.streams)
+
+    def map_ranges(self, function: Optional[Callable[..., Any]] = None,
+                   *args: Any) -> Iterator[Any]:
+        """
+        Parse every byte range into a block and apply
+        `function(block, *args)` to it in the worker that parsed it, so only
+        the results are sent back
+
+        At most two ranges per worker are processed ahead of the result that
+        is yielded, which bounds the memory needed for large files.
+
+        :param function: A picklable function applied to the block of every
+                         range, the blocks themselves are yielded if None.
+        :type function: Optional[Callable[..., Any]]
+        :param args: Further arguments of `function`, they have to be
+                     picklable too.
+        :return: The results of the ranges in the order of the file.
+        :rtype: Iterator[Any]
+        :raises ValueError: If a data line doesn't match the metadata.
+        """
+        if self.jobs == 1:
+            for parse, parse_args in self._tasks():
+                yield _process_range(parse, parse_args, function, args)
+            return
+        with ProcessPoolExecutor(max_workers=self.jobs) as executor:
+            pending: deque = deque()
+            try:
+                for parse, parse_args in self._tasks():
+                    pending.append(executor.submit(
+                        _process_range, parse, parse_args, function, args))
+                    if len(pending) >= 2 * self.jobs:
+                        yield pending.popleft().result()
+                while pending:
+                    yield pending.popleft().result()
+            finally:
+                for future in pending:
+                    future.cancel()
+
+    def iter_blocks(self) -> Iterator[Block]:
+        """
+        Iterate over the parsed blocks in the order of the file, see
+        `map_ranges`
+
+        :raises ValueError: If a data line doesn't match the metadata.
+        """
+        return self.map_ranges()
+
+    def read_all(self) -> Block:
+        """
+        Parse the whole file into a single block
+        """
+        blocks = list(self.iter_blocks())
+        if not blocks:
+            return SignalStreams._decode_lines(self.streams, [])
+        return concatenate_blocks(blocks)
@@ -1,18 +1,88 @@
-from itertools import tee
+import io
 import numpy as np
 import re
 import yaml
-from functools import partial
 from .stream_utils import validate_metadata
-from typing import TextIO, List, Dict, Any, Iterable, Tuple
+from .binary_format import BINARY_DATA_MARKER, read_frame
+from .demux import StreamConsumer, StreamDemultiplexer
+from .instrumentation import PipelineStats, TimedReader
+from .line_decoder import decoder_for
+from typing import BinaryIO, TextIO, List, Dict, Any, Iterator, \
+    Optional, Tuple, Union
+
+# A block holds the data of many rows for every stream. Fixed-shape streams
+# are stored as one contiguous array of shape (rows, *shape), variable-length
+# streams as a list with one 1D array per row.
+Block = List[Union[np.ndarray, List[np.ndarray]]]
+
+_comment_pattern = re.compile(r"^\s*#")
+
+
+class _LineDecoder:
+    """
+    Minimal text view of a binary stream that is used to read the metadata
+    section line by line without reading ahead into the data section
+    """
+    def __init__(self, binary_stream: BinaryIO):
+        self.binary_stream = binary_stream
+
+    def readline(self) -> str:
+        return self.binary_stream.readline().decode("utf-8")
 
 
 class SignalStreams:
-    def __init__(self, text_stream: TextIO):
-        self.text_stream = text_stream
-        self.metadata = SignalStreams._parse_metadata(self.text_stream)
+    def __init__(self, text_stream: Union[TextIO, BinaryIO],
+                 block_rows: int = 256,
+                 stats: Optional[PipelineStats] = None):
+        """
+        :param text_stream: The stream to read the signal data from. Binary
+                            streams may hold either the text or the binary
+                            encoding of the format, which is detected from
+                            the header. Text streams can only hold the text
+                            encoding.
+        :type text_stream: Union[TextIO, BinaryIO]
+        :param block_rows: Number of data lines that are parsed at once when
+                           iterating row by row. Use 1 for sources where
+                           latency matters more than throughput.
+        :type block_rows: int
+        :param stats: Counts the parsed rows, the bytes read and the time
+                      spent reading and parsing, if given.
+        :type stats: Optional[PipelineStats]
+        """
+        if block_rows < 1:
+            raise ValueError("block_rows must be at least 1")
+        self.block_rows = block_rows
+        self.stats = stats
+        if stats is not None and not isinstance(text_stream, io.TextIOBase) \
+                and not isinstance(text_stream, TimedReader):
+            text_stream = TimedReader(text_stream, stats)
+        self.binary_stream = None
+        if isinstance(text_stream, io.TextIOBase):
+            self.text_stream = text_stream
+            self.metadata, self.encoding = SignalStreams._parse_header(
+                self.text_stream)
+            if self.encoding == "bin":
+                raise ValueError("Binary stream data can only be read from "
+                                 "a binary input stream")
+        else:
+            self.metadata, self.encoding = SignalStreams._parse_header(
+                _LineDecoder(text_stream))
+            if self.encoding == "bin":
+                self.binary_stream = text_stream
+                self.text_stream = None
+            else:
+                self.text_stream = io.TextIOWrapper(text_stream,
+                                                    encoding="utf-8")
+        for stream in self.metadata["streams"]:
+            if isinstance(stream["shape"], int):
+                stream["shape"] = [stream["shape"]]
         self.num_streams = len(self.metadata["streams"])
-        self.data_pattern = self._generate_data_regex(self.metadata["streams"])
+        self.decoder = decoder_for(self.metadata["streams"])
+        self._block: Block = []
+        self._block_len = 0
+        self._block_pos = 0
+        self._frame: Block = []
+        self._frame_pos = 0
 
     @staticmethod
     def _readline_skip_comments(text_stream: TextIO) -> str:
@@ -53,109 +123,64 @@ class SignalStreams:
                             required attributes are missing or
                             have incorrect data types.
         """
+        return SignalStreams._parse_header(text_stream)[0]
+
+    @staticmethod
+    def _parse_header(text_stream: TextIO) -> Tuple[Dict[str, Any], str]:
+        """
+        Parses the metadata section and the line that starts the data section.
+
+        :param text_stream: The input text stream containing the metadata
+                            section.
+        :type text_stream: TextIO
+        :return: The parsed metadata and the encoding of the data section,
+                 'utf-8' for the text format or 'bin' for binary frames.
+        :rtype: Tuple[Dict[str, Any], str]
+        :raises ValueError: If the metadata format is invalid or the data
+                            section is missing.
+        """
         metadata_str = ""
         line = SignalStreams._readline_skip_comments(text_stream)
         if line.startswith("Metadata:"):
             line = SignalStreams._readline_skip_comments(text_stream)
             while not line.startswith("Data:"):
+                if not line:
+                    raise ValueError("The stream has no 'Data:' section")
                 metadata_str += line
                 line = SignalStreams._readline_skip_comments(text_stream)
         try:
             metadata = yaml.safe_load(metadata_str)
         except yaml.YAMLError as e:
             raise ValueError(f"Error parsing metadata: {e}")
-        if "streams" not in metadata or not isinstance(metadata["streams"], list):
+        if not isinstance(metadata, dict) or "streams" not in metadata \
+                or not isinstance(metadata["streams"], list):
             raise ValueError("Metadata must contain a list of streams")
 
         for stream in metadata["streams"]:
             validate_metadata(stream)
-        return metadata
-
-    @staticmethod
-    def _convert_type(stream: Dict[str, Any], value: str) -> Any:
-        """
-        Converts the given value string to the data type specified in the
-        stream dictionary.
-
-        :param stream: A dictionary containing the stream metadata, including
-                       the 'type' key.
-        :type stream: Dict[str, Any]
-        :param value: The value string to be converted.
-        :type value: str
-        :return: The converted value with the appropriate data type.
-        :rtype: Any
-        :raises ValueError: If the specified data type in the stream dictionary
-                            is not supported.
-        """
-        if stream["type"] == int:
-            return int(value)
-        elif stream["type"] == float:
-            return float(value)
+        if line.strip() == BINARY_DATA_MARKER:
+            encoding = "bin"
         else:
-            raise ValueError(f"Unsupported data type: {stream['type']}")
+            encoding = "utf-8"
+        return metadata, encoding
 
-    @staticmethod
-    def _generate_data_regex(streams: list[dict[str, Any]]) -> re.Pattern:
-        """
-        Generates a regular expression pattern for parsing data lines based on
-        the stream metadata.
-
-        This function generates a regular expression pattern to match and parse
-        data lines in the data section. The pattern is based on the information
-        provided in the metadata section. The function handles variable-length
-        streams (indicated by a shape of [-1]) and fixed-length streams.
-
-        :param streams: A list of dictionaries containing the metadata for each
-                        stream. Each dictionary should have a 'shape' and
-                        'type' key.
-        :type streams: list[dict[str, Any]]
-        :return: A compiled regular expression pattern for matching and parsing
-                 data lines.
-        :rtype: re.Pattern
-        """
-        multi_val_next_pattern = r"((\s*,?\s*)%s){%d}"
-        int_pattern = r"[\+\-]?\d+"
-        float_pattern = r"[\+\-]?\d+(\.\d+)?([eE][\+\-]?\d+)?"
-        regex_parts = []
-        for stream in streams:
-            if isinstance(stream["shape"], int):
-                stream["shape"] = [stream["shape"]]
-            shape = tuple(stream["shape"])
-            num_elements = np.prod(shape) if shape[0] != -1 else 0
-            dtype = stream["type"]
-
-            if dtype == int:
-                value_pattern = int_pattern
-            elif dtype == float:
-                value_pattern = float_pattern
-            else:
-                raise ValueError(f"Unsupported data type: {dtype}")
-            if shape[0] == -1:
-                regex_parts.append(
-                        rf"({value_pattern}(\s*,?\s*{value_pattern})*)?")
-            elif num_elements > 0:
-                regex_parts.append(
-                    value_pattern +
-                    (multi_val_next_pattern % (value_pattern, num_elements - 1)))
-            else:
-                regex_parts.append(value_pattern)
-        return re.compile(r"\s*\|\s*".join(regex_parts))
-
-    def split_into_individual_streams(self) -> list[Tuple[dict, Iterable]]:
+    def split_into_individual_streams(self, max_buffered_blocks: int = 64,
+                                      policy: str = "raise"
+                                      ) -> list[Tuple[dict, StreamConsumer]]:
         """
         Split the single data stream into many different data streams
-        """
-        print(list(enumerate(self.metadata["streams"])))
-        whole_data_streams = tee(iter(self), self.num_streams)
-        split_data_streams = []
 
-        def f(x, index):
-            return x[index]
-        indexed_f = [partial(f, index=i) for i in range(self.num_streams)]
-        split_data_streams = [map(idx_f, stream)
-                              for idx_f, stream in
-                              zip(indexed_f, whole_data_streams)]
-        return list(zip(self.metadata["streams"], split_data_streams))
+        The streams share one bounded buffer of parsed blocks, see
+        `StreamDemultiplexer` for the meaning of the parameters. The
+        demultiplexer is available as the `demux` attribute afterwards.
+        """
+        self.demux = StreamDemultiplexer(
+            self.iter_blocks(self.block_rows), self.num_streams,
+            flatten_rows=[s["shape"][0] != -1 and not self._is_matrix(s)
+                          for s in self.metadata["streams"]],
+            max_buffered_blocks=max_buffered_blocks,
+            policy=policy)
+        return list(zip(self.metadata["streams"], self.demux.consumers))
 
     def __iter__(self):
         """
@@ -168,36 +193,130 @@ class SignalStreams:
         """
         Returns the next parsed tensors from the data stream.
 
-        :return: A list of numpy arrays representing the parsed tensors.
+        The rows are views into blocks of `block_rows` rows that are parsed
+        at once.
+
+        :return: A list of numpy arrays representing the parsed tensors,
+                 None for absent elements of streams with a rate.
         :rtype: List[np.ndarray]
         :raises StopIteration: If the end of the data stream is reached.
         :raises ValueError: If the data line doesn't match the expected format.
         """
-        line = self._readline_skip_comments(self.text_stream)
-
-        if not line:
-            raise StopIteration
-
-        match = self.data_pattern.match(line)
-        if not match:
-            raise ValueError(
-                f"Data line doesn't match the expected format: {line}")
-
-        tensor_strings = match.string.replace(
-            ',', ' ').replace('\t', ' ').split('|')
-
+        if self._block_pos >= self._block_len:
+            self._block = self._next_block(self.block_rows)
+            self._block_len = self._block_rows(self._block)
+            self._block_pos = 0
+            if self._block_len == 0:
+                raise StopIteration
+        row = self._block_pos
+        self._block_pos += 1
         tensors = []
-        for stream_metadata, tensor_str in zip(self.metadata["streams"], tensor_strings):
-            data_values = tensor_str.split()
-            tensor_values = [
-                self._convert_type(stream_metadata, dv)
-                for dv in data_values
-            ]
-            if len(stream_metadata["shape"]) > 1 and stream_metadata["shape"][1] > 1:
-                tensor = np.array(tensor_values, dtype=stream_metadata["type"]).reshape(
-                    stream_metadata["shape"], order="F")
+        for stream_metadata, column in zip(self.metadata["streams"],
+                                           self._block):
+            tensor = column[row]
+            if tensor is None or isinstance(column, list) \
+                    or stream_metadata["shape"][0] == -1 \
+                    or self._is_matrix(stream_metadata):
                 tensors.append(tensor)
             else:
-                tensor = np.array(tensor_values, dtype=stream_metadata["type"])
-                tensors.append(tensor)
+                tensors.append(tensor.ravel(order="F"))
         return tensors
+
+    def iter_blocks(self, block_rows: int = 1024) -> Iterator[Block]:
+        """
+        Iterate over the data section in blocks of up to `block_rows` rows.
+
+        Every block is a list with one entry per stream. Fixed-shape streams
+        are returned as a contiguous array of shape (rows, *shape), where
+        every row holds the tensor in the same layout as the row iterator.
+        Variable-length streams are returned as a list of 1D arrays. Rows
+        that were already buffered by the row iterator are returned first.
+
+        :param block_rows: Maximum number of rows per block.
+        :type block_rows: int
+        :return: An iterator over the blocks of the data section.
+        :rtype: Iterator[Block]
+        :raises ValueError: If a data line doesn't match the expected format.
+        """
+        if block_rows < 1:
+            raise ValueError("block_rows must be at least 1")
+        if self._block_pos < self._block_len:
+            remainder = [column[self._block_pos:] for column in self._block]
+            self._block_pos = self._block_len
+            yield remainder
+        while True:
+            block = self._next_block(block_rows)
+            if self._block_rows(block) == 0:
+                return
+            yield block
+
+    def _next_block(self, block_rows: int) -> Block:
+        """
+        Read and parse up to `block_rows` rows from the input stream
+        """
+        if self.stats is None:
+            return self._read_block(block_rows)
+        with self.stats.stage("parse"):
+            block = self._read_block(block_rows)
+        self.stats.count(rows_in=self._block_rows(block))
+        return block
+
+    def _read_block(self, block_rows: int) -> Block:
+        if self.binary_stream is not None:
+            return self._next_frame_block(block_rows)
+        readline = self.text_stream.readline
+        lines = []
+        while len(lines) < block_rows:
+            line = readline()
+            if not line:
+                break
+            if "#" in line and _comment_pattern.match(line):
+                continue
+            lines.append(line)
+        return self.decoder.decode(lines)
+
+    def _next_frame_block(self, block_rows: int) -> Block:
+        """
+        Return up to `block_rows` rows of the current binary frame, reading
+        the next frame once the current one is used up
+        """
+        while self._frame_pos >= self._block_rows(self._frame):
+            frame = read_frame(self.binary_stream, self.metadata["streams"])
+            if frame is None:
+                return [[] for _ in self.metadata["streams"]]
+            self._frame = frame
+            self._frame_pos = 0
+        start = self._frame_pos
+        self._frame_pos = min(start + block_rows,
+                              self._block_rows(self._frame))
+        if start == 0 and self._frame_pos == self._block_rows(self._frame):
+            return self._frame
+        return [column[start:self._frame_pos] for column in self._frame]
+
+    @staticmethod
+    def _block_rows(block: Block) -> int:
+        """
+        Number of rows contained in a block
+        """
+        if not block:
+            return 0
+        return len(block[0])
+
+    @staticmethod
+    def _is_matrix(stream: Dict[str, Any]) -> bool:
+        """
+        Rows of streams with more than one column keep their tensor shape,
+        all other streams are handed out as flat 1D arrays.
+        """
+        return len(stream["shape"]) > 1 and stream["shape"][1] > 1
+
+    @staticmethod
+    def _decode_lines(streams: List[Dict[str, Any]],
+                      lines: List[str]) -> Block:
+        """
+        Validate data lines and parse them into a block with the cached
+        decoder of the stream schema
+
+        :raises ValueError: If a data line doesn't match the expected format.
+        """
+        return decoder_for(streams).decode(lines)
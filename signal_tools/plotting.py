@@ -0,0 +1,391 @@
+"""
+Plots of streams of any length with bounded memory
+
+The plots consume the blocks of a stream one after the other and keep only
+a decimated summary of the data, whose size follows from the size of the
+image instead of the number of rows:
+
+* 'xy' keeps the minimum and the maximum of every element of the stream in
+  about one bin per pixel column, and draws the envelope between them.
+* 'scatter' counts the points in a grid of one cell per pixel and draws
+  their density.
+* 'waterfall' keeps the mean of every element in about one bin per pixel
+  row and draws the elements over time as an image.
+* 'matrix' keeps the last element of the stream and draws it as an image.
+
+The bins of 'xy' and 'waterfall' cover a number of consecutive samples that
+doubles whenever the bins are full, and the grid of 'scatter' doubles its
+extent whenever a point falls outside of it, so streams of unknown length
+and range are handled. The images are drawn with matplotlib without pyplot,
+so no display is needed.
+"""
+from abc import ABC, abstractmethod
+import os
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+from .rates import present_values
+
+MODES = ("xy", "scatter", "waterfall", "matrix")
+
+# how the values of the samples of a bin are combined
+_reductions = {"min": np.minimum, "max": np.maximum, "sum": np.add}
+
+
+def _shape(stream: Dict[str, Any]) -> List[int]:
+    shape = stream["shape"]
+    return [shape] if isinstance(shape, int) else list(shape)
+
+
+class _Bins:
+    """
+    Reductions of consecutive samples in bins of `span` samples each
+
+    Once all `capacity` bins are used, neighbouring bins are merged and the
+    span doubles, so between capacity / 2 and capacity bins are used. Every
+    field is reduced with 'min', 'max', 'sum' or 'first', the value of the
+    first sample of the bin.
+    """
+
+    def __init__(self, capacity: int, fields: Dict[str, str]):
+        if capacity < 2:
+            raise ValueError("At least 2 bins are needed")
+        self.capacity = capacity
+        self.fields = fields
+        self.span = 1
+        self.count = 0
+        self.arrays: Dict[str, np.ndarray] = {}
+
+    @property
+    def used(self) -> int:
+        """
+        Number of bins that hold samples
+        """
+        return -(-self.count // self.span)
+
+    def counts(self) -> np.ndarray:
+        """
+        Number of samples in every used bin
+        """
+        counts = np.full(self.used, self.span)
+        if self.count % self.span:
+            counts[-1] = self.count % self.span
+        return counts
+
+    @staticmethod
+    def _combine(kind: str, old: np.ndarray, new: np.ndarray) -> np.ndarray:
+        if kind == "first":
+            return old
+        return _reductions[kind](old, new)
+
+    def _merge(self) -> None:
+        used = self.used
+        for name, kind in self.fields.items():
+            array = self.arrays[name]
+            even = array[0:used:2].copy()
+            odd = array[1:used:2]
+            array[:len(odd)] = self._combine(kind, even[:len(odd)], odd)
+            if len(even) > len(odd):
+                array[len(odd)] = even[-1]
+        self.span *= 2
+
+    def add(self, values: Dict[str, np.ndarray]) -> None:
+        """
+        Add the samples of a block, with the samples along the first axis of
+        the array of every field
+        """
+        rows = len(next(iter(values.values())))
+        if rows == 0:
+            return
+        if not self.arrays:
+            self.arrays = {name: np.empty((self.capacity,)
+                                          + values[name].shape[1:])
+                           for name in self.fields}
+        while (self.count + rows - 1) // self.span >= self.capacity:
+            self._merge()
+        first_bin = self.count // self.span
+        # the offsets of the samples that start a new bin
+        boundary = -self.count % self.span
+        starts = np.arange(boundary, rows, self.span)
+        if boundary != 0:
+            starts = np.concatenate(([0], starts))
+        for name, kind in self.fields.items():
+            block = values[name]
+            if kind == "first":
+                reduced = block[starts]
+            else:
+                reduced = _reductions[kind].reduceat(block, starts, axis=0)
+            array = self.arrays[name]
+            if self.count % self.span:
+                reduced[0] = self._combine(kind, array[first_bin],
+                                           reduced[0])
+            array[first_bin:first_bin + len(starts)] = reduced
+        self.count += rows
+
+
+class StreamPlot(ABC):
+    """
+    Base of the plots, which consume blocks holding all streams
+
+    Call `update` with every block of the stream, and `draw` or `save` at
+    any time to render the data that was seen so far.
+    """
+
+    def __init__(self, streams: List[Dict[str, Any]], y: int,
+                 x: Optional[int] = None,
+                 size: Tuple[int, int] = (800, 600)):
+        """
+        :param streams: The metadata of all streams of the blocks.
+        :type streams: List[Dict[str, Any]]
+        :param y: Index of the plotted stream.
+        :type y: int
+        :param x: Index of a stream with a single element that holds the x
+                  coordinates, the sample number of the plotted stream is
+                  used if None.
+        :type x: Optional[int]
+        :param size: Width and height of the image in pixels.
+        :type size: Tuple[int, int]
+        :raises ValueError: If the streams can't be plotted.
+        """
+        for index in (y, x):
+            if index is not None and not 0 <= index < len(streams):
+                raise ValueError(f"No stream with index {index}, "
+                                 f"{len(streams)} streams available")
+        if _shape(streams[y])[0] == -1:
+            raise ValueError("Streams of variable length can't be plotted")
+        if x is not None:
+            if int(np.prod(_shape(streams[x]))) != 1:
+                raise ValueError("The x stream must have a single element")
+            if streams[x].get("rate") is not None \
+                    or streams[y].get("rate") is not None:
+                raise ValueError("The x stream can't be used with streams "
+                                 "that have a rate")
+        if size[0] < 2 or size[1] < 2:
+            raise ValueError("The image needs at least 2x2 pixels")
+        self.streams = streams
+        self.y = y
+        self.x = x
+        # even sizes, so that bins and cells can be merged in pairs
+        self.size = (size[0] + size[0] % 2, size[1] + size[1] % 2)
+
+    def update(self, block: List[Any]) -> None:
+        """
+        Add the rows of a block to the plot
+        """
+        y = np.asarray(present_values(block[self.y]), dtype=float)
+        x = None
+        if self.x is not None:
+            x = np.asarray(block[self.x], dtype=float).reshape(-1)
+        self._add(y, x)
+
+    @abstractmethod
+    def _add(self, y: np.ndarray, x: Optional[np.ndarray]) -> None:
+        """
+        Add the values of the plotted stream and the x coordinates of a
+        block
+        """
+
+    @abstractmethod
+    def draw(self, axes: Any) -> None:
+        """
+        Draw the data seen so far on matplotlib axes
+        """
+
+    def save(self, path: str, dpi: int = 100) -> None:
+        """
+        Draw the data seen so far into an image file, whose format follows
+        from its extension
+
+        The file is replaced in a single step, so a viewer that reloads it
+        never sees a partially written image.
+        """
+        from matplotlib.figure import Figure
+        path = Path(path)
+        image_format = path.suffix[1:].lower() or "png"
+        figure = Figure(figsize=(self.size[0] / dpi, self.size[1] / dpi),
+                        dpi=dpi)
+        axes = figure.subplots()
+        self.draw(axes)
+        axes.set_title(self.streams[self.y].get("name", ""))
+        temporary = path.with_name(f".{path.name}.tmp")
+        figure.savefig(temporary, format=image_format)
+        os.replace(temporary, path)
+
+    def _x_label(self) -> str:
+        if self.x is None:
+            return "sample"
+        return self.streams[self.x].get("name", "")
+
+
+class EnvelopePlot(StreamPlot):
+    """
+    Line plot of every element of a stream, drawn as the envelope of the
+    minimum and the maximum of the samples of every pixel column
+    """
+
+    def __init__(self, *args: Any, **kwargs: Any):
+        super().__init__(*args, **kwargs)
+        self.bins = _Bins(2 * self.size[0],
+                          {"min": "min", "max": "max", "x": "first"})
+
+    def _add(self, y: np.ndarray, x: Optional[np.ndarray]) -> None:
+        y = y.reshape(len(y), -1)
+        if x is None:
+            x = np.arange(self.bins.count, self.bins.count + len(y),
+                          dtype=float)
+        self.bins.add({"min": y, "max": y, "x": x})
+
+    def draw(self, axes: Any) -> None:
+        used = self.bins.used
+        if used:
+            x = np.repeat(self.bins.arrays["x"][:used], 2)
+            low = self.bins.arrays["min"][:used]
+            high = self.bins.arrays["max"][:used]
+            for channel in range(low.shape[1]):
+                y = np.stack((low[:, channel], high[:, channel]), axis=1)
+                axes.plot(x, y.ravel(), linewidth=0.8)
+        axes.set_xlabel(self._x_label())
+
+
+class DensityPlot(StreamPlot):
+    """
+    Scatter plot of the elements of a stream over the x stream, drawn as the
+    number of points in every pixel
+    """
+
+    def __init__(self, *args: Any, **kwargs: Any):
+        super().__init__(*args, **kwargs)
+        self.counts = np.zeros(self.size, dtype=np.int64)
+        self.origin: Optional[np.ndarray] = None
+        self.cell: Optional[np.ndarray] = None
+        self.low = np.full(2, np.inf)
+        self.high = np.full(2, -np.inf)
+        self.samples = 0
+
+    def _grow(self, axis: int, down: bool) -> None:
+        """
+        Double the extent of the grid along an axis, towards lower values if
+        `down`, by merging neighbouring cells
+        """
+        cells = self.size[axis]
+        counts = np.moveaxis(self.counts, axis, 0)
+        merged = counts.reshape(cells // 2, 2, -1).sum(axis=1)
+        grown = np.zeros_like(counts)
+        if down:
+            self.origin[axis] -= cells * self.cell[axis]
+            grown[cells // 2:] = merged
+        else:
+            grown[:cells // 2] = merged
+        self.cell[axis] *= 2
+        self.counts = np.moveaxis(grown, 0, axis)
+
+    def _add(self, y: np.ndarray, x: Optional[np.ndarray]) -> None:
+        y = y.reshape(len(y), -1)
+        if x is None:
+            x = np.arange(self.samples, self.samples + len(y), dtype=float)
+        self.samples += len(y)
+        points = np.stack((np.repeat(x, y.shape[1]), y.ravel()), axis=1)
+        points = points[np.isfinite(points).all(axis=1)]
+        if len(points) == 0:
+            return
+        low, high = points.min(axis=0), points.max(axis=0)
+        self.low = np.minimum(self.low, low)
+        self.high = np.maximum(self.high, high)
+        sizes = np.array(self.size, dtype=float)
+        if self.origin is None:
+            extent = np.maximum(high - low, 1e-12 * np.abs(high))
+            extent[extent == 0] = 1.
+            # a little larger, so that the highest point is inside
+            self.cell = extent * (1 + 1e-9) / sizes
+            self.origin = np.where(high > low, low,
+                                   low - self.cell * sizes / 2)
+        for axis in range(2):
+            while low[axis] < self.origin[axis]:
+                self._grow(axis, True)
+            while high[axis] >= self.origin[axis] \
+                    + sizes[axis] * self.cell[axis]:
+                self._grow(axis, False)
+        indices = ((points - self.origin) / self.cell).astype(np.int64)
+        indices = np.minimum(indices, np.array(self.size) - 1)
+        flat = indices[:, 0] * self.size[1] + indices[:, 1]
+        self.counts += np.bincount(flat, minlength=self.counts.size) \
+            .reshape(self.size)
+
+    def draw(self, axes: Any) -> None:
+        if self.origin is not None:
+            end = self.origin + np.array(self.size) * self.cell
+            axes.imshow(np.ma.masked_equal(self.counts.T, 0),
+                        origin="lower", aspect="auto", norm="log",
+                        extent=(self.origin[0], end[0], self.origin[1],
+                                end[1]), interpolation="nearest")
+            # the grid may extend far beyond the points
+            for axis, set_limits in enumerate((axes.set_xlim,
+                                               axes.set_ylim)):
+                if self.high[axis] > self.low[axis]:
+                    set_limits(self.low[axis], self.high[axis])
+        axes.set_xlabel(self._x_label())
+
+
+class WaterfallPlot(StreamPlot):
+    """
+    The elements of a stream over time as an image, with the mean of the
+    samples of every pixel row
+    """
+
+    def __init__(self, *args: Any, **kwargs: Any):
+        super().__init__(*args, **kwargs)
+        self.bins = _Bins(2 * self.size[1], {"sum": "sum"})
+
+    def _add(self, y: np.ndarray, x: Optional[np.ndarray]) -> None:
+        self.bins.add({"sum": y.reshape(len(y), -1)})
+
+    def draw(self, axes: Any) -> None:
+        used = self.bins.used
+        if used:
+            means = self.bins.arrays["sum"][:used] \
+                / self.bins.counts()[:, np.newaxis]
+            axes.imshow(means, aspect="auto", interpolation="nearest",
+                        extent=(0, means.shape[1], self.bins.count, 0))
+        axes.set_xlabel("element")
+        axes.set_ylabel("sample")
+
+
+class MatrixPlot(StreamPlot):
+    """
+    The last element of a stream as an image
+    """
+
+    def __init__(self, *args: Any, **kwargs: Any):
+        super().__init__(*args, **kwargs)
+        if len(_shape(self.streams[self.y])) > 2:
+            raise ValueError("Only streams with one or two dimensions can be "
+                             "plotted as a matrix")
+        self.last: Optional[np.ndarray] = None
+
+    def _add(self, y: np.ndarray, x: Optional[np.ndarray]) -> None:
+        if len(y):
+            self.last = y[-1].copy()
+
+    def draw(self, axes: Any) -> None:
+        if self.last is not None:
+            axes.imshow(np.atleast_2d(self.last), aspect="auto",
+                        interpolation="nearest")
+
+
+_plots = {"xy": EnvelopePlot, "scatter": DensityPlot,
+          "waterfall": WaterfallPlot, "matrix": MatrixPlot}
+
+
+def make_plot(mode: str, streams: List[Dict[str, Any]], y: int,
+              x: Optional[int] = None,
+              size: Tuple[int, int] = (800, 600)) -> StreamPlot:
+    """
+    Create the plot of a mode, see `StreamPlot` for the arguments
+
+    :raises ValueError: If the mode is unknown or the streams can't be
+                        plotted in this mode.
+    """
+    if mode not in _plots:
+        raise ValueError(f"Unknown plot mode: {mode}, expected one of "
+                         f"{', '.join(MODES)}")
+    return _plots[mode](streams, y, x, size)
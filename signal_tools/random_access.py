@@ -0,0 +1,308 @@
+"""
+Random access to recorded stream files
+
+The file is memory mapped and a sparse row index is kept in a sidecar file
+next to it, so that any range of rows can be read without parsing the rows
+in front of it.
+"""
+import mmap
+import os
+import re
+from pathlib import Path
+from typing import Any, List, Tuple, Union
+import numpy as np
+from .binary_format import FRAME_HEADER, decode_frame
+from .line_decoder import decoder_for
+from .parsers import Block, SignalStreams, _LineDecoder
+from .rates import SparseColumn
+from .stream_utils import concatenate_blocks
+
+_scan_chunk_size = 1 << 24
+_whitespace = frozenset(b" \t\r\f\v")
+_comment_pattern = re.compile(rb"^\s*#")
+
+
+class MappedSignalFile:
+    """
+    Memory mapped, random access reader for stream files
+
+    The reader supports `len()`, indexing and slicing as well as
+    `read_rows(start, stop)`, which all return blocks in the same layout as
+    `SignalStreams.iter_blocks`. Both the text and the binary encoding are
+    supported.
+
+    The row index is sampled every `index_stride` rows and stored in a
+    sidecar file '<file>.idx.npz'. It is rebuilt if the file changed since
+    it was written. Reading rows touches the pages of at most `index_stride`
+    rows in front of the requested ones.
+    """
+
+    def __init__(self, path: Union[str, Path], index_stride: int = 1024,
+                 use_sidecar: bool = True):
+        """
+        :param path: The stream file to read.
+        :type path: Union[str, Path]
+        :param index_stride: Number of rows between two entries of the index.
+        :type index_stride: int
+        :param use_sidecar: Load the index from and save it to the sidecar
+                            file.
+        :type use_sidecar: bool
+        """
+        if index_stride < 1:
+            raise ValueError("index_stride must be at least 1")
+        self.path = Path(path)
+        self.index_stride = index_stride
+        self._file = open(self.path, "rb")
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0,
+                                  access=mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise ValueError(f"Cannot map the empty file {self.path}")
+        self.metadata, self.encoding = SignalStreams._parse_header(
+            _LineDecoder(self._map))
+        self.data_offset = self._map.tell()
+        self.streams = self.metadata["streams"]
+        self.decoder = decoder_for(self.streams)
+        self.sidecar_path = self.path.with_name(self.path.name + ".idx.npz")
+
+        index = self._load_index() if use_sidecar else None
+        if index is None:
+            index = self._build_index()
+            if use_sidecar:
+                self._save_index(index)
+        self._index_rows, self._index_offsets, self.num_rows = index
+
+    def close(self) -> None:
+        self._map.close()
+        self._file.close()
+
+    def __enter__(self) -> "MappedSignalFile":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        return self.num_rows
+
+    def __getitem__(self, key: Union[int, slice]) -> Union[Block,
+                                                           List[Any]]:
+        """
+        Read a single row, returned as one tensor per stream, or a slice of
+        rows, returned as a block
+        """
+        if isinstance(key, slice):
+            start, stop, step = key.indices(self.num_rows)
+            if step < 0:
+                block = self.read_rows(stop + 1, start + 1)
+                return [column[::-1][::-step] for column in block]
+            block = self.read_rows(start, stop)
+            if step == 1:
+                return block
+            return [column[::step] for column in block]
+        if key < 0:
+            key += self.num_rows
+        if not 0 <= key < self.num_rows:
+            raise IndexError("row index out of range")
+        return [column[0] for column in self.read_rows(key, key + 1)]
+
+    def read_rows(self, start: int, stop: int) -> Block:
+        """
+        Read the rows `start` to `stop` (exclusive) of the file
+
+        :param start: Index of the first row.
+        :type start: int
+        :param stop: Index after the last row.
+        :type stop: int
+        :return: The requested rows as a block.
+        :rtype: Block
+        """
+        start = max(0, min(start, self.num_rows))
+        stop = max(start, min(stop, self.num_rows))
+        entry = int(np.searchsorted(self._index_rows, start,
+                                    side="right")) - 1
+        row = int(self._index_rows[entry])
+        offset = int(self._index_offsets[entry])
+        if self.encoding == "bin":
+            return self._read_frames(row, offset, start, stop)
+        return self._read_lines(row, offset, start, stop)
+
+    def _read_lines(self, row: int, offset: int,
+                    start: int, stop: int) -> Block:
+        """
+        Read the text lines of the requested rows beginning at the indexed
+        line `row` that starts at `offset`
+        """
+        self._map.seek(offset)
+        readline = self._map.readline
+        lines = []
+        while row < stop:
+            line = readline()
+            if not line:
+                break
+            if b"#" in line and _comment_pattern.match(line):
+                continue
+            if row >= start:
+                lines.append(line.decode("utf-8"))
+            row += 1
+        return self.decoder.decode(lines)
+
+    def _read_frames(self, row: int, offset: int,
+                     start: int, stop: int) -> Block:
+        """
+        Decode the frames holding the requested rows beginning at the indexed
+        frame starting at `offset`, which holds `row` as its first row
+        """
+        blocks = []
+        while row < stop and offset < len(self._map):
+            size, frame_rows = FRAME_HEADER.unpack_from(self._map, offset)
+            payload_start = offset + FRAME_HEADER.size
+            if row + frame_rows > start:
+                with memoryview(self._map) as view:
+                    frame = decode_frame(
+                        self.streams, frame_rows,
+                        view[payload_start:payload_start + size])
+                    first = max(start - row, 0)
+                    last = min(stop - row, frame_rows)
+                    # copy the rows so that the map can be closed later
+                    blocks.append([
+                        column[first:last].copy()
+                        if isinstance(column, SparseColumn)
+                        else [np.array(r) for r in column[first:last]]
+                        if isinstance(column, list)
+                        else np.array(column[first:last])
+                        for column in frame])
+                    del frame
+            row += frame_rows
+            offset = payload_start + size
+        if not blocks:
+            return self.decoder.decode([])
+        return concatenate_blocks(blocks)
+
+    def _build_index(self) -> Tuple[np.ndarray, np.ndarray, int]:
+        if self.encoding == "bin":
+            return self._build_frame_index()
+        return self._build_line_index()
+
+    def _build_line_index(self) -> Tuple[np.ndarray, np.ndarray, int]:
+        """
+        Find the start of every data line with a vectorized newline search
+        over the map and keep every `index_stride`-th of them
+        """
+        size = len(self._map)
+        rows = []
+        offsets = []
+        num_rows = 0
+        position = self.data_offset
+        scan_size = _scan_chunk_size
+        while position < size:
+            count = min(scan_size, size - position)
+            chunk = np.frombuffer(self._map, dtype=np.uint8, count=count,
+                                  offset=position)
+            newlines = np.flatnonzero(chunk == ord("\n"))
+            if position + count < size:
+                # only complete lines, the rest is scanned with the next chunk
+                if len(newlines) == 0:
+                    scan_size *= 2
+                    del chunk
+                    continue
+                count = int(newlines[-1]) + 1
+            scan_size = _scan_chunk_size
+            starts = np.concatenate(([0], newlines + 1))
+            starts = starts[starts < count]
+            first_bytes = chunk[starts]
+            is_data = first_bytes != ord("#")
+            for i in np.flatnonzero(np.isin(first_bytes,
+                                            list(_whitespace))):
+                line_start = position + int(starts[i])
+                line_end = self._map.find(b"\n", line_start)
+                line = self._map[line_start:line_end if line_end != -1
+                                 else size]
+                is_data[i] = _comment_pattern.match(line) is None
+            data_starts = starts[is_data] + position
+            row_numbers = np.arange(num_rows, num_rows + len(data_starts))
+            sampled = row_numbers % self.index_stride == 0
+            rows.append(row_numbers[sampled])
+            offsets.append(data_starts[sampled])
+            num_rows += len(data_starts)
+            position += count
+            del chunk
+        return self._finish_index(rows, offsets, num_rows)
+
+    def _build_frame_index(self) -> Tuple[np.ndarray, np.ndarray, int]:
+        """
+        Walk the frame headers and keep the first frame that starts at or
+        after every multiple of `index_stride` rows
+        """
+        size = len(self._map)
+        rows = []
+        offsets = []
+        num_rows = 0
+        offset = self.data_offset
+        next_sample = 0
+        while offset + FRAME_HEADER.size <= size:
+            payload_size, frame_rows = FRAME_HEADER.unpack_from(self._map,
+                                                                offset)
+            if num_rows >= next_sample or not rows:
+                rows.append(num_rows)
+                offsets.append(offset)
+                next_sample = (num_rows // self.index_stride + 1) \
+                    * self.index_stride
+            num_rows += frame_rows
+            offset += FRAME_HEADER.size + payload_size
+        if offset > size or (offset < size and offset + FRAME_HEADER.size
+                             > size):
+            raise ValueError("Binary stream ends inside of a frame")
+        return self._finish_index([np.array(rows, dtype=np.int64)],
+                                  [np.array(offsets, dtype=np.int64)],
+                                  num_rows)
+
+    def _finish_index(self, rows: List[np.ndarray],
+                      offsets: List[np.ndarray],
+                      num_rows: int) -> Tuple[np.ndarray, np.ndarray, int]:
+        index_rows = np.concatenate(rows + [np.zeros(0, dtype=np.int64)])
+        index_offsets = np.concatenate(
+            offsets + [np.zeros(0, dtype=np.int64)])
+        if len(index_rows) == 0:
+            # an empty data section, reads start at the end of the header
+            index_rows = np.zeros(1, dtype=np.int64)
+            index_offsets = np.array([self.data_offset], dtype=np.int64)
+        return (index_rows.astype(np.int64), index_offsets.astype(np.int64),
+                num_rows)
+
+    def _file_signature(self) -> np.ndarray:
+        stat = os.stat(self.path)
+        return np.array([stat.st_size, stat.st_mtime_ns, self.index_stride],
+                        dtype=np.int64)
+
+    def _load_index(self) -> Union[Tuple[np.ndarray, np.ndarray, int], None]:
+        """
+        Load the index from the sidecar file if it belongs to the current
+        version of the stream file
+        """
+        if not self.sidecar_path.exists():
+            return None
+        try:
+            with np.load(self.sidecar_path) as sidecar:
+                if not np.array_equal(sidecar["signature"],
+                                      self._file_signature()):
+                    return None
+                return (sidecar["rows"], sidecar["offsets"],
+                        int(sidecar["num_rows"]))
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def _save_index(self, index: Tuple[np.ndarray, np.ndarray, int]) -> None:
+        """
+        Store the index in the sidecar file, a read-only location only means
+        that the index has to be rebuilt the next time
+        """
+        rows, offsets, num_rows = index
+        try:
+            with open(self.sidecar_path, "wb") as sidecar:
+                np.savez(sidecar, rows=rows, offsets=offsets,
+                         num_rows=np.int64(num_rows),
+                         signature=self._file_signature())
+        except OSError:
+            pass
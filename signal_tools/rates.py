@@ -0,0 +1,418 @@
+"""
+Variable-rate streams
+
+A stream with a ``rate`` in its metadata, its number of samples per second,
+doesn't need an element in every row. Rows without an element of the stream
+hold the empty element sentinel ``~`` in the text format and are flagged in
+the binary format, so slow streams can be stored next to fast ones without
+repeating their samples. The k-th element of a stream is the sample at the
+time k / rate.
+
+In blocks, the columns of these streams are `SparseColumn` objects, which
+hold the present elements as an ordinary column together with a mask of the
+rows they belong to. Operators are applied to the present elements only,
+see `operators.PresentElements`, and `RateAligner` interpolates streams to a common
+rate for operators that need one sample of every stream per row.
+"""
+from fractions import Fraction
+import math
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple, \
+    Union
+import numpy as np
+
+ABSENT = "~"
+METHODS = ("previous", "nearest", "linear")
+
+Column = Union[np.ndarray, List[np.ndarray]]
+
+
+def _take(values: Column, indices: np.ndarray) -> Column:
+    if isinstance(values, list):
+        return [values[i] for i in indices.tolist()]
+    return values[indices]
+
+
+def empty_column(stream: Dict[str, Any]) -> Column:
+    """
+    A column without rows of a stream
+    """
+    if stream["shape"][0] == -1:
+        return []
+    return np.empty((0,) + tuple(stream["shape"]), dtype=stream["type"])
+
+
+def _concatenate(columns: List[Column], empty: Column) -> Column:
+    if not columns:
+        return empty
+    if isinstance(columns[0], list):
+        return [row for column in columns for row in column]
+    return np.concatenate(columns)
+
+
+class SparseColumn:
+    """
+    The column of a variable-rate stream in a block
+
+    Indexing a row gives its element or None if the row has no element of
+    the stream, slicing gives the `SparseColumn` of the selected rows.
+    """
+    __slots__ = ("values", "present", "_rank")
+
+    def __init__(self, values: Column, present: np.ndarray):
+        """
+        :param values: The present elements in the layout of a column of a
+                       block, an array of shape (elements, *shape) or a list
+                       of 1D arrays for variable-length streams.
+        :type values: Column
+        :param present: One flag per row, if the row holds an element.
+        :type present: np.ndarray
+        """
+        self.values = values
+        self.present = np.asarray(present, dtype=bool)
+        self._rank: Optional[np.ndarray] = None
+        if len(values) != np.count_nonzero(self.present):
+            raise ValueError("The number of values doesn't match the number "
+                             "of present rows")
+
+    def __len__(self) -> int:
+        return len(self.present)
+
+    def __repr__(self) -> str:
+        return f"SparseColumn({self.values!r}, {self.present!r})"
+
+    def __getstate__(self) -> Tuple[Column, np.ndarray]:
+        return self.values, self.present
+
+    def __setstate__(self, state: Tuple[Column, np.ndarray]) -> None:
+        self.values, self.present = state
+        self._rank = None
+
+    @property
+    def rank(self) -> np.ndarray:
+        """
+        The index into the values of every row, valid for present rows
+        """
+        if self._rank is None:
+            self._rank = np.cumsum(self.present) - 1
+        return self._rank
+
+    def __getitem__(self, index: Union[int, slice]) -> Any:
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self.present))
+            if step == 1:
+                first = int(np.count_nonzero(self.present[:start]))
+                present = self.present[start:stop]
+                return SparseColumn(
+                    self.values[first:first + np.count_nonzero(present)],
+                    present)
+            rows = np.arange(start, stop, step)
+            present = self.present[rows]
+            return SparseColumn(_take(self.values, self.rank[rows[present]]),
+                                present)
+        if not self.present[index]:
+            return None
+        return self.values[int(self.rank[index])]
+
+    def with_values(self, values: Column) -> "SparseColumn":
+        """
+        A column with the same rows holding other values, e.g. the output of
+        an operator
+        """
+        return SparseColumn(values, self.present)
+
+    def copy(self) -> "SparseColumn":
+        if isinstance(self.values, list):
+            values = [np.array(row) for row in self.values]
+        else:
+            values = np.array(self.values)
+        return SparseColumn(values, self.present.copy())
+
+    @staticmethod
+    def concatenate(columns: List["SparseColumn"]) -> "SparseColumn":
+        return SparseColumn(
+            _concatenate([c.values for c in columns], columns[0].values[:0]),
+            np.concatenate([c.present for c in columns]))
+
+    @staticmethod
+    def from_elements(elements: List[Optional[np.ndarray]]
+                      ) -> "SparseColumn":
+        """
+        Build the column from one element or None per row, the values are a
+        list of the present elements
+        """
+        present = np.array([e is not None for e in elements], dtype=bool)
+        return SparseColumn([e for e in elements if e is not None], present)
+
+
+def stream_rate(stream: Dict[str, Any]) -> Optional[Fraction]:
+    """
+    The rate of a stream as an exact fraction, None for streams that have an
+    element in every row
+    """
+    if stream.get("rate") is None:
+        return None
+    return Fraction(stream["rate"]).limit_denominator(10 ** 6)
+
+
+def validate_rate(stream: Dict[str, Any]) -> None:
+    """
+    Check the optional rate of a stream
+
+    :raises ValueError: If the rate is not a positive number.
+    """
+    rate = stream.get("rate")
+    if rate is None:
+        return
+    if isinstance(rate, bool) or not isinstance(rate, (int, float)) \
+            or not np.isfinite(rate) or rate <= 0:
+        raise ValueError("The rate of a stream must be a positive number")
+
+
+def present_values(column: Any) -> Any:
+    """
+    The elements of a column that are present, the column itself for
+    streams with an element in every row
+    """
+    if isinstance(column, SparseColumn):
+        return column.values
+    return column
+
+
+def _tick_steps(rates: List[Fraction]) -> List[int]:
+    """
+    The distance between two samples of every stream in integer ticks of
+    a common clock, so that sample times can be compared exactly
+    """
+    clock = math.lcm(*(rate.numerator for rate in rates))
+    return [clock * rate.denominator // rate.numerator for rate in rates]
+
+
+def merge_streams(streams: List[Tuple[Dict[str, Any], Iterable[Column]]],
+                  block_rows: int = 1024) -> Iterator[List[SparseColumn]]:
+    """
+    Interleave streams of different rates into blocks of rows ordered by
+    time
+
+    Every stream is given as its metadata, which needs a rate, and an
+    iterator over blocks of its own samples. Every row of the result holds
+    the samples of all streams at one point in time, streams without a
+    sample at that time are absent in the row. The rows end with the last
+    sample of the longest stream.
+
+    :param streams: The metadata and the blocks of every stream.
+    :type streams: List[Tuple[Dict[str, Any], Iterable[Column]]]
+    :param block_rows: Maximum number of rows per block.
+    :type block_rows: int
+    :return: Blocks with a `SparseColumn` per stream.
+    :rtype: Iterator[List[SparseColumn]]
+    :raises ValueError: If a stream has no rate.
+    """
+    rates = [stream_rate(metadata) for metadata, _ in streams]
+    if None in rates:
+        raise ValueError("Every merged stream needs a rate")
+    steps = _tick_steps(rates)
+    iterators: List[Optional[Iterator[Column]]] = \
+        [iter(blocks) for _, blocks in streams]
+    pending: List[List[Column]] = [[] for _ in streams]
+    counts = [0] * len(streams)
+    # index of the first pending sample of every stream
+    starts = [0] * len(streams)
+
+    def pull(i: int) -> bool:
+        while iterators[i] is not None and counts[i] == starts[i]:
+            column = next(iterators[i], None)
+            if column is None:
+                iterators[i] = None
+            elif len(column):
+                pending[i].append(column)
+                counts[i] += len(column)
+        return counts[i] > starts[i]
+
+    while True:
+        available = [pull(i) for i in range(len(streams))]
+        if not any(available):
+            return
+        # rows up to the last pending sample of every unfinished stream are
+        # complete, later samples of finished streams can't follow
+        horizon = min((counts[i] - 1) * steps[i] for i in range(len(streams))
+                      if iterators[i] is not None and available[i]) \
+            if any(it is not None for it in iterators) else None
+        ticks = []
+        for i in range(len(streams)):
+            stream_ticks = np.arange(starts[i], counts[i],
+                                     dtype=np.int64) * steps[i]
+            if horizon is not None:
+                stream_ticks = stream_ticks[stream_ticks <= horizon]
+            ticks.append(stream_ticks)
+        rows = np.unique(np.concatenate(ticks))[:block_rows]
+        block = []
+        for i, stream_ticks in enumerate(ticks):
+            stream_ticks = stream_ticks[stream_ticks <= rows[-1]]
+            values = _concatenate(pending[i], empty_column(streams[i][0]))
+            used = len(stream_ticks)
+            pending[i] = [values[used:]] if used < len(values) else []
+            starts[i] += used
+            block.append(SparseColumn(values[:used],
+                                      np.isin(rows, stream_ticks)))
+        yield block
+
+
+class _Interpolator:
+    """
+    Interpolates the samples of one stream at the times of the target rate
+    """
+
+    def __init__(self, ratio: Fraction, method: str):
+        # the position of target sample n in the samples of the stream is
+        # n * ratio
+        self.numerator = ratio.numerator
+        self.denominator = ratio.denominator
+        self.method = method
+        self.values: Optional[Column] = None
+        self.base = 0
+        self.count = 0
+
+    def push(self, values: Column) -> None:
+        if len(values) == 0:
+            return
+        if self.values is None or len(self.values) == 0:
+            self.values = values
+        else:
+            self.values = _concatenate([self.values, values], values)
+        self.count += len(values)
+
+    def needed(self, targets: np.ndarray) -> np.ndarray:
+        """
+        The index of the last sample needed for every target sample
+        """
+        position = targets * self.numerator
+        if self.method == "nearest":
+            return (2 * position + self.denominator) \
+                // (2 * self.denominator)
+        index = position // self.denominator
+        if self.method == "linear":
+            index += (position % self.denominator) > 0
+        return index
+
+    def interpolate(self, targets: np.ndarray) -> Column:
+        position = targets * self.numerator
+        if self.method == "nearest":
+            index = (2 * position + self.denominator) \
+                // (2 * self.denominator)
+            return _take(self.values, index - self.base)
+        index = position // self.denominator
+        if self.method == "previous":
+            return _take(self.values, index - self.base)
+        fraction = (position % self.denominator) / self.denominator
+        lower = self.values[index - self.base].astype(float)
+        upper = self.values[np.minimum(index + 1, self.count - 1)
+                            - self.base]
+        fraction = fraction.reshape((-1,) + (1,) * (lower.ndim - 1))
+        return lower + fraction * (upper - lower)
+
+    def release(self, next_target: int) -> None:
+        """
+        Drop the samples that no target from `next_target` on needs
+        """
+        first = min(next_target * self.numerator // self.denominator,
+                    self.count)
+        if first > self.base and self.values is not None:
+            self.values = self.values[first - self.base:]
+            self.base = first
+
+
+class RateAligner:
+    """
+    Resamples variable-rate streams to a common rate
+
+    The aligner takes blocks of streams with a rate, as returned by the
+    parsers, and yields blocks in which every row holds one sample of every
+    stream at the times n / `rate`. The samples are taken from the last
+    sample before the time ('previous'), the closest sample ('nearest') or
+    linearly interpolated between the neighbouring samples ('linear'). The
+    rows end once a stream has no more samples for them.
+    """
+
+    def __init__(self, streams: List[Dict[str, Any]], rate: float,
+                 method: str = "linear"):
+        """
+        :param streams: The metadata of the streams, every stream needs a
+                        rate.
+        :type streams: List[Dict[str, Any]]
+        :param rate: The common rate of the output.
+        :type rate: float
+        :param method: One of 'previous', 'nearest' and 'linear'.
+        :type method: str
+        :raises ValueError: If a stream has no rate or can't be interpolated
+                            with the method.
+        """
+        if method not in METHODS:
+            raise ValueError(f"Unknown method: {method}, expected one of "
+                             f"{', '.join(METHODS)}")
+        validate_rate({"rate": rate})
+        target = Fraction(rate).limit_denominator(10 ** 6)
+        self.metadata = []
+        self._interpolators = []
+        for stream in streams:
+            stream_rate_ = stream_rate(stream)
+            if stream_rate_ is None:
+                raise ValueError(f"Stream {stream.get('name')} has no rate")
+            if method == "linear" and stream["shape"][0] == -1:
+                raise ValueError("Variable-length streams can't be "
+                                 "interpolated linearly")
+            metadata = dict(stream, rate=rate)
+            if method == "linear":
+                metadata["type"] = float
+            self.metadata.append(metadata)
+            self._interpolators.append(
+                _Interpolator(stream_rate_ / target, method))
+        self._next = 0
+
+    def _available(self) -> int:
+        """
+        The end of the range of target samples that can be computed
+        """
+        limit = None
+        for interpolator in self._interpolators:
+            if interpolator.count == 0:
+                return self._next
+            # first target that needs a sample past the last pushed one
+            end = interpolator.count * interpolator.denominator \
+                // interpolator.numerator + 2
+            if limit is None or end < limit:
+                limit = end
+        targets = np.arange(self._next, max(limit, self._next),
+                            dtype=np.int64)
+        valid = np.ones(len(targets), dtype=bool)
+        for interpolator in self._interpolators:
+            valid &= interpolator.needed(targets) < interpolator.count
+        return self._next + int(np.argmin(valid)) if not valid.all() \
+            else self._next + len(targets)
+
+    def _emit(self) -> Optional[List[Column]]:
+        stop = self._available()
+        if stop <= self._next:
+            return None
+        targets = np.arange(self._next, stop, dtype=np.int64)
+        block = [interpolator.interpolate(targets)
+                 for interpolator in self._interpolators]
+        self._next = stop
+        for interpolator in self._interpolators:
+            interpolator.release(self._next)
+        return block
+
+    def __call__(self, blocks: Iterable[List[Any]]) -> Iterator[List[Column]]:
+        """
+        Resample the blocks
+
+        :param blocks: Blocks holding the streams given to the constructor.
+        :type blocks: Iterable[List[Any]]
+        :return: Blocks of dense columns at the common rate.
+        :rtype: Iterator[List[Column]]
+        """
+        for block in blocks:
+            for interpolator, column in zip(self._interpolators, block):
+                interpolator.push(present_values(column))
+            aligned = self._emit()
+            if aligned is not None:
+                yield aligned
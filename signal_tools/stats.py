@@ -0,0 +1,413 @@
+"""
+One-pass statistics of streams with mergeable accumulators
+
+`StreamStatistics` computes the count, mean, variance, minimum, maximum,
+quantiles and optionally a histogram of every element of a stream while its
+blocks pass by, with memory that doesn't grow with the length of the
+stream. The accumulators of two parts of a stream can be merged into the
+accumulator of the whole stream, so parts can be processed by different
+workers, see `file_statistics`, or at different times.
+
+* `Moments` combines the mean and the sum of the squared deviations of
+  every block with the ones of the previous blocks, like Welford's
+  algorithm but for blocks instead of single values.
+* `Histogram` counts the values in fixed bins, which have to be equal to
+  merge two histograms.
+* `QuantileSketch` counts the values in buckets whose bounds grow
+  geometrically, so every quantile is estimated with a bounded relative
+  error, like DDSketch.
+"""
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple, \
+    Union
+import numpy as np
+from .parallel import ParallelFileReader
+from .rates import SparseColumn
+
+DEFAULT_QUANTILES = (0.01, 0.25, 0.5, 0.75, 0.99)
+
+
+class Moments:
+    """
+    Count, mean, variance, minimum and maximum of every element
+    """
+
+    def __init__(self, elements: int):
+        self.count = 0
+        self.mean = np.zeros(elements)
+        # sum of the squared deviations from the mean
+        self.m2 = np.zeros(elements)
+        self.minimum = np.full(elements, np.inf)
+        self.maximum = np.full(elements, -np.inf)
+
+    def _combine(self, count: int, mean: np.ndarray, m2: np.ndarray,
+                 minimum: np.ndarray, maximum: np.ndarray) -> None:
+        if count == 0:
+            return
+        total = self.count + count
+        delta = mean - self.mean
+        self.mean = self.mean + delta * (count / total)
+        self.m2 = self.m2 + m2 + delta ** 2 * (self.count * count / total)
+        self.count = total
+        self.minimum = np.minimum(self.minimum, minimum)
+        self.maximum = np.maximum(self.maximum, maximum)
+
+    def update(self, values: np.ndarray) -> None:
+        """
+        Add values of shape (samples, elements)
+        """
+        if len(values) == 0:
+            return
+        mean = values.mean(axis=0)
+        m2 = ((values - mean) ** 2).sum(axis=0)
+        self._combine(len(values), mean, m2, values.min(axis=0),
+                      values.max(axis=0))
+
+    def merge(self, other: "Moments") -> None:
+        self._combine(other.count, other.mean, other.m2, other.minimum,
+                      other.maximum)
+
+    @property
+    def variance(self) -> np.ndarray:
+        """
+        The variance of the population of every element
+        """
+        if self.count == 0:
+            return np.full_like(self.mean, np.nan)
+        return self.m2 / self.count
+
+
+class Histogram:
+    """
+    Number of values in `bins` equal bins from `low` to `high` of every
+    element, with separate counts of the values below and above the range
+    """
+
+    def __init__(self, elements: int, bins: int, low: float, high: float):
+        if bins < 1:
+            raise ValueError("A histogram needs at least one bin")
+        if not low < high:
+            raise ValueError("The lower end of the histogram range must be "
+                             "below the upper end")
+        self.bins = bins
+        self.low = low
+        self.high = high
+        self.counts = np.zeros((elements, bins), dtype=np.int64)
+        self.underflow = np.zeros(elements, dtype=np.int64)
+        self.overflow = np.zeros(elements, dtype=np.int64)
+
+    @property
+    def edges(self) -> np.ndarray:
+        return np.linspace(self.low, self.high, self.bins + 1)
+
+    def update(self, values: np.ndarray) -> None:
+        """
+        Add values of shape (samples, elements)
+        """
+        self.underflow += np.count_nonzero(values < self.low, axis=0)
+        self.overflow += np.count_nonzero(values >= self.high, axis=0)
+        inside = (values >= self.low) & (values < self.high)
+        elements = np.broadcast_to(np.arange(values.shape[1]), values.shape)
+        bins = ((values[inside] - self.low)
+                * (self.bins / (self.high - self.low))).astype(np.int64)
+        # rounding may put values just below the upper end into bin `bins`
+        np.minimum(bins, self.bins - 1, out=bins)
+        self.counts += np.bincount(elements[inside] * self.bins + bins,
+                                   minlength=self.counts.size) \
+            .reshape(self.counts.shape)
+
+    def merge(self, other: "Histogram") -> None:
+        if (other.bins, other.low, other.high) != \
+                (self.bins, self.low, self.high):
+            raise ValueError("Only histograms with the same bins can be "
+                             "merged")
+        self.counts += other.counts
+        self.underflow += other.underflow
+        self.overflow += other.overflow
+
+
+class _Buckets:
+    """
+    Counts of every element in consecutive integer keys starting at
+    `offset`, the lowest keys are collapsed into one once more than
+    `max_buckets` keys are needed
+    """
+
+    def __init__(self, elements: int, max_buckets: int):
+        self.elements = elements
+        self.max_buckets = max_buckets
+        self.offset = 0
+        self.counts = np.zeros((elements, 0), dtype=np.int64)
+
+    def _resize(self, low: int, high: int) -> int:
+        """
+        Make room for the keys from `low` to `high` and return the lowest
+        key that isn't collapsed
+        """
+        width = self.counts.shape[1]
+        if width and self.offset <= low and high < self.offset + width:
+            return self.offset
+        if width:
+            low = min(low, self.offset)
+            high = max(high, self.offset + self.counts.shape[1] - 1)
+        low = max(low, high - self.max_buckets + 1)
+        counts = np.zeros((self.elements, high - low + 1), dtype=np.int64)
+        if self.counts.shape[1]:
+            keys = np.maximum(np.arange(self.offset, self.offset
+                                        + self.counts.shape[1]), low) - low
+            np.add.at(counts, (slice(None), keys), self.counts)
+        self.counts = counts
+        self.offset = low
+        return low
+
+    def add(self, keys: np.ndarray, elements: np.ndarray) -> None:
+        if len(keys) == 0:
+            return
+        low = self._resize(int(keys.min()), int(keys.max()))
+        keys = np.maximum(keys, low) - low
+        width = self.counts.shape[1]
+        self.counts += np.bincount(elements * width + keys,
+                                   minlength=self.counts.size) \
+            .reshape(self.counts.shape)
+
+    def merge(self, other: "_Buckets") -> None:
+        if other.counts.shape[1] == 0:
+            return
+        keys = np.arange(other.offset, other.offset + other.counts.shape[1])
+        low = self._resize(int(keys[0]), int(keys[-1]))
+        keys = np.maximum(keys, low) - low
+        np.add.at(self.counts, (slice(None), keys), other.counts)
+
+
+class QuantileSketch:
+    """
+    Quantiles of every element with a relative error of at most
+    `relative_accuracy`
+
+    The magnitudes of the values are counted in buckets from gamma^(k-1) to
+    gamma^k with gamma = (1 + a) / (1 - a), separately for positive and
+    negative values. Up to `max_buckets` buckets are kept for each sign,
+    beyond that the buckets of the smallest magnitudes are collapsed.
+    """
+
+    def __init__(self, elements: int, relative_accuracy: float = 0.01,
+                 max_buckets: int = 2048):
+        if not 0 < relative_accuracy < 1:
+            raise ValueError("The relative accuracy must be between 0 and 1")
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = np.log(self.gamma)
+        self.positive = _Buckets(elements, max_buckets)
+        self.negative = _Buckets(elements, max_buckets)
+        self.zeros = np.zeros(elements, dtype=np.int64)
+
+    def update(self, values: np.ndarray) -> None:
+        """
+        Add values of shape (samples, elements)
+        """
+        elements = np.broadcast_to(np.arange(values.shape[1]), values.shape)
+        self.zeros += np.count_nonzero(values == 0, axis=0)
+        for buckets, mask in ((self.positive, values > 0),
+                              (self.negative, values < 0)):
+            magnitudes = np.abs(values[mask])
+            keys = np.ceil(np.log(magnitudes) / self._log_gamma)
+            buckets.add(keys.astype(np.int64), elements[mask])
+
+    def merge(self, other: "QuantileSketch") -> None:
+        if other.gamma != self.gamma:
+            raise ValueError("Only sketches with the same accuracy can be "
+                             "merged")
+        self.positive.merge(other.positive)
+        self.negative.merge(other.negative)
+        self.zeros += other.zeros
+
+    def _values(self, buckets: _Buckets) -> np.ndarray:
+        keys = np.arange(buckets.offset,
+                         buckets.offset + buckets.counts.shape[1])
+        return 2 * self.gamma ** keys / (self.gamma + 1)
+
+    def quantiles(self, quantiles: Sequence[float]) -> np.ndarray:
+        """
+        The estimated quantiles of every element, of shape
+        (elements, len(quantiles)), NaN for elements without values
+        """
+        # all buckets in ascending order of their values
+        values = np.concatenate((-self._values(self.negative)[::-1], [0.],
+                                 self._values(self.positive)))
+        counts = np.concatenate((self.negative.counts[:, ::-1],
+                                 self.zeros[:, np.newaxis],
+                                 self.positive.counts), axis=1)
+        cumulative = np.cumsum(counts, axis=1)
+        result = np.full((len(counts), len(quantiles)), np.nan)
+        for element, totals in enumerate(cumulative):
+            if totals[-1] == 0:
+                continue
+            ranks = np.asarray(quantiles) * (totals[-1] - 1)
+            result[element] = values[np.searchsorted(totals, ranks,
+                                                     side="right")]
+        return result
+
+
+def _column_values(column: Any, elements: int) -> np.ndarray:
+    """
+    The values of a column as an array of shape (samples, elements), the
+    values of variable-length streams are all samples of one element
+    """
+    if isinstance(column, SparseColumn):
+        column = column.values
+    if isinstance(column, list):
+        if not column:
+            return np.empty((0, 1))
+        return np.concatenate(column).astype(float, copy=False) \
+            .reshape(-1, 1)
+    column = np.asarray(column, dtype=float)
+    return column.reshape(len(column), elements)
+
+
+class StreamStatistics:
+    """
+    Moments, quantiles and an optional histogram of every element of a
+    stream, updated with the columns of the stream in its blocks
+
+    Streams of variable length are treated as a single element, so the
+    statistics are the ones of all of their values. The statistics of two
+    parts of the same stream are combined with `merge`.
+    """
+
+    def __init__(self, metadata: Dict[str, Any],
+                 relative_accuracy: float = 0.01,
+                 histogram: Optional[Tuple[int, float, float]] = None):
+        """
+        :param metadata: The metadata of the stream.
+        :type metadata: Dict[str, Any]
+        :param relative_accuracy: The relative error of the quantiles.
+        :type relative_accuracy: float
+        :param histogram: The number of bins and the lower and upper end of
+                          the range of a histogram, no histogram if None.
+        :type histogram: Optional[Tuple[int, float, float]]
+        """
+        shape = metadata["shape"]
+        self.shape = [shape] if isinstance(shape, int) else list(shape)
+        self.metadata = metadata
+        if self.shape[0] == -1:
+            self.elements = 1
+        else:
+            self.elements = int(np.prod(self.shape))
+        self.moments = Moments(self.elements)
+        self.sketch = QuantileSketch(self.elements, relative_accuracy)
+        self.histogram = None
+        if histogram is not None:
+            self.histogram = Histogram(self.elements, *histogram)
+
+    def update(self, column: Any) -> None:
+        """
+        Add the column of the stream in a block
+        """
+        values = _column_values(column, self.elements)
+        self.moments.update(values)
+        self.sketch.update(values)
+        if self.histogram is not None:
+            self.histogram.update(values)
+
+    def merge(self, other: "StreamStatistics") -> None:
+        """
+        Add the statistics of another part of the stream
+
+        :raises ValueError: If the accumulators can't be merged.
+        """
+        if other.elements != self.elements:
+            raise ValueError("Only statistics of the same stream can be "
+                             "merged")
+        self.moments.merge(other.moments)
+        self.sketch.merge(other.sketch)
+        if (self.histogram is None) != (other.histogram is None):
+            raise ValueError("Only statistics with the same histogram can "
+                             "be merged")
+        if self.histogram is not None:
+            self.histogram.merge(other.histogram)
+
+    def summary(self, quantiles: Sequence[float] = DEFAULT_QUANTILES
+                ) -> Dict[str, Any]:
+        """
+        The statistics as plain Python values, with one value per element
+        in nested lists of the shape of the stream
+        """
+        shape = [1] if self.shape[0] == -1 else self.shape
+
+        def elementwise(array: np.ndarray) -> Any:
+            if array.dtype.kind == "f":
+                array = np.where(np.isfinite(array), array, np.nan)
+            return array.reshape(shape + list(array.shape[1:])).tolist()
+
+        count = self.moments.count
+        summary = {
+            "name": self.metadata.get("name"),
+            "count": count,
+            "mean": elementwise(self.moments.mean if count
+                                else np.full(self.elements, np.nan)),
+            "std": elementwise(np.sqrt(self.moments.variance)),
+            "min": elementwise(self.moments.minimum),
+            "max": elementwise(self.moments.maximum),
+            # the estimates of the extreme quantiles may lie a little
+            # outside of the range of the values
+            "quantiles": {float(q): elementwise(np.clip(
+                values, self.moments.minimum, self.moments.maximum))
+                for q, values in zip(quantiles,
+                                     self.sketch.quantiles(quantiles).T)},
+        }
+        if self.histogram is not None:
+            summary["histogram"] = {
+                "edges": self.histogram.edges.tolist(),
+                "counts": elementwise(self.histogram.counts),
+                "underflow": elementwise(self.histogram.underflow),
+                "overflow": elementwise(self.histogram.overflow),
+            }
+        return summary
+
+
+def block_statistics(streams: List[Dict[str, Any]], indices: List[int],
+                     blocks: Iterable[List[Any]], **options: Any
+                     ) -> List[StreamStatistics]:
+    """
+    Statistics of the selected streams of a block iterator in one pass
+
+    :param streams: The metadata of all streams of the blocks.
+    :param indices: The indices of the streams to compute statistics of.
+    :param blocks: The blocks of the streams.
+    :param options: Passed on to `StreamStatistics`.
+    """
+    statistics = [StreamStatistics(streams[i], **options) for i in indices]
+    for block in blocks:
+        for i, accumulator in zip(indices, statistics):
+            accumulator.update(block[i])
+    return statistics
+
+
+def _range_statistics(block: List[Any], streams: List[Dict[str, Any]],
+                      indices: List[int], options: Dict[str, Any]
+                      ) -> List[StreamStatistics]:
+    return block_statistics(streams, indices, [block], **options)
+
+
+def file_statistics(path: Union[str, Path], indices: List[int],
+                    jobs: Optional[int] = None, **options: Any
+                    ) -> List[StreamStatistics]:
+    """
+    Statistics of the selected streams of a stream file, computed by several
+    worker processes
+
+    Every worker parses byte ranges of the file, see `ParallelFileReader`,
+    and only sends the accumulators of its ranges back, which are merged in
+    the order of the file.
+    """
+    reader = ParallelFileReader(path, jobs)
+    if reader.jobs == 1:
+        return block_statistics(reader.streams, indices,
+                                reader.iter_blocks(), **options)
+    result = [StreamStatistics(reader.streams[i], **options)
+              for i in indices]
+    for parts in reader.map_ranges(_range_statistics, reader.streams,
+                                   indices, options):
+        for accumulator, part in zip(result, parts):
+            accumulator.merge(part)
+    return result
@@ -1,6 +1,59 @@
 from collections.abc import Callable
-from typing import Generator, Iterable, Tuple, Any, Dict, List, Iterator, Sequence
+from itertools import islice
+from typing import Iterable, Tuple, Any, Dict, List, Iterator, Optional, \
+    Sequence
 import numpy as np
+from .rates import ABSENT, SparseColumn, validate_rate
+
+# the value types a stream may declare in its metadata, 'int' and 'float'
+# are the 64 bit types
+VALUE_TYPES: Dict[str, Any] = {"int": int, "float": float}
+VALUE_TYPES.update((name, np.dtype(name)) for name in (
+    "int8", "int16", "int32", "int64", "uint8", "uint16", "uint32", "uint64",
+    "float32", "float64"))
+
+
+def stream_type(dtype: Any) -> Any:
+    """
+    The type of the metadata of a stream holding values of `dtype`
+
+    64 bit values are given as the python types int and float, all other
+    widths as their numpy dtype, so streams that don't declare a width keep
+    the types they always had.
+
+    :param dtype: Anything numpy accepts as a dtype.
+    :type dtype: Any
+    :return: int, float or one of the dtypes of `VALUE_TYPES`.
+    :rtype: Any
+    :raises ValueError: If streams can't hold values of the dtype.
+    """
+    dtype = np.dtype(dtype)
+    if dtype.kind == "b" or dtype == np.int64:
+        return int
+    if dtype == np.float64:
+        return float
+    if dtype.name in VALUE_TYPES:
+        return VALUE_TYPES[dtype.name]
+    raise ValueError(f"Streams can only hold the types "
+                     f"{', '.join(VALUE_TYPES)}, not {dtype}")
+
+
+def type_name(type_: Any) -> str:
+    """
+    The name of the type of a stream in the metadata section
+    """
+    if type_ is int:
+        return "int"
+    if type_ is float:
+        return "float"
+    return np.dtype(type_).name
+
+
+def is_integer_type(type_: Any) -> bool:
+    """
+    If streams of the type hold integer values
+    """
+    return np.dtype(type_).kind in "biu"
 
 
 def arrays_to_data_line(arrays: list[np.ndarray]) -> str:
@@ -25,6 +78,81 @@ def arrays_to_data_line(arrays: list[np.ndarray]) -> str:
     return data_line
 
 
+def elements_to_block(elements: np.ndarray,
+                      shape: Sequence[int]) -> np.ndarray:
+    """
+    Turn a (rows, elements) array, where the elements of every row are in
+    column-major order, into a contiguous block of shape (rows, *shape)
+    """
+    shape = tuple(shape)
+    if len(shape) == 1:
+        return elements
+    block = elements.reshape((len(elements),) + shape[::-1])
+    axes = (0,) + tuple(range(len(shape), 0, -1))
+    return np.ascontiguousarray(block.transpose(axes))
+
+
+def block_to_elements(block: np.ndarray) -> np.ndarray:
+    """
+    Inverse of `elements_to_block`. Returns the elements of every row of the
+    block in column-major order as a (rows, elements) array
+    """
+    # the explicit size also works for blocks without rows
+    size = int(np.prod(block.shape[1:]))
+    if block.ndim <= 2:
+        return block.reshape(len(block), size)
+    axes = (0,) + tuple(range(block.ndim - 1, 0, -1))
+    return block.transpose(axes).reshape(len(block), size)
+
+
+def concatenate_blocks(blocks: List[List[Any]]) -> List[Any]:
+    """
+    Concatenate blocks along the rows into a single block
+
+    Fixed-shape streams are concatenated into one new array, the rows of
+    variable-length streams are collected into one list.
+    """
+    result = []
+    for columns in zip(*blocks):
+        if isinstance(columns[0], SparseColumn):
+            result.append(SparseColumn.concatenate(columns))
+        elif isinstance(columns[0], list):
+            result.append([row for column in columns for row in column])
+        else:
+            result.append(np.concatenate(columns))
+    return result
+
+
+def metadata_header(metadata: List[Dict[str, Any]],
+                    encoding: str = "utf-8") -> str:
+    """
+    Generate the metadata section of the stream format including the line
+    that starts the data section
+
+    :param metadata: The metadata of the streams.
+    :type metadata: List[Dict[str, Any]]
+    :param encoding: Encoding of the data section, either 'utf-8' for the
+                     text format or 'bin' for binary frames.
+    :type encoding: str
+    :return: The metadata section.
+    :rtype: str
+    """
+    metadata_str = ""
+    metadata_str += "Metadata:\n"
+    metadata_str += "streams:\n"
+    for stream in metadata:
+        metadata_str += f"  - name: {stream['name']}\n"
+        metadata_str += f"    shape: {stream['shape']}\n"
+        metadata_str += f"    type: {type_name(stream['type'])}\n"
+        if stream.get('rate') is not None:
+            metadata_str += f"    rate: {stream['rate']}\n"
+    if encoding == "bin":
+        metadata_str += "Data: binary\n"
+    else:
+        metadata_str += "Data:\n"
+    return metadata_str
+
+
 def validate_metadata(metadata: Dict[str, Any]) -> None:
     """
     Validate the metadata
@@ -33,12 +161,11 @@ def validate_metadata(metadata: Dict[str, Any]) -> None:
     if "shape" not in metadata or "type" not in metadata:
         raise ValueError("Each stream must have a 'shape' and 'type'")
     # check the type
-    if metadata['type'] == "int":
-        metadata['type'] = int
-    elif metadata['type'] == "float":
-        metadata['type'] = float
-    else:
-        raise ValueError("The indicated type must be either int or float")
+    if not isinstance(metadata['type'], str) \
+            or metadata['type'] not in VALUE_TYPES:
+        raise ValueError(f"The indicated type must be one of "
+                         f"{', '.join(VALUE_TYPES)}")
+    metadata['type'] = stream_type(VALUE_TYPES[metadata['type']])
     # check the shape
     if not isinstance(metadata["shape"], list | int):
         raise ValueError(
@@ -49,11 +176,15 @@ def validate_metadata(metadata: Dict[str, Any]) -> None:
             if not isinstance(elem, int):
                 raise ValueError(
                     "Dimensions of the tensor need to be integer")
+    validate_rate(metadata)
 
 
 def apply_operator_on_stream(metadata_operator: Callable, data_operator: Callable, stream: Tuple[dict, Iterable], *args, **kwargs) -> Tuple[dict, Iterable]:
     """
     Applies the two functions that are part of an operator to the stream
+
+    The data operator is called once per row. `graph.Expression.on_stream`
+    applies chains of operators to whole blocks of rows instead.
     """
     metadata = metadata_operator(stream[0])
     validate_metadata(metadata)
@@ -61,48 +192,160 @@ def apply_operator_on_stream(metadata_operator: Callable, data_operator: Callabl
     return (metadata, datastream)
 
 
-def collect_stream_into_string(streams: List[Tuple[Dict[str, Any], Iterable]]) -> Iterator[str]:
+def _format_elements(elements: np.ndarray, separator: str) -> List[str]:
+    """
+    Format a (rows, elements) array into one string per row
+    """
+    return [separator.join(row) for row in elements.astype(str).tolist()]
+
+
+def _format_tensors(tensors: List[np.ndarray], separator: str) -> List[str]:
+    """
+    Format a list of 1D arrays of possibly different lengths into one string
+    per array
+    """
+    if not tensors:
+        return []
+    lengths = [len(tensor) for tensor in tensors]
+    if min(lengths) == max(lengths):
+        return _format_elements(np.stack(tensors), separator)
+    values = np.concatenate(tensors).astype(str).tolist()
+    bounds = np.cumsum([0] + lengths).tolist()
+    return [separator.join(values[start:stop])
+            for start, stop in zip(bounds[:-1], bounds[1:])]
+
+
+def format_block(block: List[Any], types: Optional[List[type]] = None,
+                 separator: str = ", ") -> str:
+    """
+    Format all rows of a block into data lines of the text format
+
+    The values of every stream are converted to strings in a single call,
+    which gives the same strings as calling `str` on every element.
+
+    :param block: One entry per stream, either an array of shape
+                  (rows, *shape) or a list of 1D arrays for variable-length
+                  streams.
+    :type block: List[Any]
+    :param types: The type every stream is converted to before formatting,
+                  the values are formatted as they are if None.
+    :type types: Optional[List[type]]
+    :param separator: The separator between the elements of a tensor.
+    :type separator: str
+    :return: The data lines of all rows of the block, each ending with a
+             newline.
+    :rtype: str
+    """
+    if types is None:
+        types = [None] * len(block)
+    stream_strs = []
+    for column, dtype in zip(block, types):
+        if isinstance(column, SparseColumn):
+            # format the present elements only and fill the other rows with
+            # the sentinel
+            strs = np.full(len(column), ABSENT, dtype=object)
+            lines = format_block([column.values], [dtype], separator)
+            strs[column.present] = lines.split("\n")[:-1]
+            stream_strs.append(strs.tolist())
+        elif isinstance(column, list):
+            stream_strs.append(_format_tensors(
+                [np.asarray(row, dtype=dtype).ravel(order="F")
+                 for row in column], separator))
+        else:
+            column = np.asarray(column, dtype=dtype)
+            stream_strs.append(_format_elements(
+                block_to_elements(column), separator))
+    if not stream_strs or not stream_strs[0]:
+        return ""
+    return "\n".join(map(" | ".join, zip(*stream_strs))) + "\n"
+
+
+def align_blocks(block_iterators: List[Iterable[Any]]) -> Iterator[List[Any]]:
+    """
+    Combine the blocks of several streams into blocks that have the same
+    number of rows in every stream
+
+    The blocks of the single streams may have different sizes, the combined
+    blocks are cut at every block boundary of any of the streams. The
+    iteration ends with the shortest stream.
+
+    :param block_iterators: One iterator over the blocks of every stream.
+    :type block_iterators: List[Iterable[Any]]
+    :return: The combined blocks.
+    :rtype: Iterator[List[Any]]
+    """
+    iterators = [iter(blocks) for blocks in block_iterators]
+    if not iterators:
+        return
+    pending: List[Any] = [None] * len(iterators)
+    while True:
+        for i, it in enumerate(iterators):
+            while pending[i] is None or len(pending[i]) == 0:
+                pending[i] = next(it, None)
+                if pending[i] is None:
+                    return
+        rows = min(len(column) for column in pending)
+        yield [column[:rows] for column in pending]
+        pending = [column[rows:] for column in pending]
+
+
+def collect_blocks_into_string(streams: List[Tuple[Dict[str, Any],
+                                                   Iterable[Any]]]
+                               ) -> Iterator[str]:
+    """
+    Generate the text representation of streams that are given as blocks
+
+    This is the block counterpart of `collect_stream_into_string`, it
+    produces the same output with one string per block.
+
+    :param streams: The metadata and an iterator over the blocks of every
+                    stream.
+    :type streams: List[Tuple[Dict[str, Any], Iterable[Any]]]
+    :return: The metadata section followed by the data lines of every
+             block.
+    :rtype: Iterator[str]
+    """
+    metadata = [s[0] for s in streams]
+    types = [m["type"] for m in metadata]
+    yield metadata_header(metadata)
+    for block in align_blocks([s[1] for s in streams]):
+        data = format_block(block, types)
+        if data:
+            yield data
+
+
+def collect_stream_into_string(streams: List[Tuple[Dict[str, Any], Iterable]],
+                               rows_per_block: int = 1024) -> Iterator[str]:
     """
     Generate the string written to the file from the stream
     This is the final transformation back into a text file
+
+    The rows are formatted in groups of <rows_per_block> rows, every
+    yielded string after the metadata section holds the lines of one group.
     """
     metadata = [s[0] for s in streams]
     data = [s[1] for s in streams]
 
-    # Write metadata section
-    metadata_str = ""
-    metadata_str += "Metadata:\n"
-    metadata_str += "streams:\n"
-    for stream in metadata:
-        if stream['type'] == int:
-            type_str = 'int'
-        else:
-            type_str = 'float'
-        print(type_str)
-        metadata_str += f"  - name: {stream['name']}\n"
-        metadata_str += f"    shape: {stream['shape']}\n"
-        metadata_str += f"    type: {type_str}\n"
-
-    # Write data section
-
-    metadata_str += "Data:\n"
-    yield metadata_str
-
-    # define the function that produces one tuple from n iterators
-    def gen_tuple_from_n_iterators(iterators) -> Generator:
-        while True:
-            try:
-                t = [next(it) for it in iterators]
-            except StopIteration:
-                return
-            yield t
-
-    dlines = gen_tuple_from_n_iterators(data)
-    for line_data in dlines:
-        row_strs = []
-        for i, entry in enumerate(line_data):
-            tensor = np.array(
-                entry, dtype=metadata[i]["type"]).flatten(order="F")
-            tensor_str = ", ".join(str(x) for x in tensor)
-            row_strs.append(tensor_str)
-        yield " | ".join(row_strs) + "\n"
+    yield metadata_header(metadata)
+
+    rows = zip(*data)
+    while True:
+        block_rows = list(islice(rows, rows_per_block))
+        if not block_rows:
+            return
+        yield format_block(
+            [_row_column([row[i] for row in block_rows], stream["type"])
+             for i, stream in enumerate(metadata)])
+
+
+def _row_column(elements: List[Any], dtype: type) -> Any:
+    """
+    The column of one stream of a group of rows, with the tensors flattened
+    in column-major order. Absent elements of variable-rate streams are None.
+    """
+    tensors = [None if element is None
+               else np.asarray(element, dtype=dtype).ravel(order="F")
+               for element in elements]
+    if any(tensor is None for tensor in tensors):
+        return SparseColumn.from_elements(tensors)
+    return tensors
@@ -0,0 +1,194 @@
+import asyncio
+import io
+import os
+from typing import List
+import numpy as np
+import pytest
+from signal_tools.async_streams import AsyncSignalStreams, \
+    AsyncStreamWriter, collect_stream_into_writer
+from signal_tools.binary_format import collect_blocks_into_frames
+from signal_tools.parsers import SignalStreams
+from signal_tools.stream_utils import collect_blocks_into_string, \
+    collect_stream_into_string, concatenate_blocks
+
+_metadata = [{"name": "a", "type": float, "shape": [2]},
+             {"name": "b", "type": int, "shape": [1]},
+             {"name": "c", "type": float, "shape": [2, 2]},
+             {"name": "d", "type": float, "shape": [-1]}]
+
+
+def _blocks(num_blocks: int = 3, rows: int = 40):
+    rng = np.random.default_rng(5)
+    return [[rng.standard_normal((rows, 2)),
+             np.arange(rows).reshape(-1, 1),
+             rng.standard_normal((rows, 2, 2)),
+             [rng.standard_normal(k) for k in rng.integers(0, 4, rows)]]
+            for _ in range(num_blocks)]
+
+
+def _encode(blocks: list, encoding: str) -> bytes:
+    streams = [(m, iter([block[i] for block in blocks]))
+               for i, m in enumerate(_metadata)]
+    if encoding == "bin":
+        return b"".join(collect_blocks_into_frames(streams))
+    return "".join(collect_blocks_into_string(streams)).encode("utf-8")
+
+
+def _reader(data: bytes, chunk: int = 97) -> asyncio.StreamReader:
+    """
+    A reader that receives the data in small pieces, like from a socket
+    """
+    reader = asyncio.StreamReader()
+
+    async def feed():
+        for start in range(0, len(data), chunk):
+            reader.feed_data(data[start:start + chunk])
+            await asyncio.sleep(0)
+        reader.feed_eof()
+
+    asyncio.ensure_future(feed())
+    return reader
+
+
+def _assert_blocks_equal(block: list, expected: list):
+    for i in range(3):
+        assert np.array_equal(block[i], expected[i])
+    assert len(block[3]) == len(expected[3])
+    assert all(np.array_equal(a, b) for a, b in zip(block[3], expected[3]))
+
+
+@pytest.mark.parametrize("encoding", ["utf-8", "bin"])
+@pytest.mark.parametrize("block_rows", [1, 7, 1000])
+# small pieces and the whole stream in one piece
+@pytest.mark.parametrize("chunk", [97, 1 << 20])
+def test_iter_blocks_matches_sync_parser(encoding: str, block_rows: int,
+                                         chunk: int):
+    blocks = _blocks()
+    data = _encode(blocks, encoding)
+
+    async def read():
+        streams = await AsyncSignalStreams.open(_reader(data, chunk))
+        assert streams.encoding == encoding
+        result = []
+        async for block in streams.iter_blocks(block_rows):
+            assert SignalStreams._block_rows(block) <= block_rows
+            result.append(block)
+        return streams, result
+
+    streams, result = asyncio.run(read())
+    assert [s["name"] for s in streams.metadata["streams"]] == \
+        [m["name"] for m in _metadata]
+    _assert_blocks_equal(concatenate_blocks(result),
+                         concatenate_blocks(blocks))
+
+
+@pytest.mark.parametrize("encoding", ["utf-8", "bin"])
+def test_rows_match_sync_parser(encoding: str):
+    data = _encode(_blocks(), encoding)
+    if encoding == "utf-8":
+        data = data.replace(b"Data:\n", b"Data:\n# a comment\n")
+    expected = list(SignalStreams(io.BytesIO(data)))
+
+    async def read():
+        streams = await AsyncSignalStreams.open(_reader(data), block_rows=16)
+        return [row async for row in streams]
+
+    rows = asyncio.run(read())
+    assert len(rows) == len(expected)
+    for row, expected_row in zip(rows, expected):
+        assert all(np.array_equal(a, b) for a, b in zip(row, expected_row))
+
+
+def test_last_line_without_newline():
+    data = b"Metadata:\nstreams:\n- name: x\n  type: int\n  shape: [2]\nData:\n" \
+           b"1, 2\n3, 4"
+
+    async def read():
+        streams = await AsyncSignalStreams.open(_reader(data, chunk=3))
+        return [row async for row in streams]
+
+    assert [row[0].tolist() for row in asyncio.run(read())] == \
+        [[1, 2], [3, 4]]
+
+
+@pytest.mark.parametrize("data, message", [
+    (b"Metadata:\nstreams:\n- name: x\n  type: int\n  shape: [1]\nData:\n1\nx\n",
+     "Data line doesn't match the expected format: x\n"),
+    (b"Metadata:\nstreams:\n- name: x\n  type: int\n  shape: [1]\n",
+     "The stream has no 'Data:' section"),
+    (b"Metadata:\nstreams:\n- name: x\n  type: int\n  shape: [1]\nData: binary\n"
+     b"\x04\x00\x00", "Binary stream ends inside of a frame header"),
+])
+def test_invalid_streams(data: bytes, message: str):
+    async def read():
+        streams = await AsyncSignalStreams.open(_reader(data))
+        return [row async for row in streams]
+
+    with pytest.raises(ValueError) as e:
+        asyncio.run(read())
+    assert str(e.value) == message
+
+
+async def _pipe() -> tuple:
+    """
+    An in-process pipe with a stream reader and writer on both ends
+    """
+    loop = asyncio.get_running_loop()
+    read_fd, write_fd = os.pipe()
+    reader = asyncio.StreamReader()
+    await loop.connect_read_pipe(
+        lambda: asyncio.StreamReaderProtocol(reader), os.fdopen(read_fd, "rb"))
+    transport, protocol = await loop.connect_write_pipe(
+        asyncio.streams.FlowControlMixin, os.fdopen(write_fd, "wb"))
+    writer = asyncio.StreamWriter(transport, protocol, None, loop)
+    return reader, writer
+
+
+async def _rows(rows: List[list]):
+    for row in rows:
+        await asyncio.sleep(0)
+        yield row
+
+
+@pytest.mark.parametrize("encoding", ["utf-8", "bin"])
+@pytest.mark.parametrize("rows_per_block", [1, 5, 1024])
+def test_writer_round_trip_through_pipe(encoding: str, rows_per_block: int):
+    metadata = [{"name": "a", "type": float, "shape": [2]},
+                {"name": "b", "type": int, "shape": [-1]}]
+    rows = [[np.array([i / 3, -i]), np.arange(i % 4)] for i in range(23)]
+    expected = "".join(collect_stream_into_string(
+        [(metadata[0], iter([r[0] for r in rows])),
+         (metadata[1], iter([r[1] for r in rows]))]))
+
+    async def round_trip():
+        reader, writer = await _pipe()
+
+        async def write():
+            await collect_stream_into_writer(
+                writer, [(metadata[0], _rows([r[0] for r in rows])),
+                         (metadata[1], _rows([r[1] for r in rows]))],
+                encoding, rows_per_block)
+            writer.close()
+
+        async def read():
+            if encoding == "utf-8":
+                return await reader.read()
+            streams = await AsyncSignalStreams.open(reader)
+            return [row async for row in streams]
+
+        _, result = await asyncio.gather(write(), read())
+        return result
+
+    result = asyncio.run(round_trip())
+    if encoding == "utf-8":
+        assert result.decode("utf-8") == expected
+    else:
+        assert len(result) == len(rows)
+        for row, expected_row in zip(result, rows):
+            assert np.array_equal(row[0], expected_row[0])
+            assert np.array_equal(row[1], expected_row[1])
+
+
+def test_writer_rejects_unknown_encoding():
+    with pytest.raises(ValueError):
+        AsyncStreamWriter(None, _metadata, "utf-16")
@@ -0,0 +1,115 @@
+from io import BytesIO, StringIO
+from typing import Any, Dict, List
+import numpy as np
+import pytest
+from signal_tools.binary_format import collect_stream_into_frames, \
+    decode_frame, encode_frame, FRAME_HEADER
+from signal_tools.parsers import SignalStreams
+from signal_tools.stream_utils import collect_stream_into_string
+
+serial_data = """\
+Metadata:
+streams:
+  - name: stream1
+    type: int
+    shape: [2, 2]
+  - name: stream2
+    type: float
+    shape: [3]
+  - name: stream3
+    type: int
+    shape: [-1]
+Data:
+1, 2, 3, 4 | 1.1, 2.2, 3.3 | 5, 6,
+4, 3, 2, 1 | 4.4, 5.5, 6.6 | 7, 8, 9,
+6, 5, 4, 3 | 7.7, 8.8, 9.9 | 10, 11, 12, 13,
+4, 5, 6, 7 | 10.1, 11.1, 12.1 |
+10, 9, 8, 7 | 13.2, 14.2, 15.2 | 14, 15, 16, 17, 18,
+"""
+
+
+def _rows(data_stream: SignalStreams) -> List[List[np.ndarray]]:
+    return [[np.array(t) for t in row] for row in data_stream]
+
+
+@pytest.mark.parametrize("rows_per_frame", [1, 2, 1024])
+def test_binary_round_trip(rows_per_frame: int):
+    text_rows = _rows(SignalStreams(StringIO(serial_data)))
+    data_stream = SignalStreams(StringIO(serial_data))
+    binary = b"".join(collect_stream_into_frames(
+        data_stream.split_into_individual_streams(), rows_per_frame))
+
+    binary_stream = SignalStreams(BytesIO(binary))
+    assert binary_stream.encoding == "bin"
+    binary_rows = _rows(binary_stream)
+    assert len(binary_rows) == len(text_rows)
+    for text_row, binary_row in zip(text_rows, binary_rows):
+        for text_tensor, binary_tensor in zip(text_row, binary_row):
+            assert text_tensor.dtype == binary_tensor.dtype
+            assert np.array_equal(text_tensor, binary_tensor)
+
+
+def test_binary_text_output_identical():
+    data_stream = SignalStreams(StringIO(serial_data))
+    text = "".join(collect_stream_into_string(
+        data_stream.split_into_individual_streams()))
+    data_stream = SignalStreams(StringIO(serial_data))
+    binary = b"".join(collect_stream_into_frames(
+        data_stream.split_into_individual_streams(), 2))
+    from_binary = "".join(collect_stream_into_string(
+        SignalStreams(BytesIO(binary)).split_into_individual_streams()))
+    assert from_binary == text
+
+
+def test_text_format_from_binary_stream():
+    data_stream = SignalStreams(BytesIO(serial_data.encode("utf-8")))
+    assert data_stream.encoding == "utf-8"
+    assert len(_rows(data_stream)) == 5
+
+
+def test_binary_format_from_text_stream():
+    data_stream = SignalStreams(StringIO(serial_data))
+    binary = b"".join(collect_stream_into_frames(
+        data_stream.split_into_individual_streams()))
+    with pytest.raises(ValueError, match="binary input stream"):
+        SignalStreams(StringIO(binary.decode("latin-1")))
+
+
+@pytest.mark.parametrize("streams, block", [
+    (
+        [{"type": float, "shape": [2]}],
+        [np.array([[1.0, 2.0], [3.0, 4.0], [5.0, 6.0]])],
+    ),
+    (
+        [{"type": int, "shape": [2, 3]}, {"type": int, "shape": [-1]}],
+        [np.arange(12).reshape(2, 2, 3),
+         [np.array([1, 2, 3]), np.array([], dtype=int)]],
+    ),
+])
+def test_encode_decode_frame(streams: List[Dict[str, Any]], block: list):
+    frame = encode_frame(streams, block)
+    size, num_rows = FRAME_HEADER.unpack(frame[:FRAME_HEADER.size])
+    assert size == len(frame) - FRAME_HEADER.size
+    decoded = decode_frame(streams, num_rows, frame[FRAME_HEADER.size:])
+    for column, decoded_column in zip(block, decoded):
+        assert len(column) == len(decoded_column)
+        for row, decoded_row in zip(column, decoded_column):
+            assert np.array_equal(row, decoded_row)
+
+
+def test_decode_frame_size_mismatch():
+    streams = [{"type": float, "shape": [2]}]
+    frame = encode_frame(streams, [np.zeros((3, 2))])
+    with pytest.raises(ValueError, match="doesn't match the metadata"):
+        decode_frame(streams, 4, frame[FRAME_HEADER.size:])
+
+
+@pytest.mark.parametrize("type_", ["int8", "uint16", "int32", "float32"])
+def test_frames_use_the_width_of_the_type(type_: str):
+    streams = [{"type": np.dtype(type_), "shape": [3]}]
+    block = [np.arange(30, dtype=type_).reshape(10, 3)]
+    frame = encode_frame(streams, block)
+    assert len(frame) == FRAME_HEADER.size + 30 * np.dtype(type_).itemsize
+    decoded = decode_frame(streams, 10, frame[FRAME_HEADER.size:])
+    assert decoded[0].dtype == np.dtype(type_)
+    assert np.array_equal(decoded[0], block[0])
@@ -0,0 +1,337 @@
+import json
+from io import BytesIO, StringIO
+import numpy as np
+import pytest
+import yaml
+from scipy import signal
+from click.testing import CliRunner
+from pathlib import Path
+from signal_tools.cli import apply_transformation, file_io, signal_generate
+from signal_tools.filter import g_h_filter, trapezoid_filter
+from signal_tools.parsers import SignalStreams
+from signal_tools.stream_utils import concatenate_blocks
+
+header = """\
+Metadata:
+streams:
+  - name: channels
+    type: float
+    shape: [2]
+  - name: counter
+    type: int
+    shape: [1]
+Data:
+"""
+
+
+@pytest.fixture
+def channel_data():
+    samples = np.random.randn(300, 2)
+    serial_data = header + "".join(f"{a}, {b} | {i}\n"
+                                   for i, (a, b) in enumerate(samples))
+    return samples, serial_data
+
+
+def _parse(serial_data: str):
+    return next(SignalStreams(StringIO(serial_data)).iter_blocks(100000))
+
+
+@pytest.mark.parametrize("block_rows", ["1", "7", "4096"])
+def test_trapezoid_command(channel_data, block_rows: str):
+    samples, serial_data = channel_data
+    result = CliRunner().invoke(
+        apply_transformation,
+        ["-s", "0", "-b", block_rows, "trapezoid", "5", "10", "0.1"],
+        input=serial_data)
+    assert result.exit_code == 0, result.output
+    block = _parse(result.stdout)
+    for channel in range(2):
+        expected = list(trapezoid_filter(5, 10, 0.1, samples[:, channel]))
+        assert np.array_equal(block[0][:, channel], expected)
+    assert np.array_equal(block[1][:, 0], np.arange(300))
+
+
+def test_g_h_command(channel_data):
+    samples, serial_data = channel_data
+    result = CliRunner().invoke(
+        apply_transformation,
+        ["-s", "0", "-b", "16", "g-h", "0.4", "0.2"],
+        input=serial_data)
+    assert result.exit_code == 0, result.output
+    block = _parse(result.stdout)
+    expected = list(g_h_filter(samples[:, 1], 0., 0., 0.2, 0.4, 1.))
+    assert np.allclose(block[0][:, 1], expected)
+
+
+csv_path = str(Path(__file__).parent / "test.csv")
+
+
+@pytest.mark.parametrize("encoding", ["utf-8", "bin"])
+@pytest.mark.parametrize("block_rows", ["1", "4", "65536"])
+def test_read_csv_command(encoding: str, block_rows: str):
+    expected = np.loadtxt(csv_path, delimiter=",", skiprows=1)
+    result = CliRunner().invoke(
+        file_io,
+        [csv_path, "in", encoding, "read-csv", ",", "-c", "2", "-c", "0",
+         "-t", "2", "int", "-b", block_rows])
+    assert result.exit_code == 0, result.output
+    streams = SignalStreams(BytesIO(result.stdout_bytes))
+    assert [s["name"] for s in streams.metadata["streams"]] == \
+        ["stream1", "stream3"]
+    block = concatenate_blocks(list(streams.iter_blocks(100000)))
+    assert block[0].dtype == np.float64
+    assert block[1].dtype.kind == "i"
+    assert np.array_equal(block[0][:, 0], expected[:, 0])
+    assert np.array_equal(block[1][:, 0], expected[:, 2])
+
+
+def test_read_csv_invalid_column():
+    result = CliRunner().invoke(
+        file_io, [csv_path, "in", "utf-8", "read-csv", ",", "-c", "3"])
+    assert isinstance(result.exception, ValueError)
+
+
+@pytest.mark.parametrize("jobs", ["1", "2"])
+def test_transform_all_streams(channel_data, jobs: str):
+    samples, serial_data = channel_data
+    result = CliRunner().invoke(
+        apply_transformation,
+        ["-a", "-j", jobs, "-b", "64", "digitize", "0.5"],
+        input=serial_data)
+    assert result.exit_code == 0, result.output
+    block = _parse(result.stdout)
+    assert np.array_equal(block[0], (samples / 0.5).astype(int))
+    assert np.array_equal(block[1][:, 0], np.arange(300) * 2)
+
+
+def test_transform_requires_stream(channel_data):
+    _, serial_data = channel_data
+    result = CliRunner().invoke(apply_transformation, ["digitize", "0.5"],
+                                input=serial_data)
+    assert result.exit_code == 1
+
+
+def test_chain_command(channel_data):
+    samples, serial_data = channel_data
+    result = CliRunner().invoke(
+        apply_transformation,
+        ["-s", "0", "-b", "16", "chain", "scale=2", "clip=-1:", "offset=1",
+         "trapezoid=5:10:0.1"],
+        input=serial_data)
+    assert result.exit_code == 0, result.output
+    block = _parse(result.stdout)
+    for channel in range(2):
+        expected = list(trapezoid_filter(
+            5, 10, 0.1, np.maximum(samples[:, channel] * 2., -1.) + 1.))
+        assert np.allclose(block[0][:, channel], expected)
+    assert np.array_equal(block[1][:, 0], np.arange(300))
+
+
+@pytest.mark.parametrize("steps", [["scale"], ["clip=2:1"], ["unknown=1"],
+                                   ["offset=x"]])
+def test_chain_command_invalid_steps(channel_data, steps):
+    _, serial_data = channel_data
+    result = CliRunner().invoke(apply_transformation,
+                                ["-s", "0", "chain", *steps],
+                                input=serial_data)
+    assert result.exit_code == 1
+
+
+@pytest.mark.parametrize("step", ["trapezoid=2.7:10:0.1",
+                                  "trapezoid=5:0:0.1", "trapezoid=5:x:0.1"])
+def test_chain_command_invalid_trapezoid_delays(channel_data, step):
+    _, serial_data = channel_data
+    result = CliRunner().invoke(apply_transformation,
+                                ["-s", "0", "chain", step],
+                                input=serial_data)
+    assert result.exit_code == 2
+    assert f"Invalid value for 'STEPS...': {step}" in result.stderr
+
+
+@pytest.mark.parametrize("mode", ["xy", "scatter", "waterfall", "matrix"])
+def test_plot_command(channel_data, tmp_path: Path, mode: str):
+    _, serial_data = channel_data
+    image = tmp_path / "plot.svg"
+    result = CliRunner().invoke(
+        file_io, ["-", "in", "utf-8", "plot", "0", "-m", mode, "-x", "1",
+                  "-o", str(image), "--size", "120", "90", "-b", "64",
+                  "--refresh", "2"],
+        input=serial_data)
+    assert result.exit_code == 0, result.output
+    assert b"<svg" in image.read_bytes()
+
+
+def test_plot_command_invalid_stream(channel_data, tmp_path: Path):
+    _, serial_data = channel_data
+    result = CliRunner().invoke(
+        file_io, ["-", "in", "utf-8", "plot", "0", "-x", "0",
+                  "-o", str(tmp_path / "plot.png")],
+        input=serial_data)
+    assert result.exit_code == 1
+
+
+def test_stats_command(channel_data):
+    samples, serial_data = channel_data
+    result = CliRunner().invoke(
+        apply_transformation,
+        ["-a", "-b", "64", "stats", "-q", "0", "-q", "1",
+         "--histogram", "4", "-1", "1"],
+        input=serial_data)
+    assert result.exit_code == 0, result.output
+    report = yaml.safe_load(result.stdout)
+    assert [stream["name"] for stream in report] == ["channels", "counter"]
+    channels, counter = report
+    assert channels["count"] == 300
+    assert np.allclose(channels["mean"], samples.mean(axis=0))
+    assert np.allclose(channels["std"], samples.std(axis=0))
+    # the quantiles are estimated with a relative error of 1%
+    assert np.allclose(channels["quantiles"][0.0], samples.min(axis=0),
+                       rtol=0.01)
+    assert np.allclose(channels["quantiles"][1.0], samples.max(axis=0),
+                       rtol=0.01)
+    assert counter["min"] == [0] and counter["max"] == [299]
+    assert np.sum(counter["histogram"]["counts"]) == 1
+
+
+@pytest.mark.parametrize("command", [["chain", "scale=2"],
+                                     ["digitize", "0.5"]])
+def test_transform_stats(channel_data, command):
+    samples, serial_data = channel_data
+    result = CliRunner().invoke(
+        apply_transformation, ["-s", "0", "-b", "64", "--stats"] + command,
+        input=serial_data)
+    assert result.exit_code == 0, result.output
+    report = json.loads(result.stderr.splitlines()[-1])
+    assert report["command"] == f"signal-transform {command[0]}"
+    assert report["final"]
+    assert report["rows_in"] == report["rows_out"] == len(samples)
+    assert report["bytes_in"] == len(serial_data)
+    assert report["bytes_out"] == len(result.stdout)
+    assert report["seconds"]["parse"] > 0 and report["seconds"]["operator"] > 0
+
+
+def test_convert_stats(channel_data):
+    samples, serial_data = channel_data
+    result = CliRunner().invoke(
+        file_io, ["--stats-interval", "1e-9", "-", "in", "bin", "convert"],
+        input=serial_data)
+    assert result.exit_code == 0, result.output
+    reports = [json.loads(line) for line in result.stderr.splitlines()]
+    assert len(reports) > 1 and reports[-1]["final"]
+    assert not any(report["final"] for report in reports[:-1])
+    assert reports[-1]["command"] == "signal-io convert"
+    assert reports[-1]["rows_out"] == len(samples)
+    assert reports[-1]["bytes_out"] == len(result.stdout_bytes)
+
+
+def test_digitize_into_narrow_type(channel_data):
+    samples, serial_data = channel_data
+    result = CliRunner().invoke(
+        apply_transformation, ["-s", "0", "digitize", "0.001", "-t", "int8"],
+        input=serial_data)
+    assert result.exit_code == 0, result.output
+    assert "type: int8" in result.stdout
+    block = _parse(result.stdout)
+    assert block[0].dtype == np.int8
+    expected = np.clip(samples / 0.001, -128, 127).astype(np.int8)
+    assert np.array_equal(block[0], expected)
+
+
+def test_chain_keeps_narrow_type():
+    serial_data = ("Metadata:\nstreams:\n  - name: adc\n    type: uint16\n"
+                   "    shape: [1]\nData:\n" +
+                   "".join(f"{i}\n" for i in range(0, 4096, 7)))
+    result = CliRunner().invoke(
+        apply_transformation, ["-s", "0", "chain", "digitize=16:uint8"],
+        input=serial_data)
+    assert result.exit_code == 0, result.output
+    block = _parse(result.stdout)
+    assert block[0].dtype == np.uint8
+    assert np.array_equal(block[0][:, 0], np.arange(0, 4096, 7) // 16)
+
+
+def test_generate_multiple_streams():
+    args = ["-s", "1000", "--seed", "4", "random", "-t", "float32", "a",
+            "random", "-d", "poisson", "-p", "3", "-s", "2", "b",
+            "sine", "-n", "0.1", "c", "pulses", "p"]
+    text = CliRunner().invoke(signal_generate, args)
+    assert text.exit_code == 0, text.output
+    binary = CliRunner().invoke(signal_generate, ["-e", "bin"] + args)
+    assert binary.exit_code == 0, binary.output
+    text_block = _parse(text.stdout)
+    binary_block = next(SignalStreams(BytesIO(binary.stdout_bytes))
+                        .iter_blocks(100000))
+    assert [column.shape for column in text_block] == \
+        [(1000, 1), (1000, 2), (1000, 1), (1000, 1)]
+    assert [column.dtype for column in binary_block] == \
+        [np.float32, np.int64, np.float64, np.float64]
+    for text_column, binary_column in zip(text_block, binary_block):
+        assert np.array_equal(text_column, binary_column)
+    # the seed of the group gives every stream its own random numbers
+    assert not np.array_equal(text_block[0], text_block[2])
+    again = CliRunner().invoke(signal_generate, args)
+    assert again.stdout == text.stdout
+
+
+def test_generate_appends_to_input(channel_data):
+    samples, serial_data = channel_data
+    result = CliRunner().invoke(signal_generate, ["-i", "sine", "s"],
+                                input=serial_data)
+    assert result.exit_code == 0, result.output
+    block = _parse(result.stdout)
+    assert np.array_equal(block[0], samples)
+    assert np.allclose(block[2][:, 0],
+                       np.sin(2 * np.pi * np.arange(len(samples)) / 100.))
+
+
+@pytest.mark.parametrize("block_rows", ["7", "4096"])
+def test_resample_command(channel_data, block_rows: str):
+    samples, serial_data = channel_data
+    result = CliRunner().invoke(
+        apply_transformation, ["-s", "0", "-b", block_rows, "resample",
+                               "2", "3"],
+        input=serial_data)
+    assert result.exit_code == 0, result.output
+    block = _parse(result.stdout)
+    assert len(block) == 1
+    assert np.allclose(block[0], signal.resample_poly(samples, 2, 3, axis=0))
+
+
+def test_resample_rejects_variable_length():
+    serial_data = ("Metadata:\nstreams:\n  - name: v\n    type: float\n"
+                   "    shape: [-1]\nData:\n1.0, 2.0\n")
+    result = CliRunner().invoke(apply_transformation,
+                                ["-s", "0", "resample", "1", "2"],
+                                input=serial_data)
+    assert result.exit_code == 1
+
+
+@pytest.mark.parametrize("args, expected", [
+    (["-t", "0.25", "-t", "0.5", "-t", "0.25"],
+     lambda x: signal.lfilter([0.25, 0.5, 0.25], [1.], x, axis=0)),
+    (["--sos-file", "sos.npy"],
+     lambda x: signal.sosfilt(signal.butter(3, 0.2, output="sos"), x,
+                              axis=0)),
+    (["--taps-file", "taps.txt", "--fft-threshold", "16"],
+     lambda x: signal.lfilter(signal.firwin(101, 0.1), [1.], x, axis=0)),
+])
+def test_lfilter_command(channel_data, args, expected):
+    samples, serial_data = channel_data
+    runner = CliRunner()
+    with runner.isolated_filesystem():
+        np.save("sos.npy", signal.butter(3, 0.2, output="sos"))
+        np.savetxt("taps.txt", signal.firwin(101, 0.1))
+        result = runner.invoke(
+            apply_transformation, ["-s", "0", "-b", "128", "lfilter"] + args,
+            input=serial_data)
+    assert result.exit_code == 0, result.output
+    block = _parse(result.stdout)
+    assert np.allclose(block[0], expected(samples))
+    assert np.array_equal(block[1][:, 0], np.arange(300))
+
+
+def test_lfilter_needs_one_filter(channel_data):
+    _, serial_data = channel_data
+    result = CliRunner().invoke(apply_transformation, ["-s", "0", "lfilter"],
+                                input=serial_data)
+    assert result.exit_code == 1
@@ -0,0 +1,84 @@
+import threading
+from io import StringIO
+import numpy as np
+import pytest
+from signal_tools.demux import StreamDemultiplexer
+from signal_tools.parsers import SignalStreams
+
+
+def _blocks(num_blocks: int, block_rows: int = 4, num_streams: int = 3):
+    for b in range(num_blocks):
+        rows = np.arange(b * block_rows, (b + 1) * block_rows)
+        yield [rows * (s + 1) for s in range(num_streams)]
+
+
+def test_round_robin_keeps_one_block():
+    demux = StreamDemultiplexer(_blocks(10), 3, max_buffered_blocks=1)
+    for values in zip(*demux.consumers):
+        assert values[1] == 2 * values[0]
+        assert values[2] == 3 * values[0]
+    assert demux.high_water_mark == 1
+    assert demux.high_water_rows == 4
+    assert demux.buffered_blocks == 0
+
+
+def test_backpressure_raise():
+    demux = StreamDemultiplexer(_blocks(10), 3, max_buffered_blocks=2)
+    consumer = demux.consumers[0]
+    consumer.next_block()
+    consumer.next_block()
+    with pytest.raises(BufferError):
+        consumer.next_block()
+    # the other consumers catching up frees the buffer
+    for other in demux.consumers[1:]:
+        other.next_block()
+    assert np.array_equal(consumer.next_block(), np.arange(8, 12))
+    assert demux.high_water_mark == 2
+
+
+def test_backpressure_block():
+    demux = StreamDemultiplexer(_blocks(50), 2, max_buffered_blocks=2,
+                                policy="block", timeout=10)
+    results = [None, None]
+
+    def consume(i):
+        results[i] = np.concatenate(list(demux.consumers[i].iter_blocks()))
+
+    threads = [threading.Thread(target=consume, args=(i,)) for i in (0, 1)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert np.array_equal(results[0], np.arange(200))
+    assert np.array_equal(results[1], 2 * np.arange(200))
+    assert demux.high_water_mark <= 2
+
+
+def test_closed_consumer_releases_blocks():
+    demux = StreamDemultiplexer(_blocks(10), 2, max_buffered_blocks=1)
+    demux.consumers[1].close()
+    assert len(list(demux.consumers[0])) == 40
+    assert demux.high_water_mark == 1
+
+
+def test_split_into_individual_streams_buffer():
+    serial_data = ("Metadata:\n"
+                   "streams:\n"
+                   "  - shape: [2, 1]\n"
+                   "    type: int\n"
+                   "  - shape: [1]\n"
+                   "    type: float\n"
+                   "Data:\n"
+                   + "".join(f"{i} {i} | {i}.5\n" for i in range(100)))
+    data_stream = SignalStreams(StringIO(serial_data), block_rows=10)
+    streams = data_stream.split_into_individual_streams(
+        max_buffered_blocks=3)
+    first, second = (s[1] for s in streams)
+    assert np.array_equal(next(first), np.array([0, 0]))
+    for _ in range(29):
+        next(first)
+    with pytest.raises(BufferError):
+        next(first)
+    first.close()
+    assert len(list(second)) == 100
+    assert data_stream.demux.high_water_mark == 3
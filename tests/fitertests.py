@@ -3,7 +3,9 @@ Test the various mo
 """
 import pytest
 import numpy as np
-from signal_tools.filter import g_h_filter
+from scipy import signal
+from signal_tools.filter import g_h_filter, trapezoid_filter, \
+    BlockFilter, GHFilter, Resampler, TrapezoidFilter
 
 
 @pytest.mark.parametrize(
@@ -13,3 +15,116 @@ from signal_tools.filter import g_h_filter
         )
 def test_gh_filter(g, h, mom_init, state_init, data, truth):
     pass
+
+
+@pytest.mark.parametrize("rise_time, trapezoid_len, decay_compensation",
+                         [(1, 1, 0.0), (5, 3, 0.02), (20, 50, 1.5)])
+@pytest.mark.parametrize("block_size", [1, 7, 64, 1000])
+def test_trapezoid_filter_blocks(rise_time, trapezoid_len,
+                                 decay_compensation, block_size):
+    data = np.random.randn(500, 3)
+    expected = np.stack([
+        np.array(list(trapezoid_filter(rise_time, trapezoid_len,
+                                       decay_compensation, data[:, c])))
+        for c in range(data.shape[1])], axis=1)
+    trapezoid = TrapezoidFilter(rise_time, trapezoid_len, decay_compensation)
+    output = np.concatenate([trapezoid(data[i:i + block_size])
+                             for i in range(0, len(data), block_size)])
+    assert np.array_equal(output, expected)
+
+
+def test_trapezoid_filter_integer_samples():
+    data = np.random.randint(-1000, 1000, 300)
+    expected = list(trapezoid_filter(4, 8, 3, data.tolist()))
+    output = TrapezoidFilter(4, 8, 3)(data)
+    assert output.dtype.kind == "i"
+    assert output.tolist() == expected
+
+
+def test_trapezoid_filter_channel_mismatch():
+    trapezoid = TrapezoidFilter(2, 2, 0.5)
+    trapezoid(np.zeros((10, 2)))
+    with pytest.raises(ValueError):
+        trapezoid(np.zeros((10, 3)))
+
+
+@pytest.mark.parametrize("block_size", [1, 13, 1000])
+def test_gh_filter_blocks(block_size):
+    data = np.cumsum(np.random.randn(400, 4), axis=0)
+    initial_state = np.arange(4.)
+    g_h = GHFilter(0.4, 0.2, 0.5, initial_state, 1.)
+    output = np.concatenate([g_h(data[i:i + block_size])
+                             for i in range(0, len(data), block_size)])
+    for channel in range(data.shape[1]):
+        expected = list(g_h_filter(data[:, channel], 1., channel,
+                                   0.2, 0.4, 0.5))
+        assert np.allclose(output[:, channel], expected)
+    assert g_h.state.shape == (4,)
+    assert np.allclose(g_h.state, output[-1])
+
+
+@pytest.mark.parametrize("up, down", [(1, 1), (1, 10), (4, 1), (2, 3),
+                                      (7, 5), (6, 4)])
+@pytest.mark.parametrize("block_size", [1, 7, 1000])
+def test_resampler_matches_resample_poly(up, down, block_size):
+    samples = np.random.randn(500, 2, 2)
+    resampler = Resampler(up, down)
+    blocks = [resampler(samples[i:i + block_size])
+              for i in range(0, len(samples), block_size)]
+    resampled = np.concatenate(blocks + [resampler.flush()])
+    expected = signal.resample_poly(samples, up, down, axis=0)
+    assert resampled.shape == expected.shape
+    assert np.allclose(resampled, expected)
+
+
+def test_resampler_outputs_lag_by_half_the_filter():
+    resampler = Resampler(1, 2, half_length=10)
+    assert len(resampler(np.ones(100))) == 45
+    assert len(resampler.flush()) == 5
+    # the resampler starts over after the flush
+    assert len(resampler(np.ones(100))) == 45
+
+
+def test_resampler_invalid_arguments():
+    with pytest.raises(ValueError):
+        Resampler(0, 2)
+    resampler = Resampler(1, 2)
+    resampler(np.ones((10, 2)))
+    with pytest.raises(ValueError):
+        resampler(np.ones((10, 3)))
+
+
+@pytest.mark.parametrize("num_taps", [1, 2, 31, 600])
+@pytest.mark.parametrize("block_size", [1, 13, 700, 5000])
+def test_block_fir_filter(num_taps, block_size):
+    samples = np.random.randn(2000, 3)
+    taps = np.random.randn(num_taps)
+    # blocks shorter than the filter are filtered directly, longer ones
+    # by FFT convolution, both continue from the same state
+    block_filter = BlockFilter(taps, fft_threshold=100)
+    filtered = np.concatenate([block_filter(samples[i:i + block_size])
+                               for i in range(0, len(samples), block_size)])
+    expected = signal.lfilter(taps, [1.], samples, axis=0)
+    assert np.allclose(filtered, expected)
+
+
+@pytest.mark.parametrize("block_size", [1, 64, 5000])
+def test_block_iir_filter(block_size):
+    samples = np.random.randn(2000, 2, 2)
+    sos = signal.butter(6, 0.05, output="sos")
+    block_filter = BlockFilter(sos=sos)
+    filtered = np.concatenate([block_filter(samples[i:i + block_size])
+                               for i in range(0, len(samples), block_size)])
+    assert np.allclose(filtered, signal.sosfilt(sos, samples, axis=0))
+
+
+@pytest.mark.parametrize("taps, sos", [
+    (None, None),
+    ([1., 2.], signal.butter(2, 0.1, output="sos")),
+    ([], None),
+    (None, np.ones((2, 5))),
+    (None, np.zeros((1, 6))),
+])
+def test_block_filter_invalid_coefficients(taps, sos):
+    with pytest.raises(ValueError):
+        BlockFilter(taps, sos)
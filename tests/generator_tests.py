@@ -2,7 +2,9 @@ from typing import List, Tuple, Union
 import pytest
 from numpy._typing import NDArray
 from itertools import chain
-from signal_tools.generators import rngen
+import numpy as np
+from signal_tools.generators import poisson_pulse_gen, random_chunks, \
+    rngen, sine_chunks
 
 
 @pytest.mark.parametrize("shape, range_, chunk_size, samples",
@@ -29,3 +31,76 @@ def test_rn_gen(shape: Tuple[int], range_: Tuple[float, float], chunk_size: int,
     assert min(flatnums) >= min(range_)
     for rn in rnums:
         assert rn.shape == shape
+
+
+@pytest.mark.parametrize("chunk_size, samples", [(100, 1000), (333, 1000)])
+def test_poisson_pulse_gen(chunk_size: int, samples: int):
+    chunks = list(poisson_pulse_gen(0.01, 20, "normal", (5, 0.5),
+                                    chunk_size, samples, seed=42))
+    assert all(len(chunk) == chunk_size for chunk in chunks[:-1])
+    signal = np.concatenate(chunks)
+    assert len(signal) == samples
+    assert np.all(signal >= 0)
+    # the same seed reproduces the signal
+    again = np.concatenate(list(poisson_pulse_gen(
+        0.01, 20, "normal", (5, 0.5), chunk_size, samples, seed=42)))
+    assert np.array_equal(signal, again)
+
+
+def test_poisson_pulse_gen_shape():
+    # a low rate gives isolated pulses that decay with the decay constant
+    signal = np.concatenate(list(poisson_pulse_gen(
+        0.001, 10, "normal", (1, 0), 7, 2000, seed=1)))
+    start = int(np.argmax(signal > 0))
+    assert np.isclose(signal[start + 1] / signal[start], np.exp(-1 / 10))
+
+
+def test_poisson_pulse_gen_mean():
+    rate, height, decay_const = 0.05, 2., 10.
+    signal = np.concatenate(list(poisson_pulse_gen(
+        rate, decay_const, "normal", (height, 0.), 1000, 200000, seed=7)))
+    expected = rate * height / (1 - np.exp(-1 / decay_const))
+    assert abs(signal.mean() / expected - 1) < 0.1
+
+
+@pytest.mark.parametrize("distribution, params, shape", [
+    ("uniform", (2., 3.), (1,)),
+    ("normal", (1., 0.5), (2, 3)),
+    ("poisson", (4.,), (3,)),
+])
+@pytest.mark.parametrize("chunk_size", [1, 64, 5000])
+def test_random_chunks(distribution: str, params: Tuple[float, ...],
+                       shape: Tuple[int, ...], chunk_size: int):
+    chunks = list(random_chunks(distribution, params, shape, chunk_size,
+                                1000, seed=5))
+    assert all(chunk.shape == (chunk_size,) + shape for chunk in chunks[:-1])
+    values = np.concatenate(chunks)
+    assert values.shape == (1000,) + shape
+    again = np.concatenate(list(random_chunks(distribution, params, shape,
+                                              chunk_size, 1000, seed=5)))
+    assert np.array_equal(values, again)
+    if distribution == "uniform":
+        assert values.min() >= 2. and values.max() < 3.
+    elif distribution == "poisson":
+        assert values.dtype.kind == "i"
+        assert abs(values.mean() - 4.) < 0.3
+
+
+def test_random_chunks_unknown_distribution():
+    with pytest.raises(ValueError):
+        next(random_chunks("binomial", (1, 0.5), (1,), 10, 10))
+
+
+@pytest.mark.parametrize("chunk_size", [7, 100, 1000])
+def test_sine_chunks_are_continuous(chunk_size: int):
+    signal = np.concatenate(list(sine_chunks(2., 37.5, 0.3, 0., chunk_size,
+                                             1000)))
+    expected = 2. * np.sin(2 * np.pi * np.arange(1000) / 37.5 + 0.3)
+    assert np.allclose(signal, expected)
+
+
+def test_sine_chunks_noise():
+    signal = np.concatenate(list(sine_chunks(1., 50., 0., 0.2, 4096, 100000,
+                                             seed=2)))
+    noise = signal - np.sin(2 * np.pi * np.arange(100000) / 50.)
+    assert abs(noise.std() - 0.2) < 0.01
@@ -0,0 +1,203 @@
+import pickle
+from typing import Any, Dict
+import numpy as np
+import pytest
+from signal_tools.filter import TrapezoidFilter, trapezoid_filter
+from signal_tools.graph import Expression, _Stage
+from signal_tools.operators import Digitize
+from signal_tools.rates import SparseColumn
+from signal_tools.stream_utils import VALUE_TYPES
+
+float_stream = {"name": "x", "type": float, "shape": [2]}
+int_stream = {"name": "n", "type": int, "shape": [1]}
+variable_stream = {"name": "v", "type": float, "shape": [-1]}
+
+
+@pytest.mark.parametrize("stream, build, expected_type", [
+    (int_stream, lambda e: e.scale(2).offset(-3), int),
+    (int_stream, lambda e: e.scale(2.5), float),
+    (int_stream, lambda e: e.clip(0, 5), int),
+    (int_stream, lambda e: e.clip(high=0.5), float),
+    (float_stream, lambda e: e.digitize(0.1), int),
+    (float_stream, lambda e: e.digitize(0.1).scale(2), int),
+    (int_stream, lambda e: e.filter(TrapezoidFilter(2, 3, 0.1)), float),
+    (int_stream, lambda e: e.apply(lambda x: x > 2), int),
+])
+def test_metadata_propagates_at_build_time(stream: Dict[str, Any], build,
+                                           expected_type: type):
+    expression = build(Expression(stream))
+    assert expression.metadata["type"] is expected_type
+    assert expression.metadata["shape"] == stream["shape"]
+    block = np.arange(12).reshape(-1, *stream["shape"]).astype(stream["type"])
+    result = expression.compile()(block)
+    assert result.dtype == np.dtype(expected_type)
+    assert result.shape == block.shape
+
+
+@pytest.mark.parametrize("stream, build", [
+    (variable_stream, lambda e: e.filter(TrapezoidFilter(2, 3, 0.1))),
+    (float_stream, lambda e: e.clip(2, 1)),
+    (float_stream, lambda e: e.clip()),
+    (float_stream, lambda e: e.digitize(0)),
+    (float_stream, lambda e: e.apply(lambda x: x.sum(axis=0))),
+    (float_stream, lambda e: e.apply(lambda x: x.astype(complex))),
+    (float_stream, lambda e: e.apply(lambda x: x[:, 5])),
+    (variable_stream, lambda e: e.apply(lambda x: x.reshape(-1, 1))),
+])
+def test_invalid_operators_fail_before_data_flows(stream: Dict[str, Any],
+                                                  build):
+    with pytest.raises(ValueError):
+        build(Expression(stream))
+
+
+def test_fused_chain_matches_separate_operators():
+    samples = np.random.randn(500, 2)
+    expression = Expression(float_stream).scale(3.).offset(0.5) \
+        .clip(-2., 2.).digitize(0.01)
+    expected = Digitize(0.01)(np.clip(samples * 3. + 0.5, -2., 2.))
+    assert np.array_equal(expression.compile()(samples), expected)
+    # the in place operations don't modify the input block
+    copy = samples.copy()
+    expression.compile()(copy)
+    assert np.array_equal(copy, samples)
+
+
+@pytest.mark.parametrize("block_rows", [1, 7, 1000])
+def test_filter_state_is_carried_between_blocks(block_rows: int):
+    samples = np.random.randn(200, 1)
+    expression = Expression({"name": "x", "type": float, "shape": [1]}) \
+        .scale(2.).filter(TrapezoidFilter(5, 10, 0.1))
+    blocks = [samples[i:i + block_rows]
+              for i in range(0, len(samples), block_rows)]
+    result = np.concatenate(list(expression(blocks)))
+    expected = list(trapezoid_filter(5, 10, 0.1, samples[:, 0] * 2.))
+    assert np.array_equal(result[:, 0], expected)
+    # every compiled operator starts with a fresh filter state
+    assert np.array_equal(np.concatenate(list(expression(blocks))), result)
+
+
+def test_expressions_share_prefixes():
+    base = Expression(int_stream).scale(2)
+    clipped = base.clip(0, 4)
+    shifted = base.offset(1)
+    block = np.arange(5).reshape(-1, 1)
+    assert base.compile()(block)[:, 0].tolist() == [0, 2, 4, 6, 8]
+    assert clipped.compile()(block)[:, 0].tolist() == [0, 2, 4, 4, 4]
+    assert shifted.compile()(block)[:, 0].tolist() == [1, 3, 5, 7, 9]
+
+
+def test_apply_changes_the_shape():
+    expression = Expression(float_stream).apply(
+        lambda x: np.hypot(x[:, 0], x[:, 1]))
+    assert expression.metadata["shape"] == [1]
+    samples = np.random.randn(10, 2)
+    result = expression.compile()(samples)
+    assert result.shape == (10, 1)
+    assert np.allclose(result[:, 0], np.hypot(samples[:, 0], samples[:, 1]))
+
+
+def test_variable_length_and_sparse_columns():
+    expression = Expression(variable_stream).scale(2.).offset(1.)
+    operator = expression.compile()
+    rows = [np.array([1., 2.]), np.array([]), np.array([3.])]
+    assert [r.tolist() for r in operator(rows)] == [[3., 5.], [], [7.]]
+    assert operator([]) == []
+    rated = Expression(dict(int_stream, rate=10.)).scale(3)
+    column = SparseColumn(np.array([[1], [2]]), np.array([True, False, True]))
+    result = rated.compile()(column)
+    assert isinstance(result, SparseColumn)
+    assert result.values[:, 0].tolist() == [3, 6]
+    assert result.present.tolist() == [True, False, True]
+
+
+def test_compiled_operator_can_be_pickled():
+    operator = Expression(float_stream).filter(TrapezoidFilter(2, 3, 0.1)) \
+        .digitize(0.5).compile()
+    samples = np.random.randn(20, 2)
+    copy = pickle.loads(pickle.dumps(operator))
+    assert np.array_equal(copy(samples), operator(samples))
+
+
+def test_on_stream_transforms_rows():
+    rows = [np.array([i, -i], dtype=float) for i in range(10)]
+    expression = Expression(float_stream).clip(-3., 3.)
+    metadata, result = expression.on_stream((float_stream, iter(rows)),
+                                            block_rows=4)
+    assert metadata["type"] is float
+    assert [row.tolist() for row in result] == \
+        [[min(i, 3.), max(-i, -3.)] for i in range(10)]
+    with pytest.raises(ValueError):
+        expression.on_stream((int_stream, iter([])))
+    metadata, blocks = expression.on_blocks(
+        (float_stream, [np.array([[5., -5.]])]))
+    assert next(blocks).tolist() == [[3., -3.]]
+
+
+@pytest.mark.parametrize("type_name", ["int16", "float32"])
+def test_sized_sources(type_name: str):
+    # the metadata of the streams are separate copies of the metadata the
+    # expression was built from
+    stream = {"name": "a", "type": VALUE_TYPES[type_name], "shape": [1]}
+    expression = Expression(dict(stream)).scale(2)
+    samples = np.arange(4, dtype=type_name).reshape(4, 1)
+    metadata, blocks = expression.on_blocks((dict(stream), iter([samples])))
+    block = next(blocks)
+    assert metadata["type"] == stream["type"]
+    assert block.dtype == type_name
+    assert np.array_equal(block, samples * 2)
+    metadata, rows = expression.on_stream(
+        (dict(stream), iter(list(samples))), block_rows=3)
+    assert [row.tolist() for row in rows] == (samples * 2).tolist()
+    with pytest.raises(ValueError):
+        expression.on_blocks((int_stream, iter([])))
+
+
+def test_large_blocks_are_processed_in_chunks():
+    samples = np.random.randn(50000, 4) * 5
+    expression = Expression({"name": "x", "type": float, "shape": [4]}) \
+        .clip(-3., 3.).scale(2.).digitize(0.1) \
+        .apply(lambda x: x[::-1]).offset(1)
+    expected = Digitize(0.1)(np.clip(samples, -3., 3.) * 2.)[::-1] + 1
+    result = expression.compile()(samples)
+    assert result.dtype == np.dtype(int)
+    assert np.array_equal(result, expected)
+
+
+@pytest.mark.parametrize("type_, build, expected_type", [
+    ("int16", lambda e: e.scale(2).offset(-3), "int16"),
+    ("int16", lambda e: e.scale(100000), "int64"),
+    ("int16", lambda e: e.scale(0.5), "float64"),
+    ("uint8", lambda e: e.offset(-1), "int16"),
+    ("uint8", lambda e: e.clip(0, 200), "uint8"),
+    ("float32", lambda e: e.scale(2).offset(0.5), "float32"),
+    ("float32", lambda e: e.digitize(0.1, np.int8), "int8"),
+])
+def test_narrow_types_are_preserved(type_: str, build, expected_type: str):
+    stream = {"name": "x", "type": np.dtype(type_), "shape": [1]}
+    expression = build(Expression(stream))
+    assert np.dtype(expression.metadata["type"]) == np.dtype(expected_type)
+    block = np.arange(12, dtype=type_).reshape(-1, 1)
+    result = expression.compile()(block)
+    assert result.dtype == np.dtype(expected_type)
+    # the values are the same as with the 64 bit types
+    wide = {"name": "x", "type": float, "shape": [1]}
+    expected = build(Expression(wide)).compile()(block.astype(float))
+    assert np.allclose(result, expected)
+
+
+def test_digitize_saturates():
+    stream = {"name": "x", "type": float, "shape": [1]}
+    block = np.array([[-1000.], [-1.25], [1.25], [1000.]])
+    result = Expression(stream).digitize(0.5, np.int8).compile()(block)
+    assert np.array_equal(result[:, 0], [-128, -2, 2, 127])
+    assert np.array_equal(result, Digitize(0.5, np.int8)(block))
+
+
+def test_stage_needs_call():
+    class Incomplete(_Stage):
+        def output_metadata(self, metadata: Dict[str, Any]
+                            ) -> Dict[str, Any]:
+            return metadata
+
+    with pytest.raises(TypeError):
+        Incomplete()
@@ -0,0 +1,99 @@
+from io import BytesIO, StringIO, TextIOWrapper
+import json
+import threading
+import time
+import pytest
+from signal_tools.instrumentation import PipelineStats, TimedReader, \
+    TimedWriter
+from signal_tools.parsers import SignalStreams
+
+data = """\
+Metadata:
+streams:
+  - name: counter
+    type: int
+    shape: [1]
+Data:
+""" + "".join(f"{i}\n" for i in range(1000))
+
+
+def test_nested_stages_are_exclusive():
+    stats = PipelineStats("test")
+    with stats.stage("operator"):
+        time.sleep(0.02)
+        with stats.stage("write"):
+            time.sleep(0.05)
+    assert 0.05 <= stats.seconds["write"] < 0.07
+    assert 0.02 <= stats.seconds["operator"] < 0.05
+    assert stats.summary()["bottleneck"] == "write"
+
+
+def test_timed_iterable():
+    def produce():
+        for i in range(3):
+            time.sleep(0.01)
+            yield i
+
+    stats = PipelineStats("test")
+    assert list(stats.timed(produce(), "parse")) == [0, 1, 2]
+    assert stats.seconds["parse"] >= 0.03
+    assert stats.seconds["operator"] == 0.
+
+
+@pytest.mark.parametrize("block_rows", [1, 64, 4096])
+def test_parser_counters(block_rows: int):
+    stats = PipelineStats("test")
+    streams = SignalStreams(BytesIO(data.encode()), block_rows, stats)
+    rows = sum(len(block[0]) for block in streams.iter_blocks())
+    assert rows == stats.rows_in == 1000
+    assert stats.bytes_in == len(data)
+    assert stats.seconds["parse"] > 0.
+
+
+def test_text_wrapper_over_reader():
+    stats = PipelineStats("test")
+    text = TextIOWrapper(TimedReader(BytesIO(data.encode()), stats))
+    assert text.read() == data
+    assert stats.bytes_in == len(data)
+
+
+def test_writer_and_reports():
+    reports = StringIO()
+    stats = PipelineStats("test", interval=1e-9, stream=reports)
+    out = TimedWriter(BytesIO(), stats)
+    for _ in range(3):
+        out.write(b"abcd")
+        stats.count(rows_out=1)
+        stats.tick()
+    stats.report()
+    lines = [json.loads(line) for line in reports.getvalue().splitlines()]
+    assert [line["final"] for line in lines] == [False] * 3 + [True]
+    assert lines[-1]["bytes_out"] == 12 and lines[-1]["rows_out"] == 3
+    assert out.getvalue() == b"abcd" * 3
+
+
+def test_threads_share_stats():
+    stats = PipelineStats("test")
+
+    def work():
+        for _ in range(1000):
+            with stats.stage("parse"):
+                stats.count(rows_in=1, bytes_in=2)
+        with stats.stage("read"):
+            time.sleep(0.02)
+
+    threads = [threading.Thread(target=work) for _ in range(4)]
+    # the stages of the other threads are not nested in this one
+    with stats.stage("write"):
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    assert stats.rows_in == 4000 and stats.bytes_in == 8000
+    assert stats.seconds["read"] >= 0.08
+    assert stats.seconds["write"] >= 0.02
+
+
+def test_invalid_interval():
+    with pytest.raises(ValueError):
+        PipelineStats("test", interval=0)
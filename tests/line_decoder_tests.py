@@ -0,0 +1,167 @@
+from typing import Any, Dict, List
+import numpy as np
+import pytest
+from signal_tools.line_decoder import data_regex, decoder_for
+
+mixed_streams = [{"type": float, "shape": [2]},
+                 {"type": int, "shape": [-1]},
+                 {"type": int, "shape": [1]}]
+
+
+def test_decoders_are_cached_by_schema():
+    decoder = decoder_for([{"name": "a", "type": float, "shape": [2]}])
+    assert decoder_for([{"name": "b", "type": float, "shape": 2}]) \
+        is decoder
+    assert decoder_for([{"type": int, "shape": [2]}]) is not decoder
+
+
+@pytest.mark.parametrize("lines", [
+    # the canonical separators that are decoded on the fast path
+    ["1.5, 2 | 3, 4 | 5\n", "-1e3, 2.25E-2 |  | +6\n"],
+    ["1.5 2|3 4|5\n", "-1e3 2.25E-2||+6\n"],
+    # unusual separators that need the line by line decoding
+    ["1.5 ,2 | 3 ,4 | 5\n", "-1e3,2.25E-2 | | +6,\n"],
+    ["1.5\t2 | 3 4 | 5\n", "-1e3 2.25E-2 | | +6 , \n"],
+])
+def test_decode_mixed_streams(lines: List[str]):
+    block = decoder_for(mixed_streams).decode(lines)
+    assert np.array_equal(block[0], [[1.5, 2.], [-1e3, 2.25e-2]])
+    assert [row.tolist() for row in block[1]] == [[3, 4], []]
+    assert block[1][0].dtype.kind == "i"
+    assert np.array_equal(block[2], [[5], [6]])
+
+
+@pytest.mark.parametrize("streams, lines, invalid_line", [
+    ([{"type": int, "shape": [2]}], ["1 2\n", "1 2 3\n", "12\n"],
+     "1 2 3\n"),
+    ([{"type": int, "shape": [2]}], ["1 2\n", "1 2.5\n"], "1 2.5\n"),
+    ([{"type": int, "shape": [2]}], ["1 2\n", " 1 2\n"], " 1 2\n"),
+    ([{"type": float, "shape": [2]}], ["1 .5\n"], "1 .5\n"),
+    ([{"type": float, "shape": [2]}], ["1,, 5\n"], "1,, 5\n"),
+    ([{"type": float, "shape": [1]}], ["1e\n"], "1e\n"),
+    ([{"type": float, "shape": [1]}], ["1\n", "nan\n"], "nan\n"),
+    ([{"type": float, "shape": [1]}, {"type": int, "shape": [1]}],
+     ["1 | 2\n", "1 2\n"], "1 2\n"),
+    (mixed_streams, ["1 2 | 3 | 4 5\n"], "1 2 | 3 | 4 5\n"),
+    (mixed_streams, ["1 2 | x | 4\n"], "1 2 | x | 4\n"),
+    (mixed_streams, ["1 2 | 3 | 4 | 5\n"], "1 2 | 3 | 4 | 5\n"),
+    # one element moved from every stream to the next one
+    ([{"type": float, "shape": [3]}, {"type": int, "shape": [1]}],
+     ["1.25 2.5 3 | 4\n", "1.25 2.5 | 30 40\n"], "1.25 2.5 | 30 40\n"),
+    ([{"type": float, "shape": [2]}, {"type": int, "shape": [2]}],
+     ["1.25 2.5 3 | 4\n"], "1.25 2.5 3 | 4\n"),
+    # values outside of the range of the type
+    ([{"type": np.dtype("float32"), "shape": [2]}], ["1 2\n", "1 1e50\n"],
+     "1 1e50\n"),
+    ([{"type": float, "shape": [1]}], ["1\n", "-1e400\n"], "-1e400\n"),
+    ([{"type": np.dtype("int8"), "shape": [1]}], ["1\n", "128\n"], "128\n"),
+])
+def test_decode_invalid_lines(streams: List[Dict[str, Any]],
+                              lines: List[str], invalid_line: str):
+    with pytest.raises(ValueError) as e:
+        decoder_for(streams).decode(lines)
+    assert str(e.value) == \
+        f"Data line doesn't match the expected format: {invalid_line}"
+
+
+@pytest.mark.parametrize("stream, value_str, expected_value", [
+    ({"type": int}, "42", 42),
+    ({"type": int}, "-5", -5),
+    ({"type": float}, "3.14", 3.14),
+    ({"type": float}, "-0.5", -0.5),
+    ({"type": np.dtype("uint16")}, "4095", 4095),
+    ({"type": np.dtype("float32")}, "0.25", 0.25),
+])
+def test_decode_value_types(stream: Dict[str, Any], value_str: str,
+                            expected_value: Any):
+    block = decoder_for([{**stream, "shape": [1]}]).decode(
+        [value_str + "\n"])
+    assert block[0][0, 0] == expected_value
+
+
+@pytest.mark.parametrize("stream, value_str", [
+    ({"type": "unsupported_type"}, "42"),
+    ({"type": "unsupported_type"}, "3.14"),
+])
+def test_unsupported_type(stream: Dict[str, Any], value_str: str):
+    with pytest.raises(ValueError, match="Unsupported data type:"):
+        decoder_for([{**stream, "shape": [1]}]).decode(
+            [value_str + "\n"])
+
+
+@pytest.mark.parametrize("streams, example_data", [
+    (
+        [{"type": int, "shape": [2]}],
+        ["42 -5", "100 200", "-1 0"]
+    ),
+    (
+        [{"type": float, "shape": [2]}],
+        ["3.14 -0.5", "1.0 2.0", "1.23e-4 5.67E+8"]
+    ),
+    (
+        [{"type": int, "shape": (2,)}, {"type": float, "shape": (2,)}],
+        ["42 -5 | 3.14 -0.5", "1 2 | 3.0 4.0", "0 0 | 0.0 0.0"]
+    ),
+    (
+        [{"type": float, "shape": (2, 2)}],
+        ["1.0 2.0 3.0 4.0", "1.23 -4.56 7.89 -0.12"]
+    ),
+    (
+        [{"type": int, "shape": (1,)}, {"type": float, "shape": (2, 1)}],
+        ["1 | 2.0 3.0", "0 | 0.0 0.0", "-1 | 1.23 4.56"]
+    ),
+    (
+        [{"type": int, "shape": (2,)}],
+        ["42 -5", "100, 200", "-1, 0"]
+    ),
+    (
+        [{"type": float, "shape": (2,)}],
+        ["3.14 -0.5", "1.0, 2.0", "1.23e-4, 5.67E+8"]
+    ),
+    (
+        [{"type": int, "shape": (2,)}, {"type": float, "shape": (2,)}],
+        ["42 -5 | 3.14 -0.5", "1, 2 | 3.0, 4.0", "0, 0 | 0.0, 0.0"]
+    ),
+    (
+        [{"type": float, "shape": (2, 2)}],
+        ["1.0 2.0 3.0 4.0", "1.23, -4.56, 7.89, -0.12"]
+    ),
+    (
+        [{"type": int, "shape": (1,)}, {"type": float, "shape": (2, 1)}],
+        ["1 | 2.0 3.0", "0 | 0.0, 0.0", "-1 | 1.23, 4.56"]
+    ),
+])
+def test_data_regex(streams: List[Dict[str, Any]], example_data: List[str]):
+    regex = data_regex(streams)
+    for data in example_data:
+        match = regex.fullmatch(data)
+        assert match is not None
+
+
+@pytest.mark.parametrize("streams, invalid_data", [
+    (
+        [{"type": int, "shape": (2,)}],
+        "42 -5 3"
+    ),
+    (
+        [{"type": float, "shape": (2,)}],
+        "3.14 -0.5 1.0"
+    ),
+    (
+        [{"type": int, "shape": (2,)}, {"type": float, "shape": (2,)}],
+        "42 -5 3.14"
+    ),
+    (
+        [{"type": float, "shape": (2, 2)}],
+        "1.0 2.0 3.0"
+    ),
+    (
+        [{"type": int, "shape": (1,)}, {"type": float, "shape": (2, 1)}],
+        "1 2.0"
+    ),
+])
+def test_data_regex_invalid(streams: List[Dict[str, Any]],
+                            invalid_data: str):
+    regex = data_regex(streams)
+    match = regex.fullmatch(invalid_data)
+    assert match is None
@@ -0,0 +1,170 @@
+import asyncio
+import threading
+import numpy as np
+import pytest
+from click.testing import CliRunner
+from signal_tools.cli import file_io
+from signal_tools.network import StreamServer, parse_address, \
+    serve_blocks, subscribe
+from signal_tools.parsers import SignalStreams
+from signal_tools.stream_utils import concatenate_blocks
+
+_metadata = [{"name": "a", "type": float, "shape": [3]},
+             {"name": "b", "type": int, "shape": [-1]}]
+
+
+def _blocks(num_blocks: int = 20, rows: int = 50):
+    rng = np.random.default_rng(3)
+    return [[rng.standard_normal((rows, 3)),
+             [np.arange(k) for k in rng.integers(0, 4, rows)]]
+            for _ in range(num_blocks)]
+
+
+def _assert_blocks_equal(block: list, expected: list):
+    assert np.array_equal(block[0], expected[0])
+    assert len(block[1]) == len(expected[1])
+    assert all(np.array_equal(a, b) for a, b in zip(block[1], expected[1]))
+
+
+async def _receive(address: str) -> list:
+    streams = await subscribe(address)
+    try:
+        assert streams.metadata["streams"][0]["name"] == "a"
+        return [block async for block in streams.iter_blocks()]
+    finally:
+        await streams.close()
+
+
+@pytest.mark.parametrize("encoding", ["utf-8", "bin"])
+@pytest.mark.parametrize("kind", ["tcp", "unix"])
+def test_all_subscribers_receive_the_stream(tmp_path, encoding: str,
+                                            kind: str):
+    blocks = _blocks()
+    address = "tcp://127.0.0.1:0" if kind == "tcp" \
+        else f"unix://{tmp_path / 'socket'}"
+
+    async def run():
+        server = StreamServer(_metadata, encoding)
+        await server.start(address)
+        received = [asyncio.ensure_future(_receive(server.address))
+                    for _ in range(3)]
+        await server.wait_for_subscribers(3)
+        for block in blocks:
+            await server.publish(block)
+        await server.close()
+        return server, await asyncio.gather(*received)
+
+    server, received = asyncio.run(run())
+    assert server.published == len(blocks)
+    assert server.dropped == 0
+    for result in received:
+        _assert_blocks_equal(concatenate_blocks(result),
+                             concatenate_blocks(blocks))
+
+
+@pytest.mark.parametrize("policy", ["block", "drop"])
+def test_slow_subscriber(policy: str):
+    # large blocks, so that the socket buffers fill up quickly
+    block = [np.ones((20000, 3)), [np.arange(2)] * 20000]
+    num_blocks = 40
+
+    async def run():
+        server = StreamServer(_metadata, "bin", buffer_blocks=2,
+                              policy=policy)
+        await server.start("tcp://127.0.0.1:0")
+        streams = await subscribe(server.address, 20000)
+        await server.wait_for_subscribers(1)
+
+        async def publish():
+            for _ in range(num_blocks):
+                await server.publish(block)
+            await server.close()
+
+        publisher = asyncio.ensure_future(publish())
+        # the subscriber only starts reading once the publisher is done or
+        # waits for it
+        await asyncio.wait([publisher], timeout=0.5)
+        rows = 0
+        async for received in streams.iter_blocks(20000):
+            assert np.array_equal(received[0], block[0])
+            rows += len(received[0])
+        await publisher
+        await streams.close()
+        return server, rows
+
+    server, rows = asyncio.run(run())
+    if policy == "block":
+        assert server.dropped == 0
+        assert rows == num_blocks * 20000
+    else:
+        assert server.dropped > 0
+        assert rows == (num_blocks - server.dropped) * 20000
+
+
+def test_disconnected_subscriber_does_not_stop_the_publisher():
+    blocks = _blocks(50, 1000)
+
+    async def run():
+        server = StreamServer(_metadata, "utf-8", buffer_blocks=1)
+        await server.start("tcp://127.0.0.1:0")
+        gone = await subscribe(server.address)
+        await gone.close()
+        received = asyncio.ensure_future(_receive(server.address))
+        await server.wait_for_subscribers(2)
+        for block in blocks:
+            await server.publish(block)
+        await server.close()
+        return await received
+
+    result = asyncio.run(asyncio.wait_for(run(), 60))
+    _assert_blocks_equal(concatenate_blocks(result),
+                         concatenate_blocks(blocks))
+
+
+@pytest.mark.parametrize("address", ["tcp://localhost", "tcp://:80",
+                                     "unix://", "udp://localhost:80",
+                                     "localhost:80"])
+def test_invalid_addresses(address: str):
+    with pytest.raises(ValueError):
+        parse_address(address)
+
+
+def test_parse_address():
+    assert parse_address("tcp://localhost:5000") == \
+        ("tcp", ("localhost", 5000))
+    assert parse_address("unix:///tmp/stream.sock") == \
+        ("unix", "/tmp/stream.sock")
+
+
+@pytest.mark.parametrize("encoding", ["utf-8", "bin"])
+def test_connect_command(tmp_path, encoding: str):
+    blocks = _blocks()
+    address = f"unix://{tmp_path / 'socket'}"
+    server_thread = threading.Thread(
+        target=asyncio.run,
+        args=(serve_blocks(address, _metadata, blocks, "bin"),))
+    server_thread.start()
+    output = tmp_path / "out.txt"
+    try:
+        # wait for the socket of the server
+        for _ in range(100):
+            if (tmp_path / "socket").exists():
+                break
+            server_thread.join(0.05)
+        result = CliRunner().invoke(
+            file_io, [str(output), "out", encoding, "connect", address])
+    finally:
+        server_thread.join(10)
+    assert result.exit_code == 0, result.output
+    with open(output, "rb") as f:
+        received = list(SignalStreams(f).iter_blocks())
+    _assert_blocks_equal(concatenate_blocks(received),
+                         concatenate_blocks(blocks))
+
+
+def test_connect_command_without_server(tmp_path):
+    result = CliRunner().invoke(
+        file_io, [str(tmp_path / "out.txt"), "out", "bin", "connect",
+                  f"unix://{tmp_path / 'missing'}"])
+    assert result.exit_code == 1
+    assert "Could not connect" in result.output
@@ -0,0 +1,113 @@
+from typing import Any, List
+import numpy as np
+import pytest
+from signal_tools.filter import TrapezoidFilter
+from signal_tools.operators import Digitize
+from signal_tools.parallel import ParallelBlockTransform, \
+    ParallelFileReader
+from signal_tools.parsers import SignalStreams
+from signal_tools.stream_utils import collect_blocks_into_string, \
+    concatenate_blocks
+from signal_tools.binary_format import collect_blocks_into_frames
+
+
+def _blocks(num_blocks: int = 6, rows: int = 50):
+    rng = np.random.default_rng(11)
+    return [[rng.standard_normal((rows, 2)),
+             np.arange(rows).reshape(-1, 1),
+             rng.standard_normal((rows, 3)),
+             [rng.standard_normal(k) for k in rng.integers(0, 4, rows)]]
+            for _ in range(num_blocks)]
+
+
+def _operators():
+    return {0: TrapezoidFilter(3, 5, 0.1),
+            2: TrapezoidFilter(2, 4, 0.),
+            3: Digitize(0.1)}
+
+
+@pytest.mark.parametrize("jobs", [2, 3, 8])
+@pytest.mark.parametrize("max_pending_blocks", [1, 4])
+def test_parallel_matches_inline(jobs: int, max_pending_blocks: int):
+    blocks = _blocks()
+    expected = list(ParallelBlockTransform(_operators())(blocks))
+    transform = ParallelBlockTransform(_operators(), jobs,
+                                       max_pending_blocks)
+    result = list(transform(blocks))
+    assert len(result) == len(expected)
+    for block, expected_block in zip(result, expected):
+        for i in (0, 1, 2):
+            assert np.array_equal(block[i], expected_block[i])
+        assert all(np.array_equal(a, b)
+                   for a, b in zip(block[3], expected_block[3]))
+    assert transform.rows == sum(len(b[0]) for b in blocks)
+
+
+def _failing_operator(block):
+    raise ValueError("operator failed")
+
+
+def test_worker_errors_are_raised():
+    transform = ParallelBlockTransform({0: _failing_operator,
+                                        2: TrapezoidFilter(1, 1, 0.)}, 2)
+    with pytest.raises(ValueError, match="operator failed"):
+        list(transform(_blocks()))
+
+
+_file_metadata = [{"name": "a", "type": float, "shape": [2]},
+                  {"name": "b", "type": int, "shape": [1]},
+                  {"name": "c", "type": float, "shape": [2, 2]},
+                  {"name": "d", "type": float, "shape": [-1]}]
+
+
+@pytest.fixture(params=["utf-8", "bin"])
+def stream_file(request, tmp_path):
+    blocks = _blocks(num_blocks=20)
+    for block in blocks:
+        block[2] = block[2][:, :2].repeat(2, axis=1).reshape(-1, 2, 2)
+    streams = [(m, [b[i] for b in blocks])
+               for i, m in enumerate(_file_metadata)]
+    path = tmp_path / "data.stream"
+    if request.param == "bin":
+        path.write_bytes(b"".join(collect_blocks_into_frames(streams)))
+    else:
+        text = "".join(collect_blocks_into_string(streams))
+        # comments in between the data lines are skipped
+        lines = text.splitlines(keepends=True)
+        lines.insert(len(lines) // 2, "  # a comment\n")
+        path.write_text("".join(lines))
+    return path
+
+
+@pytest.mark.parametrize("jobs", [1, 3])
+@pytest.mark.parametrize("chunk_bytes", [1, 500, 1 << 24])
+def test_parallel_file_reader(stream_file, jobs: int, chunk_bytes: int):
+    with open(stream_file, "rb") as f:
+        expected = concatenate_blocks(list(SignalStreams(f).iter_blocks()))
+    reader = ParallelFileReader(stream_file, jobs, chunk_bytes)
+    assert reader.metadata["streams"][0]["name"] == "a"
+    block = reader.read_all()
+    for i in range(3):
+        assert np.array_equal(block[i], expected[i])
+    assert len(block[3]) == len(expected[3])
+    assert all(np.array_equal(a, b) for a, b in zip(block[3], expected[3]))
+
+
+def _column_sum(block: List[Any], index: int) -> float:
+    return float(np.sum(block[index]))
+
+
+@pytest.mark.parametrize("jobs", [1, 3])
+def test_parallel_file_reader_map_ranges(stream_file, jobs: int):
+    reader = ParallelFileReader(stream_file, jobs, chunk_bytes=500)
+    sums = list(reader.map_ranges(_column_sum, 1))
+    assert len(sums) > 1
+    assert sum(sums) == np.sum(reader.read_all()[1])
+
+
+def test_parallel_file_reader_reports_invalid_lines(tmp_path):
+    path = tmp_path / "invalid.stream"
+    path.write_text("Metadata:\nstreams:\n  - name: a\n    type: int\n"
+                    "    shape: [2]\nData:\n" + "1 2\n" * 100 + "1\n")
+    with pytest.raises(ValueError, match="doesn't match"):
+        ParallelFileReader(path, jobs=2, chunk_bytes=64).read_all()
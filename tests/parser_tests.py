@@ -103,104 +103,6 @@ def test_data_stream(input_data: str,
             assert np.array_equal(e, p)
 
 
-@pytest.mark.parametrize("stream, value_str, expected_value", [
-    ({"type": int}, "42", 42),
-    ({"type": int}, "-5", -5),
-    ({"type": float}, "3.14", 3.14),
-    ({"type": float}, "-0.5", -0.5),
-])
-def test_convert_type(stream: dict[str, Any], value_str: str, expected_value: Any):
-    converted_value = SignalStreams._convert_type(stream, value_str)
-    assert converted_value == expected_value
-
-
-@pytest.mark.parametrize("stream, value_str", [
-    ({"type": "unsupported_type"}, "42"),
-    ({"type": "unsupported_type"}, "3.14"),
-])
-def test_convert_type_unsupported_type(stream: dict[str, Any], value_str: str):
-    with pytest.raises(ValueError, match="Unsupported data type:"):
-        SignalStreams._convert_type(stream, value_str)
-
-
-@pytest.mark.parametrize("streams, example_data", [
-    (
-        [{"type": int, "shape": [2]}],
-        ["42 -5", "100 200", "-1 0"]
-    ),
-    (
-        [{"type": float, "shape": [2]}],
-        ["3.14 -0.5", "1.0 2.0", "1.23e-4 5.67E+8"]
-    ),
-    (
-        [{"type": int, "shape": (2,)}, {"type": float, "shape": (2,)}],
-        ["42 -5 | 3.14 -0.5", "1 2 | 3.0 4.0", "0 0 | 0.0 0.0"]
-    ),
-    (
-        [{"type": float, "shape": (2, 2)}],
-        ["1.0 2.0 3.0 4.0", "1.23 -4.56 7.89 -0.12"]
-    ),
-    (
-        [{"type": int, "shape": (1,)}, {"type": float, "shape": (2, 1)}],
-        ["1 | 2.0 3.0", "0 | 0.0 0.0", "-1 | 1.23 4.56"]
-    ),
-    (
-        [{"type": int, "shape": (2,)}],
-        ["42 -5", "100, 200", "-1, 0"]
-    ),
-    (
-        [{"type": float, "shape": (2,)}],
-        ["3.14 -0.5", "1.0, 2.0", "1.23e-4, 5.67E+8"]
-    ),
-    (
-        [{"type": int, "shape": (2,)}, {"type": float, "shape": (2,)}],
-        ["42 -5 | 3.14 -0.5", "1, 2 | 3.0, 4.0", "0, 0 | 0.0, 0.0"]
-    ),
-    (
-        [{"type": float, "shape": (2, 2)}],
-        ["1.0 2.0 3.0 4.0", "1.23, -4.56, 7.89, -0.12"]
-    ),
-    (
-        [{"type": int, "shape": (1,)}, {"type": float, "shape": (2, 1)}],
-        ["1 | 2.0 3.0", "0 | 0.0, 0.0", "-1 | 1.23, 4.56"]
-    ),
-])
-def test_generate_data_regex(streams: list[dict[str, Any]], example_data: list[str]):
-    regex = SignalStreams._generate_data_regex(streams)
-    for data in example_data:
-        print(regex)
-        match = regex.fullmatch(data)
-        assert match is not None
-
-
-@pytest.mark.parametrize("streams, invalid_data", [
-    (
-        [{"type": int, "shape": (2,)}],
-        "42 -5 3"
-    ),
-    (
-        [{"type": float, "shape": (2,)}],
-        "3.14 -0.5 1.0"
-    ),
-    (
-        [{"type": int, "shape": (2,)}, {"type": float, "shape": (2,)}],
-        "42 -5 3.14"
-    ),
-    (
-        [{"type": float, "shape": (2, 2)}],
-        "1.0 2.0 3.0"
-    ),
-    (
-        [{"type": int, "shape": (1,)}, {"type": float, "shape": (2, 1)}],
-        "1 2.0"
-    ),
-])
-def test_generate_data_regex_invalid(streams: list[dict[str, Any]], invalid_data: str):
-    regex = SignalStreams._generate_data_regex(streams)
-    match = regex.fullmatch(invalid_data)
-    assert match is None
-
-
 @pytest.mark.parametrize("input_str,expected", [
     (
         "Metadata:\n"
@@ -358,3 +260,123 @@ def test_split_into_individual_streams(serial_data: str, expected: List[Tuple[Di
         assert stream_metadata == expected_metadata
         for tensor, expected_tensor in zip(stream, expected_stream):
             assert np.array_equal(tensor, expected_tensor)
+
+
+@pytest.mark.parametrize("serial_data, block_rows, expected_shapes", [
+    (
+        "Metadata:\n"
+        "streams:\n"
+        "  - shape: [2, 2]\n"
+        "    type: int\n"
+        "  - shape: [3]\n"
+        "    type: float\n"
+        "Data:\n"
+        "1, 2, 3, 4 | 1.1, 2.2, 3.3\n"
+        "# comment inside the data\n"
+        "4, 3, 2, 1 | 4.4, 5.5, 6.6\n"
+        "6, 5, 4, 3 | 7.7, 8.8, 9.9\n",
+        2,
+        [[(2, 2, 2), (2, 3)], [(1, 2, 2), (1, 3)]]
+    ),
+    (
+        "Metadata:\n"
+        "streams:\n"
+        "  - shape: [-1]\n"
+        "    type: int\n"
+        "  - shape: [2, 1]\n"
+        "    type: float\n"
+        "Data:\n"
+        "1 2 3 | 1.0 2.0\n"
+        "| 3.0, 4.0\n"
+        "5 | 5.0 6.0\n",
+        5,
+        [[3, (3, 2, 1)]]
+    ),
+])
+def test_iter_blocks(serial_data: str, block_rows: int,
+                     expected_shapes: list):
+    rows = list(SignalStreams(StringIO(serial_data)))
+    blocks = list(SignalStreams(StringIO(serial_data)).iter_blocks(
+        block_rows=block_rows))
+    assert len(blocks) == len(expected_shapes)
+    for block, shapes in zip(blocks, expected_shapes):
+        for column, shape in zip(block, shapes):
+            if isinstance(shape, int):
+                assert isinstance(column, list)
+                assert len(column) == shape
+            else:
+                assert column.shape == shape
+                assert column.flags["C_CONTIGUOUS"]
+    # the rows of the blocks hold the same tensors as the row iterator
+    block_rows_flat = [[np.asarray(column[i]) for column in block]
+                       for block in blocks
+                       for i in range(len(block[0]))]
+    assert len(rows) == len(block_rows_flat)
+    for row, block_row in zip(rows, block_rows_flat):
+        for tensor, block_tensor in zip(row, block_row):
+            assert np.array_equal(tensor.ravel(order="F"),
+                                  block_tensor.ravel(order="F"))
+
+
+def test_iter_blocks_after_rows():
+    serial_data = ("Metadata:\n"
+                   "streams:\n"
+                   "  - shape: [1]\n"
+                   "    type: int\n"
+                   "Data:\n"
+                   + "".join(f"{i}\n" for i in range(10)))
+    data_stream = SignalStreams(StringIO(serial_data), block_rows=4)
+    assert np.array_equal(next(data_stream)[0], np.array([0]))
+    blocks = list(data_stream.iter_blocks(block_rows=3))
+    values = np.concatenate([b[0][:, 0] for b in blocks])
+    assert np.array_equal(values, np.arange(1, 10))
+
+
+@pytest.mark.parametrize("invalid_line", ["1 2 3 | 1.0\n", "1 2 3\n", "1\n"])
+def test_iter_blocks_invalid_line(invalid_line: str):
+    serial_data = ("Metadata:\n"
+                   "streams:\n"
+                   "  - shape: [2]\n"
+                   "    type: int\n"
+                   "Data:\n"
+                   "1 2\n"
+                   + invalid_line)
+    data_stream = SignalStreams(StringIO(serial_data))
+    with pytest.raises(ValueError, match="expected format"):
+        list(data_stream.iter_blocks())
+
+
+typed_data = """\
+Metadata:
+streams:
+  - name: adc
+    type: int16
+    shape: [2]
+  - name: time
+    type: float32
+    shape: [1]
+  - name: counts
+    type: uint8
+    shape: [-1]
+Data:
+-2048, 2047 | 0.5 | 1, 2
+0, 15 | 1.5 |
+"""
+
+
+def test_typed_streams_keep_their_width():
+    data_stream = SignalStreams(StringIO(typed_data))
+    assert [s["type"] for s in data_stream.metadata["streams"]] == \
+        [np.dtype("int16"), np.dtype("float32"), np.dtype("uint8")]
+    adc, time, counts = next(data_stream.iter_blocks())
+    assert adc.dtype == np.int16 and time.dtype == np.float32
+    assert [row.dtype for row in counts] == [np.uint8, np.uint8]
+    assert np.array_equal(adc, [[-2048, 2047], [0, 15]])
+
+
+@pytest.mark.parametrize("invalid_line", ["40000, 0 | 0.5 | 1\n",
+                                          "0, 0 | 0.5 | -1\n"])
+def test_values_out_of_range_of_the_type(invalid_line: str):
+    data_stream = SignalStreams(StringIO(typed_data + invalid_line))
+    with pytest.raises(ValueError, match="expected format"):
+        list(data_stream.iter_blocks())
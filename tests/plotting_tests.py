@@ -0,0 +1,109 @@
+from pathlib import Path
+import numpy as np
+import pytest
+from signal_tools.plotting import DensityPlot, EnvelopePlot, StreamPlot, \
+    WaterfallPlot, _Bins, make_plot
+from signal_tools.rates import SparseColumn
+
+streams = [{"name": "t", "type": float, "shape": [1]},
+           {"name": "y", "type": float, "shape": [2]},
+           {"name": "m", "type": int, "shape": [2, 3]},
+           {"name": "v", "type": float, "shape": [-1]},
+           {"name": "r", "type": float, "shape": [1], "rate": 10.}]
+
+
+def _split(array: np.ndarray, sizes):
+    start = 0
+    for size in sizes:
+        yield array[start:start + size]
+        start += size
+
+
+@pytest.mark.parametrize("samples, block_rows", [
+    (5, 1), (16, 3), (1000, 7), (1000, 1000), (12345, 256),
+])
+def test_bins_match_direct_reduction(samples: int, block_rows: int):
+    values = np.random.randn(samples, 3)
+    bins = _Bins(8, {"min": "min", "max": "max", "sum": "sum",
+                     "first": "first"})
+    for block in _split(values, [block_rows] * samples):
+        bins.add({"min": block, "max": block, "sum": block, "first": block})
+    assert bins.count == samples
+    assert 4 <= bins.used <= 8 or samples < 8
+    starts = np.arange(0, samples, bins.span)
+    assert np.array_equal(bins.arrays["min"][:bins.used],
+                          np.minimum.reduceat(values, starts))
+    assert np.array_equal(bins.arrays["max"][:bins.used],
+                          np.maximum.reduceat(values, starts))
+    assert np.allclose(bins.arrays["sum"][:bins.used],
+                       np.add.reduceat(values, starts))
+    assert np.array_equal(bins.arrays["first"][:bins.used], values[starts])
+    assert bins.counts().sum() == samples
+
+
+def test_envelope_memory_is_bounded_by_the_width():
+    plot = EnvelopePlot(streams, 1, size=(100, 50))
+    for _ in range(50):
+        plot.update([None, np.random.randn(4096, 2)])
+    assert plot.bins.arrays["min"].shape == (200, 2)
+    assert plot.bins.count == 50 * 4096
+    assert np.all(plot.bins.arrays["min"] <= plot.bins.arrays["max"])
+
+
+def test_density_counts_every_point_while_the_grid_grows():
+    plot = DensityPlot(streams, 1, 0, size=(20, 10))
+    total = 0
+    for scale in (1., 10., 1000.):
+        x = np.random.randn(500, 1) * scale
+        y = np.random.randn(500, 2) * scale
+        plot.update([x, y])
+        total += y.size
+    assert plot.counts.shape == (20, 10)
+    assert plot.counts.sum() == total
+    end = plot.origin + np.array(plot.size) * plot.cell
+    assert np.all(plot.origin <= plot.low) and np.all(plot.high < end)
+
+
+def test_waterfall_means():
+    plot = WaterfallPlot(streams, 1, size=(10, 4))
+    values = np.arange(40, dtype=float).reshape(20, 2)
+    plot.update([None, values])
+    means = plot.bins.arrays["sum"][:plot.bins.used] \
+        / plot.bins.counts()[:, np.newaxis]
+    assert np.allclose(means[:, 0], [3, 11, 19, 27, 35])
+
+
+@pytest.mark.parametrize("mode, y, x", [
+    ("xy", 1, None), ("xy", 1, 0), ("scatter", 1, 0), ("scatter", 4, None),
+    ("waterfall", 1, None), ("matrix", 2, None),
+])
+def test_save_image(tmp_path: Path, mode: str, y: int, x):
+    plot = make_plot(mode, streams, y, x, size=(64, 48))
+    # images of plots without data are valid as well
+    plot.save(str(tmp_path / "empty.png"))
+    for _ in range(3):
+        plot.update([np.random.randn(100, 1), np.random.randn(100, 2),
+                     np.random.randint(0, 9, (100, 2, 3)), None,
+                     SparseColumn(np.random.randn(50, 1),
+                                  np.arange(100) % 2 == 0)])
+    plot.save(str(tmp_path / "plot.png"))
+    assert (tmp_path / "plot.png").read_bytes()[:4] == b"\x89PNG"
+    assert not list(tmp_path.glob(".*.tmp"))
+
+
+@pytest.mark.parametrize("mode, y, x", [
+    ("unknown", 1, None), ("xy", 5, None), ("xy", 3, None), ("xy", 0, 1),
+    ("scatter", 4, 0),
+])
+def test_invalid_plots(mode: str, y: int, x):
+    with pytest.raises(ValueError):
+        make_plot(mode, streams, y, x)
+
+
+def test_plot_needs_draw():
+    class Incomplete(StreamPlot):
+        def _add(self, y, x):
+            pass
+
+    with pytest.raises(TypeError):
+        Incomplete(streams, 1)
@@ -0,0 +1,88 @@
+from io import StringIO
+from pathlib import Path
+import numpy as np
+import pytest
+from signal_tools.binary_format import collect_stream_into_frames
+from signal_tools.parsers import SignalStreams
+from signal_tools.random_access import MappedSignalFile
+
+header = """\
+Metadata:
+streams:
+  - name: stream1
+    type: float
+    shape: [2]
+  - name: stream2
+    type: int
+    shape: [-1]
+Data:
+"""
+
+
+def _serial_data(num_rows: int) -> str:
+    lines = []
+    for i in range(num_rows):
+        if i % 7 == 0:
+            lines.append("# a comment\n")
+        if i % 11 == 0:
+            lines.append("  # an indented comment\n")
+        lines.append(f"{i}.5, {-i} | "
+                     + " ".join(str(v) for v in range(i % 4)) + "\n")
+    return header + "".join(lines)
+
+
+@pytest.fixture(params=["utf-8", "bin"])
+def stream_file(request, tmp_path: Path):
+    serial_data = _serial_data(1000)
+    path = tmp_path / "stream.sig"
+    if request.param == "bin":
+        data_stream = SignalStreams(StringIO(serial_data))
+        path.write_bytes(b"".join(collect_stream_into_frames(
+            data_stream.split_into_individual_streams(), 37)))
+    else:
+        path.write_text(serial_data)
+    block = next(SignalStreams(StringIO(serial_data)).iter_blocks(10000))
+    return path, block
+
+
+@pytest.mark.parametrize("index_stride", [1, 64, 5000])
+@pytest.mark.parametrize("start, stop", [
+    (0, 10), (123, 456), (990, 2000), (17, 17), (999, 1000)])
+def test_read_rows(stream_file, index_stride: int, start: int, stop: int):
+    path, expected = stream_file
+    with MappedSignalFile(path, index_stride=index_stride) as signal_file:
+        assert len(signal_file) == 1000
+        block = signal_file.read_rows(start, stop)
+    assert np.array_equal(block[0], expected[0][start:stop])
+    assert len(block[1]) == len(expected[1][start:stop])
+    for row, expected_row in zip(block[1], expected[1][start:stop]):
+        assert np.array_equal(row, expected_row)
+
+
+def test_indexing_and_slicing(stream_file):
+    path, expected = stream_file
+    with MappedSignalFile(path, index_stride=16) as signal_file:
+        assert np.array_equal(signal_file[-1][0], expected[0][-1])
+        assert np.array_equal(signal_file[500][0], expected[0][500])
+        assert np.array_equal(signal_file[10:100:3][0],
+                              expected[0][10:100:3])
+        assert np.array_equal(signal_file[100:10:-3][0],
+                              expected[0][100:10:-3])
+        with pytest.raises(IndexError):
+            signal_file[1000]
+
+
+def test_sidecar_index(stream_file):
+    path, _ = stream_file
+    sidecar = path.with_name(path.name + ".idx.npz")
+    with MappedSignalFile(path, index_stride=16):
+        pass
+    assert sidecar.exists()
+    with MappedSignalFile(path, index_stride=16) as signal_file:
+        assert len(signal_file) == 1000
+    # a different stride invalidates the stored index
+    with MappedSignalFile(path, index_stride=32) as signal_file:
+        assert len(signal_file) == 1000
+        if signal_file.encoding == "utf-8":
+            assert np.all(signal_file._index_rows % 32 == 0)
+        assert signal_file.read_rows(40, 41)[0][0, 0] == 40.5
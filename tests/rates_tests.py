@@ -0,0 +1,200 @@
+from io import BytesIO, StringIO
+from typing import List
+import numpy as np
+import pytest
+from click.testing import CliRunner
+from signal_tools.binary_format import collect_blocks_into_frames
+from signal_tools.cli import apply_transformation
+from signal_tools.line_decoder import decoder_for
+from signal_tools.parsers import SignalStreams
+from signal_tools.rates import RateAligner, SparseColumn, merge_streams
+from signal_tools.stream_utils import collect_blocks_into_string, \
+    collect_stream_into_string, concatenate_blocks, validate_metadata
+
+serial_data = """\
+Metadata:
+streams:
+  - name: fast
+    type: float
+    shape: [2]
+    rate: 4
+  - name: slow
+    type: int
+    shape: [-1]
+    rate: 1.5
+  - name: counter
+    type: int
+    shape: [1]
+Data:
+0.5, 1.0 |  | 0
+1.5, 2.0 | ~ | 1
+~ | 7, 8 | 2
+2.5, 3.0 | ~ | 3
+"""
+
+
+def _assert_columns_equal(column, expected):
+    assert np.array_equal(column.present, expected.present)
+    assert len(column.values) == len(expected.values)
+    assert all(np.array_equal(a, b)
+               for a, b in zip(column.values, expected.values))
+
+
+def test_parse_empty_elements():
+    streams = SignalStreams(StringIO(serial_data))
+    assert streams.metadata["streams"][1]["rate"] == 1.5
+    block = next(streams.iter_blocks())
+    assert np.array_equal(block[0].present, [True, True, False, True])
+    assert np.array_equal(block[0].values, [[.5, 1.], [1.5, 2.], [2.5, 3.]])
+    assert np.array_equal(block[1].present, [True, False, True, False])
+    assert [v.tolist() for v in block[1].values] == [[], [7, 8]]
+    assert np.array_equal(block[2].ravel(), np.arange(4))
+
+    rows = list(SignalStreams(StringIO(serial_data)))
+    assert rows[1][1] is None and rows[2][0] is None
+    assert rows[2][1].tolist() == [7, 8]
+
+
+@pytest.mark.parametrize("encoding", ["utf-8", "bin"])
+@pytest.mark.parametrize("block_rows", [1, 3, 100])
+def test_round_trip(encoding: str, block_rows: int):
+    streams = SignalStreams(StringIO(serial_data))
+    metadata = streams.metadata["streams"]
+    expected = next(SignalStreams(StringIO(serial_data)).iter_blocks())
+    blocks = list(streams.iter_blocks(block_rows))
+    columns = [(m, iter([block[i] for block in blocks]))
+               for i, m in enumerate(metadata)]
+    if encoding == "bin":
+        data = BytesIO(b"".join(collect_blocks_into_frames(columns)))
+    else:
+        text = "".join(collect_blocks_into_string(columns))
+        assert text.split("Data:\n")[1] == serial_data.split("Data:\n")[1]
+        data = StringIO(text)
+    result = concatenate_blocks(list(SignalStreams(data).iter_blocks()))
+    _assert_columns_equal(result[0], expected[0])
+    _assert_columns_equal(result[1], expected[1])
+    assert np.array_equal(result[2], expected[2])
+
+
+def test_rows_with_absent_elements_are_written():
+    metadata = [{"name": "a", "type": float, "shape": [1], "rate": 2},
+                {"name": "b", "type": int, "shape": [1]}]
+    rows = [[np.array([1.]), np.array([1])], [None, np.array([2])]]
+    text = "".join(collect_stream_into_string(
+        [(metadata[0], iter([r[0] for r in rows])),
+         (metadata[1], iter([r[1] for r in rows]))]))
+    assert text.endswith("Data:\n1.0 | 1\n~ | 2\n")
+    assert "rate: 2" in text
+
+
+@pytest.mark.parametrize("lines, invalid_line", [
+    (["1 2 | | 3\n", "~ 1 | ~ | 3\n"], "~ 1 | ~ | 3\n"),
+    (["1 2 | | ~\n"], "1 2 | | ~\n"),
+    (["1 2 | ~5 | 3\n"], "1 2 | ~5 | 3\n"),
+])
+def test_invalid_empty_elements(lines: List[str], invalid_line: str):
+    streams = SignalStreams(StringIO(serial_data)).metadata["streams"]
+    with pytest.raises(ValueError) as e:
+        decoder_for(streams).decode(lines)
+    assert str(e.value) == \
+        f"Data line doesn't match the expected format: {invalid_line}"
+
+
+@pytest.mark.parametrize("rate", [0, -1., "fast", True])
+def test_invalid_rates(rate):
+    with pytest.raises(ValueError):
+        validate_metadata({"type": "float", "shape": [1], "rate": rate})
+
+
+def test_sparse_column_slicing():
+    column = SparseColumn(np.arange(3), [True, False, True, True, False])
+    assert column[1] is None and column[3] == 2
+    assert column[1:4].values.tolist() == [1, 2]
+    assert column[1:4].present.tolist() == [False, True, True]
+    assert column[::-2].values.tolist() == [1, 0]
+    with pytest.raises(ValueError):
+        SparseColumn(np.arange(2), [True])
+
+
+def test_merge_streams():
+    fast = {"name": "f", "type": float, "shape": [1], "rate": 4}
+    slow = {"name": "s", "type": int, "shape": [-1], "rate": 1.5}
+    fast_blocks = [np.arange(i, i + 5, dtype=float).reshape(-1, 1)
+                   for i in range(0, 20, 5)]
+    slow_blocks = [[np.arange(k) for k in range(4)], [np.arange(2)] * 3]
+    blocks = list(merge_streams([(fast, iter(fast_blocks)),
+                                 (slow, iter(slow_blocks))], block_rows=3))
+    assert all(len(block[0]) <= 3 for block in blocks)
+    merged = concatenate_blocks(blocks)
+    # the samples are at k / 4 and k / 1.5 seconds, both at 0, 2 and 4
+    times = np.union1d(np.arange(20) / 4, np.arange(7) / 1.5)
+    assert len(merged[0]) == len(np.unique(np.round(times, 9)))
+    assert np.array_equal(merged[0].values.ravel(), np.arange(20))
+    assert [len(v) for v in merged[1].values] == [0, 1, 2, 3, 2, 2, 2]
+    assert np.flatnonzero(merged[0].present & merged[1].present).size == 3
+
+
+def test_merge_needs_rates():
+    with pytest.raises(ValueError):
+        list(merge_streams([({"type": float, "shape": [1]}, iter([]))]))
+
+
+@pytest.mark.parametrize("method, fast, slow", [
+    ("linear", [0, 2, 4, 6, 8, 10, 12, 14, 16],
+     [0, .75, 1.5, 2.25, 3, 3.75, 4.5, 5.25, 6]),
+    # the last slow sample holds until the end of the fast stream
+    ("previous", [0, 2, 4, 6, 8, 10, 12, 14, 16, 18],
+     [0, 0, 1, 2, 3, 3, 4, 5, 6, 6]),
+    ("nearest", [0, 2, 4, 6, 8, 10, 12, 14, 16],
+     [0, 1, 2, 2, 3, 4, 5, 5, 6]),
+])
+@pytest.mark.parametrize("block_size", [1, 3, 20])
+def test_rate_aligner(method: str, fast: List[float], slow: List[float],
+                      block_size: int):
+    streams = [{"name": "f", "type": float, "shape": [1], "rate": 4},
+               {"name": "s", "type": int, "shape": [1], "rate": 1.5}]
+    fast_samples = np.arange(20.).reshape(-1, 1)
+    slow_samples = np.arange(7).reshape(-1, 1)
+    # the slow stream arrives in a single block, the fast one in pieces
+    blocks = [[fast_samples[i:i + block_size],
+               slow_samples if i == 0 else slow_samples[:0]]
+              for i in range(0, 20, block_size)]
+    aligner = RateAligner(streams, 2, method)
+    result = concatenate_blocks(list(aligner(blocks)))
+    assert np.array_equal(result[0].ravel(), fast)
+    assert np.allclose(result[1].ravel(), slow)
+    assert aligner.metadata[1]["rate"] == 2
+    assert aligner.metadata[1]["type"] == (float if method == "linear"
+                                           else int)
+
+
+def test_aligner_needs_rates():
+    with pytest.raises(ValueError):
+        RateAligner([{"name": "x", "type": float, "shape": [1]}], 1.)
+    with pytest.raises(ValueError):
+        RateAligner([{"name": "x", "type": float, "shape": [-1],
+                      "rate": 1}], 1., "linear")
+
+
+def test_operators_skip_absent_elements():
+    result = CliRunner().invoke(apply_transformation,
+                                ["-s", "0", "-s", "1", "digitize", "0.5"],
+                                input=serial_data)
+    assert result.exit_code == 0, result.output
+    assert result.stdout.endswith("Data:\n1, 2 |  | 0\n3, 4 | ~ | 1\n"
+                                  "~ | 14, 16 | 2\n5, 6 | ~ | 3\n")
+
+
+def test_align_command():
+    result = CliRunner().invoke(apply_transformation,
+                                ["-s", "0", "align", "2", "-m", "previous"],
+                                input=serial_data)
+    assert result.exit_code == 0, result.output
+    block = next(SignalStreams(StringIO(result.stdout)).iter_blocks())
+    assert np.array_equal(block[0].values, [[.5, 1.], [2.5, 3.]])
+
+    result = CliRunner().invoke(apply_transformation,
+                                ["-s", "2", "align", "2"],
+                                input=serial_data)
+    assert result.exit_code == 1
+    assert "has no rate" in result.output
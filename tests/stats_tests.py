@@ -0,0 +1,126 @@
+from pathlib import Path
+import numpy as np
+import pytest
+from signal_tools.rates import SparseColumn
+from signal_tools.stats import Histogram, Moments, QuantileSketch, \
+    StreamStatistics, block_statistics, file_statistics
+from signal_tools.stream_utils import collect_blocks_into_string
+
+
+def _split(values: np.ndarray, parts: int):
+    return np.array_split(values, parts)
+
+
+@pytest.mark.parametrize("parts", [1, 2, 17, 1000])
+def test_moments_of_blocks(parts: int):
+    values = np.random.randn(1000, 3) * [1., 10., 1000.] + [0., 5., 1e6]
+    moments = Moments(3)
+    for block in _split(values, parts):
+        moments.update(block)
+    assert moments.count == 1000
+    assert np.allclose(moments.mean, values.mean(axis=0))
+    assert np.allclose(moments.variance, values.var(axis=0))
+    assert np.array_equal(moments.minimum, values.min(axis=0))
+    assert np.array_equal(moments.maximum, values.max(axis=0))
+
+
+def test_merged_accumulators_equal_one_pass():
+    values = np.random.standard_cauchy((5000, 2))
+    whole = StreamStatistics({"type": float, "shape": [2]},
+                             histogram=(20, -5., 5.))
+    whole.update(values)
+    parts = [StreamStatistics({"type": float, "shape": [2]},
+                              histogram=(20, -5., 5.)) for _ in range(3)]
+    for part, block in zip(parts, _split(values, 3)):
+        part.update(block)
+    merged = parts[0]
+    merged.merge(parts[1])
+    merged.merge(parts[2])
+    assert np.allclose(merged.moments.mean, whole.moments.mean)
+    assert np.allclose(merged.moments.variance, whole.moments.variance)
+    assert np.array_equal(merged.histogram.counts, whole.histogram.counts)
+    assert merged.summary()["quantiles"] == whole.summary()["quantiles"]
+
+
+def test_histogram_matches_numpy():
+    values = np.random.randn(10000, 2)
+    histogram = Histogram(2, 16, -2., 2.)
+    for block in _split(values, 7):
+        histogram.update(block)
+    for element in range(2):
+        expected, _ = np.histogram(values[:, element], 16, (-2., 2.))
+        inside = (values[:, element] >= -2.) & (values[:, element] < 2.)
+        # numpy counts the upper end into the last bin
+        expected[-1] -= np.count_nonzero(values[:, element] == 2.)
+        assert np.array_equal(histogram.counts[element], expected)
+        assert histogram.underflow[element] + histogram.overflow[element] \
+            == np.count_nonzero(~inside)
+    with pytest.raises(ValueError):
+        histogram.merge(Histogram(2, 16, -2., 3.))
+
+
+@pytest.mark.parametrize("accuracy", [0.05, 0.01, 0.001])
+def test_quantiles_have_bounded_relative_error(accuracy: float):
+    values = np.concatenate((np.random.lognormal(0, 3, 20000),
+                             -np.random.lognormal(0, 2, 5000),
+                             np.zeros(1000)))
+    np.random.shuffle(values)
+    sketch = QuantileSketch(1, accuracy, max_buckets=1 << 16)
+    for block in _split(values.reshape(-1, 1), 13):
+        sketch.update(block)
+    quantiles = [0., 0.05, 0.2, 0.5, 0.9, 0.999, 1.]
+    estimates = sketch.quantiles(quantiles)[0]
+    exact = np.quantile(values, quantiles, method="lower")
+    assert np.all(np.abs(estimates - exact) <= accuracy * np.abs(exact)
+                  + 1e-300)
+
+
+def test_collapsed_buckets_keep_the_count():
+    sketch = QuantileSketch(1, 0.01, max_buckets=64)
+    values = np.logspace(-100, 100, 1000).reshape(-1, 1)
+    sketch.update(values)
+    assert sketch.positive.counts.shape == (1, 64)
+    assert sketch.positive.counts.sum() == 1000
+    # the high quantiles are still accurate
+    assert np.isclose(sketch.quantiles([1.])[0, 0], 1e100, rtol=0.01)
+
+
+def test_variable_length_and_sparse_streams():
+    variable = StreamStatistics({"name": "v", "type": int, "shape": [-1]})
+    variable.update([np.array([1, 2]), np.array([], dtype=int)])
+    variable.update([np.array([3])])
+    summary = variable.summary([0.5])
+    assert summary["count"] == 3
+    assert summary["mean"] == [2.]
+    assert summary["min"] == [1.] and summary["max"] == [3.]
+    sparse = StreamStatistics({"name": "r", "type": float, "shape": [1],
+                               "rate": 2.})
+    sparse.update(SparseColumn(np.array([[1.], [3.]]),
+                               np.array([True, False, True])))
+    assert sparse.summary()["mean"] == [2.]
+    empty = StreamStatistics({"name": "e", "type": float, "shape": [2]})
+    summary = empty.summary([0.5])
+    assert summary["count"] == 0
+    assert all(np.isnan(value) for value in summary["mean"])
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_file_statistics(tmp_path: Path, jobs: int):
+    streams = [{"name": "a", "type": float, "shape": [2]},
+               {"name": "b", "type": int, "shape": [1]}]
+    values = np.random.randn(20000, 2)
+    counter = np.arange(20000).reshape(-1, 1)
+    path = tmp_path / "stream.txt"
+    path.write_text("".join(collect_blocks_into_string(
+        [(streams[0], _split(values, 10)), (streams[1], _split(counter, 10))]
+    )))
+    result = file_statistics(path, [0, 1], jobs, histogram=(10, -1., 1.))
+    expected = block_statistics(streams, [0, 1], [[values, counter]],
+                                histogram=(10, -1., 1.))
+    for merged, direct in zip(result, expected):
+        assert merged.moments.count == direct.moments.count
+        assert np.allclose(merged.moments.mean, direct.moments.mean)
+        assert np.allclose(merged.moments.variance,
+                           direct.moments.variance)
+        assert np.array_equal(merged.histogram.counts,
+                              direct.histogram.counts)
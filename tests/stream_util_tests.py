@@ -1,8 +1,11 @@
+from typing import Any
 import numpy as np
 import pytest
 
 # Import the arrays_to_data_line function
-from signal_tools.stream_utils import arrays_to_data_line
+from signal_tools.stream_utils import arrays_to_data_line, align_blocks, \
+    collect_blocks_into_string, collect_stream_into_string, format_block, \
+    metadata_header, stream_type, validate_metadata
 
 
 @pytest.mark.parametrize(
@@ -28,3 +31,88 @@ from signal_tools.stream_utils import arrays_to_data_line
 )
 def test_arrays_to_data_line(arrays, expected_data_line):
     assert arrays_to_data_line(arrays) == expected_data_line
+
+
+def _legacy_data_line(metadata, row):
+    """
+    The data line as it was formatted element by element
+    """
+    return " | ".join(
+        ", ".join(str(x) for x in np.array(
+            entry, dtype=m["type"]).flatten(order="F"))
+        for m, entry in zip(metadata, row)) + "\n"
+
+
+@pytest.fixture
+def mixed_streams():
+    rng = np.random.default_rng(3)
+    rows = 50
+    metadata = [{"name": "scalar", "type": float, "shape": [1]},
+                {"name": "vector", "type": int, "shape": [3]},
+                {"name": "matrix", "type": float, "shape": [2, 3]},
+                {"name": "variable", "type": float, "shape": [-1]}]
+    block = [rng.standard_normal((rows, 1)) * 1e10,
+             rng.integers(-1000, 1000, (rows, 3)),
+             rng.standard_normal((rows, 2, 3)) * 1e-9,
+             [rng.standard_normal(n) for n in rng.integers(0, 4, rows)]]
+    return metadata, block
+
+
+def test_format_block_matches_data_line(mixed_streams):
+    _, block = mixed_streams
+    expected = "".join(arrays_to_data_line(list(row)) + "\n"
+                       for row in zip(*block))
+    assert format_block(block, separator=" ") == expected
+
+
+@pytest.mark.parametrize("block_sizes", [[50], [7, 43], [1] * 50])
+def test_collect_blocks_into_string(mixed_streams, block_sizes):
+    metadata, block = mixed_streams
+    bounds = np.cumsum([0] + block_sizes)
+    # every stream is cut into blocks at different positions
+    streams = []
+    for i, (m, column) in enumerate(zip(metadata, block)):
+        cuts = np.unique(np.clip(bounds[1:-1] + 3 * (i % 2), 1, 49))
+        streams.append((m, [column[a:b] for a, b in
+                            zip([0, *cuts], [*cuts, len(column)])]))
+    expected = metadata_header(metadata) + "".join(
+        _legacy_data_line(metadata, row) for row in zip(*block))
+    assert "".join(collect_blocks_into_string(streams)) == expected
+    rows = [(m, iter(column)) for m, column in zip(metadata, block)]
+    assert "".join(collect_stream_into_string(rows, rows_per_block=16)) \
+        == expected
+
+
+def test_align_blocks_ends_with_shortest_stream():
+    blocks = list(align_blocks([[np.arange(3), np.arange(3, 5)],
+                                [np.arange(4)]]))
+    assert [len(b[0]) for b in blocks] == [3, 1]
+    assert np.array_equal(blocks[1][0], [3])
+
+
+@pytest.mark.parametrize("name, expected, header_name", [
+    ("int", int, "int"),
+    ("int64", int, "int"),
+    ("float64", float, "float"),
+    ("int16", np.dtype("int16"), "int16"),
+    ("uint8", np.dtype("uint8"), "uint8"),
+    ("float32", np.dtype("float32"), "float32"),
+])
+def test_validate_metadata_types(name: str, expected: Any, header_name: str):
+    metadata = {"name": "x", "type": name, "shape": [1]}
+    validate_metadata(metadata)
+    assert metadata["type"] == expected
+    assert type(metadata["type"]) is type(expected)
+    assert f"type: {header_name}\n" in metadata_header([metadata])
+
+
+@pytest.mark.parametrize("name", ["float16", "complex", "str", int])
+def test_validate_metadata_invalid_types(name: Any):
+    with pytest.raises(ValueError, match="type must be one of"):
+        validate_metadata({"name": "x", "type": name, "shape": [1]})
+
+
+def test_stream_type_of_unsupported_dtype():
+    assert stream_type(np.dtype(bool)) is int
+    with pytest.raises(ValueError):
+        stream_type(np.float16)
@@ -0,0 +1,412 @@
+"""
+Performance benchmarks of the signal tools
+
+Generates synthetic stream files with streams of different shapes and
+measures the throughput (rows/s and MB/s) and the peak memory of parsing,
+serializing, CSV import, the filters and the generators. The results are
+written to a JSON file, and two result files, e.g. of two commits, can be
+compared with --compare:
+
+    python tools/benchmark.py -o before.json
+    git checkout <other commit>
+    python tools/benchmark.py -o after.json --compare before.json
+"""
+import argparse
+import io
+import json
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from itertools import islice
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+import numpy as np
+from signal_tools.binary_format import collect_blocks_into_frames
+from signal_tools.filter import BlockFilter, GHFilter, Resampler, \
+    TrapezoidFilter, g_h_filter, trapezoid_filter
+from signal_tools.generators import poisson_pulse_gen, random_chunks, \
+    rngen, sine_chunks
+from signal_tools.graph import Expression
+from signal_tools.io_utils import read_csv_blocks
+from signal_tools.parallel import ParallelFileReader
+from signal_tools.operators import Digitize
+from signal_tools.parsers import SignalStreams
+from signal_tools.stream_utils import collect_blocks_into_string, \
+    collect_stream_into_string
+
+# the stream layouts of the synthetic files, name -> list of (type, shape)
+LAYOUTS = {
+    "scalar": [(float, [1])],
+    "vector": [(float, [8])],
+    "matrix": [(float, [4, 4])],
+    "variable": [(float, [-1])],
+    "mixed": [(float, [1]), (int, [3]), (float, [2, 2]), (float, [-1])],
+    "wide": [(float, [64])],
+}
+
+
+@dataclass
+class Case:
+    """
+    A single measurement, `run` does the work that is timed
+    """
+    name: str
+    layout: str
+    rows: int
+    run: Callable[[], Any]
+    # bytes of text or binary data that are read or written by `run`
+    nbytes: int = 0
+
+
+def synthetic_blocks(layout: str, rows: int, block_rows: int = 4096,
+                     seed: int = 0) -> List[List[Any]]:
+    """
+    Random blocks of <rows> rows in total for the streams of a layout
+    """
+    rng = np.random.default_rng(seed)
+    blocks = []
+    for start in range(0, rows, block_rows):
+        n = min(block_rows, rows - start)
+        block = []
+        for dtype, shape in LAYOUTS[layout]:
+            if shape[0] == -1:
+                block.append([rng.standard_normal(k)
+                              for k in rng.integers(0, 9, n)])
+            elif dtype is int:
+                block.append(rng.integers(-10000, 10000, (n, *shape)))
+            else:
+                block.append(rng.standard_normal((n, *shape)))
+        blocks.append(block)
+    return blocks
+
+
+def layout_metadata(layout: str) -> List[Dict[str, Any]]:
+    return [{"name": f"s{i}", "type": dtype, "shape": list(shape)}
+            for i, (dtype, shape) in enumerate(LAYOUTS[layout])]
+
+
+def _stream_columns(metadata: List[Dict[str, Any]],
+                    blocks: List[List[Any]]) -> list:
+    return [(m, [block[i] for block in blocks])
+            for i, m in enumerate(metadata)]
+
+
+def write_stream_file(path: Path, layout: str, rows: int,
+                      encoding: str) -> int:
+    """
+    Write a synthetic stream file and return its size in bytes
+    """
+    metadata = layout_metadata(layout)
+    streams = _stream_columns(metadata, synthetic_blocks(layout, rows))
+    if encoding == "bin":
+        with open(path, "wb") as f:
+            for chunk in collect_blocks_into_frames(streams):
+                f.write(chunk)
+    else:
+        with open(path, "w") as f:
+            for chunk in collect_blocks_into_string(streams):
+                f.write(chunk)
+    return path.stat().st_size
+
+
+def _consume(iterator) -> None:
+    for _ in iterator:
+        pass
+
+
+def parse_cases(workdir: Path, rows: int) -> List[Case]:
+    cases = []
+    for layout in LAYOUTS:
+        for encoding in ("utf-8", "bin"):
+            path = workdir / f"{layout}.{encoding}.stream"
+            size = write_stream_file(path, layout, rows, encoding)
+
+            def run(path=path):
+                with open(path, "rb") as f:
+                    _consume(SignalStreams(f).iter_blocks(4096))
+            cases.append(Case(f"parse_blocks[{encoding}]", layout, rows, run,
+                              size))
+
+            def run_parallel(path=path):
+                _consume(ParallelFileReader(path).iter_blocks())
+            cases.append(Case(f"parse_parallel[{encoding}]", layout, rows,
+                              run_parallel, size))
+        # the row interface of the parser, on the text file
+        path = workdir / f"{layout}.utf-8.stream"
+        row_count = min(rows, 20000)
+
+        def run_rows(path=path, row_count=row_count):
+            with open(path, "rb") as f:
+                _consume(islice(SignalStreams(f), row_count))
+        cases.append(Case("parse_rows[utf-8]", layout, row_count, run_rows,
+                          path.stat().st_size * row_count // rows))
+    return cases
+
+
+def serialize_cases(workdir: Path, rows: int) -> List[Case]:
+    cases = []
+    for layout in LAYOUTS:
+        metadata = layout_metadata(layout)
+        blocks = synthetic_blocks(layout, rows)
+        streams = _stream_columns(metadata, blocks)
+        text_size = sum(len(s) for s in collect_blocks_into_string(streams))
+        bin_size = sum(len(s) for s in collect_blocks_into_frames(streams))
+
+        def run_text(streams=streams):
+            out = io.StringIO()
+            for chunk in collect_blocks_into_string(streams):
+                out.write(chunk)
+
+        def run_bin(streams=streams):
+            out = io.BytesIO()
+            for chunk in collect_blocks_into_frames(streams):
+                out.write(chunk)
+
+        row_count = min(rows, 20000)
+        row_streams = _stream_columns(metadata, blocks)
+
+        def run_rows(row_streams=row_streams, row_count=row_count):
+            rows_in = [(m, islice((r for c in columns for r in c), row_count))
+                       for m, columns in row_streams]
+            _consume(collect_stream_into_string(rows_in))
+
+        cases += [Case("serialize_blocks[utf-8]", layout, rows, run_text,
+                       text_size),
+                  Case("serialize_blocks[bin]", layout, rows, run_bin,
+                       bin_size),
+                  Case("serialize_rows[utf-8]", layout, row_count, run_rows,
+                       text_size * row_count // rows)]
+    return cases
+
+
+def csv_cases(workdir: Path, rows: int) -> List[Case]:
+    cases = []
+    for columns in (1, 4, 16):
+        path = workdir / f"columns{columns}.csv"
+        rng = np.random.default_rng(columns)
+        data = rng.standard_normal((rows, columns))
+        np.savetxt(path, data, delimiter=",", header=",".join(
+            f"c{i}" for i in range(columns)), comments="")
+
+        def run(path=path, columns=columns):
+            with open(path) as f:
+                f.readline()
+                _consume(read_csv_blocks(f, ",", list(range(columns)),
+                                         [float] * columns))
+        cases.append(Case("csv_import", f"columns{columns}", rows, run,
+                          path.stat().st_size))
+    return cases
+
+
+def filter_cases(workdir: Path, rows: int) -> List[Case]:
+    rng = np.random.default_rng(7)
+    cases = []
+    fir_taps = rng.standard_normal(2048)
+    for channels in (1, 8):
+        block = rng.standard_normal((rows, channels))
+        blocks = [block[i:i + 4096] for i in range(0, rows, 4096)]
+        layout = f"channels{channels}"
+
+        def run_trapezoid(blocks=blocks):
+            f = TrapezoidFilter(10, 20, 0.01)
+            for b in blocks:
+                f(b)
+
+        def run_gh(blocks=blocks):
+            f = GHFilter(0.4, 0.2)
+            for b in blocks:
+                f(b)
+
+        def run_chain(blocks=blocks, channels=channels):
+            operator = Expression({"name": "x", "type": float,
+                                   "shape": [channels]}) \
+                .scale(2.).offset(0.5).clip(-3., 3.).digitize(0.01) \
+                .compile()
+            for b in blocks:
+                operator(b)
+
+        def run_operators(blocks=blocks):
+            digitize = Digitize(0.01)
+            for b in blocks:
+                digitize(np.clip(b * 2. + 0.5, -3., 3.))
+
+        def run_fir(blocks=blocks):
+            block_filter = BlockFilter(fir_taps)
+            for b in blocks:
+                block_filter(b)
+
+        def run_fir_direct(blocks=blocks):
+            block_filter = BlockFilter(fir_taps, fft_threshold=len(fir_taps))
+            for b in blocks:
+                block_filter(b)
+
+        def run_decimate(blocks=blocks):
+            resampler = Resampler(1, 10)
+            for b in blocks:
+                resampler(b)
+            resampler.flush()
+        cases += [Case("trapezoid_block", layout, rows, run_trapezoid,
+                       block.nbytes),
+                  Case("g_h_block", layout, rows, run_gh, block.nbytes),
+                  Case("chain_fused", layout, rows, run_chain, block.nbytes),
+                  Case("chain_operators", layout, rows, run_operators,
+                       block.nbytes),
+                  Case("decimate_10", layout, rows, run_decimate,
+                       block.nbytes),
+                  Case("fir2048_fft", layout, rows, run_fir, block.nbytes),
+                  Case("fir2048_direct", layout, rows, run_fir_direct,
+                       block.nbytes)]
+    samples = rng.standard_normal(min(rows, 20000))
+    cases += [Case("trapezoid_rows", "channels1", len(samples),
+                   lambda: _consume(trapezoid_filter(10, 20, 0.01, samples)),
+                   samples.nbytes),
+              Case("g_h_rows", "channels1", len(samples),
+                   lambda: _consume(g_h_filter(samples, 0., 0., 0.2, 0.4,
+                                               1.)),
+                   samples.nbytes)]
+    return cases
+
+
+def generator_cases(workdir: Path, rows: int) -> List[Case]:
+    return [
+        Case("poisson_pulses", "rate0.01", rows,
+             lambda: _consume(poisson_pulse_gen(0.01, 50., "normal",
+                                                (1., 0.1), 4096, rows,
+                                                seed=1)),
+             rows * 8),
+        Case("poisson_pulses", "rate0.5", rows,
+             lambda: _consume(poisson_pulse_gen(0.5, 50., "normal",
+                                                (1., 0.1), 4096, rows,
+                                                seed=1)),
+             rows * 8),
+        Case("rngen", "vector", rows,
+             lambda: _consume(rngen((8,), (0, 1), 4096, rows)),
+             rows * 8 * 8),
+        Case("random_chunks", "vector", rows,
+             lambda: _consume(random_chunks("normal", (0., 1.), (8,), 4096,
+                                            rows, seed=1)),
+             rows * 8 * 8),
+        Case("sine_chunks", "noise", rows,
+             lambda: _consume(sine_chunks(1., 100., 0., 0.1, 4096, rows,
+                                          seed=1)),
+             rows * 8),
+    ]
+
+
+BENCHMARKS = {
+    "parse": parse_cases,
+    "serialize": serialize_cases,
+    "csv": csv_cases,
+    "filter": filter_cases,
+    "generator": generator_cases,
+}
+
+
+def measure(case: Case, repeat: int) -> Dict[str, Any]:
+    """
+    Time the case, the best of <repeat> runs is reported. The peak memory
+    is measured in a separate run, as tracing slows down the allocations.
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        case.run()
+        times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        case.run()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    best = min(times)
+    return {"benchmark": case.name,
+            "layout": case.layout,
+            "rows": case.rows,
+            "bytes": case.nbytes,
+            "seconds": best,
+            "rows_per_s": case.rows / best if best > 0 else None,
+            "mb_per_s": case.nbytes / 1e6 / best if best > 0 else None,
+            "peak_memory_bytes": peak}
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+            check=True, cwd=Path(__file__).parent).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any]) -> str:
+    """
+    Table of the throughput of every benchmark relative to the baseline
+    """
+    def key(r):
+        return (r["benchmark"], r["layout"])
+    old = {key(r): r for r in baseline["results"]}
+    lines = [f"{'benchmark':<28} {'layout':<12} {'rows/s':>12} "
+             f"{'baseline':>12} {'speedup':>8} {'peak MB':>8}"]
+    for r in results["results"]:
+        base = old.get(key(r))
+        speedup = ""
+        base_rate = ""
+        if base and base["rows_per_s"] and r["rows_per_s"]:
+            # normalize by rows, the row counts of the runs may differ
+            speedup = f"{r['rows_per_s'] / base['rows_per_s']:.2f}x"
+            base_rate = f"{base['rows_per_s']:.0f}"
+        rate = f"{r['rows_per_s']:.0f}" if r["rows_per_s"] else ""
+        lines.append(f"{r['benchmark']:<28} {r['layout']:<12} {rate:>12} "
+                     f"{base_rate:>12} {speedup:>8} "
+                     f"{r['peak_memory_bytes'] / 1e6:>8.1f}")
+    return "\n".join(lines)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("-o", "--output", default="bench_output.json",
+                        help="The JSON file the results are written to")
+    parser.add_argument("-n", "--rows", type=int, default=100000,
+                        help="Number of rows of the synthetic data")
+    parser.add_argument("-r", "--repeat", type=int, default=3,
+                        help="Number of timed runs of every benchmark")
+    parser.add_argument("-b", "--benchmark", action="append",
+                        choices=sorted(BENCHMARKS),
+                        help="Only run the given benchmark group, may be "
+                             "given multiple times")
+    parser.add_argument("-c", "--compare", default=None,
+                        help="A previous result file to compare against")
+    args = parser.parse_args(argv)
+
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for group in args.benchmark or BENCHMARKS:
+            for case in BENCHMARKS[group](Path(workdir), args.rows):
+                result = measure(case, args.repeat)
+                result["group"] = group
+                results.append(result)
+                print(f"{case.name:<28} {case.layout:<12} "
+                      f"{result['rows_per_s']:>12.0f} rows/s "
+                      f"{result['mb_per_s']:>8.2f} MB/s", file=sys.stderr)
+    report = {"commit": _git_commit(),
+              "date": datetime.now(timezone.utc).isoformat(),
+              "python": platform.python_version(),
+              "numpy": np.__version__,
+              "machine": platform.machine(),
+              "rows": args.rows,
+              "repeat": args.repeat,
+              "results": results}
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    if args.compare is not None:
+        with open(args.compare) as f:
+            print(compare(report, json.load(f)))
+
+
+if __name__ == "__main__":
+    main()